@@ -1,32 +1,95 @@
 import dash_bootstrap_components as dbc
-from dash import html, dcc, callback, Input, Output
-from helper import get_recent_alerts  # reuse existing helper
+from dash import html, dcc, callback, ctx, Input, Output, State
+from alerts_store import get_alert_store, RULES
+from log_cache import log_cache
+
+PAGE_SIZE = 20
 
 def layout():
-    alerts = get_recent_alerts(limit=20)
     return dbc.Container(
         [
             html.H4("Alerts"),
-            dbc.ListGroup(
+            dbc.Row(
+                [
+                    dbc.Col(dcc.Dropdown(
+                        id="alerts-rule",
+                        options=[{"label": title, "value": rule} for rule, (title, _) in RULES.items()],
+                        placeholder="All alert types",
+                    ), md=4),
+                    dbc.Col(dcc.Dropdown(
+                        id="alerts-sort",
+                        options=[
+                            {"label": "Most recently seen", "value": "last_seen"},
+                            {"label": "Most recently started", "value": "first_seen"},
+                        ],
+                        value="last_seen",
+                        clearable=False,
+                    ), md=4),
+                ],
+                className="gy-2 mb-3",
+            ),
+            html.Div(id="alerts-list"),
+            dbc.ButtonGroup(
                 [
-                    dbc.ListGroupItem(
-                        [
-                            html.I(className=f"{a['icon']} me-2 text-danger"),
-                            html.Strong(a["title"]),
-                            html.Br(),
-                            html.Span(a["body"], className="text-muted small"),
-                            html.Span(a["ts"], className="float-end text-muted small"),
-                        ]
-                    )
-                    for a in alerts
-                ]
+                    dbc.Button("Previous", id="alerts-prev", outline=True, color="secondary", size="sm"),
+                    dbc.Button("Next", id="alerts-next", outline=True, color="secondary", size="sm"),
+                ],
+                className="mt-3",
             ),
+            # cursors of the pages visited so far (the last one is on screen) and of the next page
+            dcc.Store(id="alerts-cursors", data={"pages": [None], "next": None}),
         ],
         fluid=True,
         className="pt-3",
     )
 
-# page-specific callbacks can live down here
-# @callback(...)
-# def alert_filter(...):
-#     ...
+
+def alert_item(a: dict):
+    seen = f"{a['count']}× since {a['first_seen'][:16]}" if a["count"] > 1 else a["first_seen"][:16]
+    return dbc.ListGroupItem(
+        [
+            html.I(className=f"{a['icon']} me-2 text-danger"),
+            html.Strong(a["title"]),
+            html.Br(),
+            html.Span(a["body"], className="text-muted small"),
+            html.Span(a["ts"], className="float-end text-muted small"),
+            html.Br(),
+            html.Span(seen, className="text-muted small"),
+        ]
+    )
+
+
+@callback(
+    Output("alerts-list", "children"),
+    Output("alerts-cursors", "data"),
+    Output("alerts-prev", "disabled"),
+    Output("alerts-next", "disabled"),
+    Input("alerts-rule", "value"),
+    Input("alerts-sort", "value"),
+    Input("alerts-prev", "n_clicks"),
+    Input("alerts-next", "n_clicks"),
+    State("alerts-cursors", "data"),
+    State("settings-store", "data"),
+)
+def show_alerts(rule, sort, _prev, _next, cursors, settings):
+    vpn_mode = settings.get("vpn_mode", False) if settings else False
+    allowed_country = settings.get("country", "Taiwan") if settings else "Taiwan"
+
+    pages = (cursors or {}).get("pages") or [None]
+    if ctx.triggered_id == "alerts-next" and cursors.get("next"):
+        pages = pages + [cursors["next"]]
+    elif ctx.triggered_id == "alerts-prev" and len(pages) > 1:
+        pages = pages[:-1]
+    elif ctx.triggered_id in ("alerts-rule", "alerts-sort"):
+        pages = [None]
+
+    # the store is fed by log cache refreshes: pull new rows first (a no-op within the TTL)
+    log_cache.get()
+
+    # keyset paging: page 50 is one indexed range scan, same as page 1
+    alerts, next_cursor = get_alert_store().page(
+        cursor=pages[-1], limit=PAGE_SIZE, rule=rule, sort=sort or "last_seen",
+        vpn_mode=vpn_mode, allowed_country=allowed_country,
+    )
+    items = [alert_item(a) for a in alerts] or [dbc.ListGroupItem("No alerts.", className="text-muted")]
+    return dbc.ListGroup(items), {"pages": pages, "next": next_cursor}, len(pages) == 1, next_cursor is None
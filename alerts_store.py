@@ -0,0 +1,370 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from geoip import lookup_countries, UNKNOWN
+from impossible_travel import TravelTracker
+from parallel_detect import DETECT_WORKERS, PARALLEL_MIN_ROWS, replay_fired
+from rules import RULES_BY_NAME, WINDOW_RULES, fired_in_window, streaming_rules
+from sliding_window import SlidingWindowDetector
+from storage import DATA_DIR, get_backend, unread
+
+# Where detected alerts are kept ("" keeps them in memory, e.g. for scripts)
+ALERTS_DB = os.getenv("AUTHWATCH_ALERTS_DB", os.path.join(DATA_DIR, "alerts.sqlite3"))
+# The windowed rules are checked at least this often in event time while history is replayed
+RECORD_EVERY = pd.Timedelta(minutes=5)
+# windowed rules (and their thresholds) live in rules.py, shared with the dashboard
+STREAM_RULES = streaming_rules(WINDOW_RULES)
+
+# rule -> (title, icon)
+RULES = {
+    "failed_logins": ("Multiple Failed Login Attempts", "bi bi-shield-lock-fill"),
+    "account_failed_logins": ("Repeated Failed Logins for User", "bi bi-person-lock"),
+    "foreign_country": ("Suspicious Country Login", "bi bi-exclamation-triangle-fill"),
+    "credential_stuffing": ("Credential Stuffing Suspected", "bi bi-person-x-fill"),
+    "impossible_travel": ("Impossible Travel", "bi bi-airplane-fill"),
+}
+# rule -> severity; when alerts compete for space, higher goes first
+SEVERITY = {
+    "credential_stuffing": 3, "impossible_travel": 3,
+    "failed_logins": 2, "account_failed_logins": 2,
+    "foreign_country": 1,
+}
+SORTS = ["last_seen", "first_seen"]
+
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"   # fixed width, so text order is time order
+
+_SCHEMA = """
+create table if not exists alerts (
+    id text primary key,
+    rule text not null,
+    key text not null,
+    country text,
+    count integer not null,
+    first_seen text not null,
+    last_seen text not null,
+    detail text
+);
+create index if not exists alerts_last_seen on alerts (last_seen, id);
+create index if not exists alerts_first_seen on alerts (first_seen, id);
+create index if not exists alerts_rule_last_seen on alerts (rule, last_seen, id);
+create table if not exists meta (name text primary key, value text);
+"""
+
+
+def alert_id(rule: str, key) -> str:
+    """Stable id: the same rule firing for the same key is always the same alert."""
+    return hashlib.sha1(f"{rule}|{key}".encode()).hexdigest()[:16]
+
+
+def _ts(value) -> str:
+    ts = pd.Timestamp(value)
+    ts = ts.tz_convert("UTC") if ts.tzinfo else ts.tz_localize("UTC")
+    return ts.strftime(_TS_FORMAT)
+
+
+def _encode_cursor(value: str, id_: str) -> str:
+    return base64.urlsafe_b64encode(f"{value}|{id_}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    value, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+    return value, id_
+
+
+class AlertStore:
+    """
+    Detected alerts, materialized in SQLite with one row per (rule, key).
+
+    Rows keep a count plus first/last seen, and are indexed by time and rule,
+    so the Alerts page pages through them with keyset cursors: any page costs
+    the same as the first one. Country and travel alerts are stored for every
+    resolved country and narrowed by the viewer's VPN / country settings when
+    read.
+    """
+
+    def __init__(self, path: str = ALERTS_DB):
+        self.path = path or ":memory:"
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory = sqlite3.connect(":memory:", check_same_thread=False) if self.path == ":memory:" else None
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+            # stores created before impossible-travel alerts lack the detail column
+            if "detail" not in [row[1] for row in db.execute("pragma table_info(alerts)")]:
+                db.execute("alter table alerts add column detail text")
+
+    @contextmanager
+    def _connect(self):
+        """A connection inside one transaction (committed on success)."""
+        db = self._memory or sqlite3.connect(self.path, timeout=30)
+        try:
+            if db is not self._memory:
+                db.execute("pragma journal_mode=wal")
+            with db:
+                yield db
+        finally:
+            if db is not self._memory:
+                db.close()
+
+    ###########################################################################
+    # Writing
+    ###########################################################################
+    def ingest(self, rows: pd.DataFrame, detector: SlidingWindowDetector,
+               travel: TravelTracker | None = None, keys: pd.Series | None = None,
+               cursor: dict | None = None, history=None) -> None:
+        """
+        Feed new login rows to `detector` (and `travel`) and record what fires.
+
+        `keys` are the rows' storage insert keys (see fetch_new_logs). Rows
+        whose key is recorded already (by an earlier run or another worker)
+        only update the detectors. Rows without keys (a snapshot or another
+        worker's frame, read up to storage `cursor`) are only recorded by a
+        store that has recorded nothing yet. New rows older than the
+        detector's window (backfills) are replayed on a detector of their
+        own, along with `history(start, end)`: the rows already loaded
+        around them.
+        """
+        if rows.empty:
+            return
+        ts = pd.to_datetime(rows["timestamp"], utc=True)
+        with self._lock, self._connect() as db:
+            # other workers may be ingesting the same rows: take the write lock before reading what's recorded
+            db.execute("begin immediate")
+            recorded = self._meta(db, "recorded_keys")
+            recorded = json.loads(recorded) if recorded else None
+            mark = self._meta(db, "recorded_until")
+            if keys is None:
+                # a new (or deleted) store starts from whatever rows are loaded
+                fresh = pd.Series(recorded is None and mark is None and cursor is not None, index=rows.index)
+            else:
+                keys = keys.tolist()
+                fresh = pd.Series(unread(recorded, keys), index=rows.index)
+                if recorded is None and mark:
+                    # stores from before insert keys went by event time
+                    fresh &= ts > pd.Timestamp(mark, tz="UTC")
+
+            detector.add_batch(rows[~fresh])
+            if travel is not None:
+                travel.add_batch(rows[~fresh])
+            if fresh.any():
+                cutoff = detector.watermark - detector.window if detector.watermark is not None else None
+                late = fresh & (ts <= cutoff) if cutoff is not None else pd.Series(False, index=rows.index)
+                if late.any():
+                    self._record_backfill(db, rows, ts, late, detector.window, history)
+                live = fresh & ~late
+                if live.any():
+                    self._replay(db, rows[live], ts[live], detector)
+                self._record_countries(db, rows[fresh], ts[fresh])
+                if travel is not None:
+                    self._record_travel(db, travel.add_batch(rows[fresh]))
+            if keys is not None:
+                recorded = get_backend().advance_cursor(recorded, keys)
+            elif fresh.any():
+                recorded = cursor
+            else:
+                return
+            db.execute("delete from meta where name = 'recorded_until'")
+            db.execute(
+                "insert into meta values ('recorded_keys', ?) on conflict(name) do update set value = excluded.value",
+                (json.dumps(recorded),),
+            )
+
+    @staticmethod
+    def _meta(db: sqlite3.Connection, name: str) -> str | None:
+        row = db.execute("select value from meta where name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _replay(self, db: sqlite3.Connection, rows: pd.DataFrame, ts: pd.Series,
+                detector: SlidingWindowDetector) -> None:
+        """Feed `rows` to `detector`, recording what the windowed rules fire along the way."""
+        if DETECT_WORKERS > 1 and len(rows) >= PARALLEL_MIN_ROWS:
+            # big replays (first load, bulk backfills) are split by rule key across processes
+            ends = rows["timestamp"].groupby(ts.dt.floor(RECORD_EVERY)).max()
+            fired = replay_fired(rows, ends, STREAM_RULES, context=detector.pending(), window=detector.window)
+            # the workers did the replay; the detector only needs to end up holding the last window
+            detector.add_batch(rows[ts > ts.max() - detector.window])
+            self._upsert_fired(db, fired)
+        else:
+            for _ in detector.replay(rows, RECORD_EVERY):
+                self._record_window(db, detector)
+
+    def _record_backfill(self, db: sqlite3.Connection, rows: pd.DataFrame, ts: pd.Series, late: pd.Series,
+                         window: pd.Timedelta, history) -> None:
+        """
+        Replay rows that arrived after the live detector's window moved past
+        them, together with everything within a window of them, so they
+        fire the same alerts as if they had come in on time.
+        """
+        start, end = ts[late].min() - window, ts[late].max() + window
+        around = (ts > start) & (ts <= end)
+        columns = ["timestamp", "ip_address", "uid", "login_result"]
+        frames = [rows.loc[around, columns]]
+        if history is not None:
+            frames.append(history(start, end)[columns])
+        frames = [frame for frame in frames if not frame.empty]
+        # categoricals with different categories concatenate as object, which the detector doesn't mind
+        frame = pd.concat(frames, ignore_index=True).sort_values("timestamp", kind="stable", ignore_index=True)
+        # windows that had fired already are upserted to the same peak, only the backfilled rows add anything
+        self._replay(db, frame, pd.to_datetime(frame["timestamp"], utc=True), SlidingWindowDetector(window))
+
+    def _record_window(self, db: sqlite3.Connection, detector: SlidingWindowDetector) -> None:
+        now = detector.watermark
+        fired = {key: (n, now, now) for key, n in fired_in_window(detector, STREAM_RULES).items()}
+        self._upsert_fired(db, fired)
+
+    def _upsert_fired(self, db: sqlite3.Connection, fired: dict) -> None:
+        """{(rule, key): (peak count, first seen, last seen)} from the windowed rules."""
+        # the window moves, so a re-fire keeps the peak count rather than adding up
+        db.executemany(
+            """
+            insert into alerts (id, rule, key, count, first_seen, last_seen) values (?, ?, ?, ?, ?, ?)
+            on conflict(id) do update set
+                count = max(count, excluded.count),
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen)
+            """,
+            [
+                (alert_id(rule, key), rule, str(key), int(n), _ts(first), _ts(last))
+                for (rule, key), (n, first, last) in fired.items()
+            ],
+        )
+
+    def _record_countries(self, db: sqlite3.Connection, rows: pd.DataFrame, ts: pd.Series) -> None:
+        per_ip = pd.DataFrame({"ip": rows["ip_address"].astype(object), "ts": ts}).groupby("ip")["ts"].agg(
+            ["count", "min", "max"]
+        )
+        countries = lookup_countries(per_ip.index)
+        known = countries != UNKNOWN
+        db.executemany(
+            """
+            insert into alerts (id, rule, key, country, count, first_seen, last_seen)
+            values (?, 'foreign_country', ?, ?, ?, ?, ?)
+            on conflict(id) do update set
+                count = count + excluded.count,
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen)
+            """,
+            [
+                (alert_id("foreign_country", ip), ip, country, int(n), _ts(first), _ts(last))
+                for ip, country, n, first, last in zip(
+                    per_ip.index[known], countries[known], per_ip["count"][known],
+                    per_ip["min"][known], per_ip["max"][known],
+                )
+            ],
+        )
+
+    def _record_travel(self, db: sqlite3.Connection, flags: pd.DataFrame) -> None:
+        """One alert per user; `detail` keeps the user's latest impossible hop."""
+        if flags.empty:
+            return
+        flags = flags.sort_values("to_ts", kind="stable")
+        per_uid = flags.groupby("uid").agg(
+            hops=("to_ts", "size"), first_seen=("to_ts", "min"), last_seen=("to_ts", "max"),
+            from_country=("from_country", "last"), to_country=("to_country", "last"),
+            distance_km=("distance_km", "last"), from_ts=("from_ts", "last"),
+        )
+        per_uid["minutes"] = (per_uid["last_seen"] - per_uid["from_ts"]).dt.total_seconds() / 60
+        db.executemany(
+            """
+            insert into alerts (id, rule, key, country, count, first_seen, last_seen, detail)
+            values (?, 'impossible_travel', ?, ?, ?, ?, ?, ?)
+            on conflict(id) do update set
+                count = count + excluded.count,
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen),
+                country = case when excluded.last_seen >= last_seen then excluded.country else country end,
+                detail = case when excluded.last_seen >= last_seen then excluded.detail else detail end
+            """,
+            [
+                (alert_id("impossible_travel", row.Index), str(row.Index), row.to_country, int(row.hops),
+                 _ts(row.first_seen), _ts(row.last_seen),
+                 f"{row.from_country} → {row.to_country}, {row.distance_km:,.0f} km in {row.minutes:.0f} min")
+                for row in per_uid.itertuples()
+            ],
+        )
+
+    ###########################################################################
+    # Reading
+    ###########################################################################
+    def page(self, cursor: str | None = None, limit: int = 20, rule: str | None = None,
+             sort: str = "last_seen", vpn_mode: bool = False, allowed_country: str = "Taiwan") -> tuple[list[dict], str | None]:
+        """
+        One page of alerts, newest `sort` first, and the cursor of the next page
+        (None on the last one). Country alerts follow the viewer's settings:
+        none in VPN mode, otherwise only countries other than `allowed_country`.
+        Travel alerts are hidden in VPN mode too (a VPN hop looks like a flight).
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort {sort!r} (expected one of {SORTS})")
+        where = [
+            "(rule != 'foreign_country' or (? = 0 and country != ?))",
+            "(rule != 'impossible_travel' or ? = 0)",
+        ]
+        params: list = [int(bool(vpn_mode)), allowed_country, int(bool(vpn_mode))]
+        if rule:
+            where.append("rule = ?")
+            params.append(rule)
+        if cursor:
+            where.append(f"({sort}, id) < (?, ?)")
+            params.extend(_decode_cursor(cursor))
+
+        sql = (
+            f"select id, rule, key, country, count, first_seen, last_seen, detail from alerts "
+            f"where {' and '.join(where)} order by {sort} desc, id desc limit ?"
+        )
+        with self._lock, self._connect() as db:
+            rows = db.execute(sql, [*params, limit + 1]).fetchall()
+
+        alerts = [self._to_alert(*row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = alerts[-1]
+            next_cursor = _encode_cursor(last[sort], last["id"])
+        return alerts, next_cursor
+
+    @staticmethod
+    def _to_alert(id_, rule, key, country, count, first_seen, last_seen, detail) -> dict:
+        title, icon = RULES[rule]
+        if rule in RULES_BY_NAME:
+            body = RULES_BY_NAME[rule].message.format(key=key, value=count)
+        elif rule == "impossible_travel":
+            body = f"User {key} logged in from {detail}"
+            if count > 1:
+                body += f" ({count} impossible hops)"
+        else:
+            body = f"Login from {country} (IP {key}) outside expected region"
+            if count > 1:
+                body += f", {count} logins"
+        return {
+            "id": id_,
+            "rule": rule,
+            "title": title,
+            "body": body,
+            "icon": icon,
+            "ts": last_seen[:16],
+            "count": count,
+            "first_seen": first_seen,
+            "last_seen": last_seen,
+        }
+
+
+_store: AlertStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_alert_store() -> AlertStore:
+    """The process-wide store at ALERTS_DB, opened on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AlertStore()
+    return _store
@@ -1,26 +1,46 @@
+import hashlib
+import logging
 import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
 from datetime import datetime, timedelta
 from datetime import timezone
 
 import numpy as np
 import pandas as pd
-from flask import Flask
+from flask import Flask, jsonify, request
 
 import dash
-from dash import Dash, html, dcc, callback, Output, Input
+from dash import Dash, html, dcc, callback, Output, Input, State, Patch
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.express as px
+import plotly.io as pio
 from helper import get_recent_alerts
+from geoip import known_countries, lookup_countries, UNKNOWN, COUNTRY_COORDS
+from impossible_travel import TravelTracker
+from rules import RuleResults, evaluate_rules
+from rollups import LoginRollups
 
 import alerts_page
 import upload_page
 import settings_page
 
-from csv_helper import get_login_logs
+from log_cache import log_cache, query_logs
+from ingest import BatchError, INGEST_MAX_BYTES, INGEST_TOKEN, ingest_queue, parse_batch, read_body
+from metrics import inc, instrument_server, registry, timed
 
 ###############################################################################
 #  Flask + Dash bootstrap
 ###############################################################################
+log = logging.getLogger(__name__)
+STARTED = time.monotonic()
+# filled in as the process comes up; also served on /ready
+startup_metrics = {"time_to_first_request_s": None}
+
 server = Flask(__name__)
 app: Dash = Dash(
     __name__,
@@ -29,6 +49,8 @@ app: Dash = Dash(
     suppress_callback_exceptions=True,  # we’ll use pages later
     title="Login Monitoring Dashboard",
 )
+# request latency per route / Dash callback, plus the opt-in slow-request profiler
+instrument_server(server)
 
 ###############################################################################
 # DATA (fake for now)
@@ -59,150 +81,92 @@ def _random_login_dataframe(days: int = 7, rows: int = 5_000) -> pd.DataFrame:
 
 
 
-# Use raw data from Supabase
-RAW_DF = get_login_logs()
+###############################################################################
+# Dashboard filters (time range / failed only / country), pushed into storage
+###############################################################################
+# key -> (label, how far back, volume chart resolution)
+TIME_RANGES = {
+    "1h": ("Last hour", timedelta(hours=1), "minute"),
+    "24h": ("Last 24 hours", timedelta(hours=24), "hour"),
+    "7d": ("Last 7 days", timedelta(days=7), "day"),
+    "30d": ("Last 30 days", timedelta(days=30), "day"),
+    "all": ("All time", None, "day"),
+    "custom": ("Custom range", None, "day"),
+}
+DEFAULT_FILTERS = {"range": "all", "start_date": None, "end_date": None, "failed_only": False, "country": None,
+                   "live": False}
+LIVE_INTERVAL_MS = 5000     # how often a live dashboard asks for changes
+LIVE_MAX_ALERTS = 50        # alerts kept in a live dashboard's list
+TOP_FAILING = 5             # rows per heavy-hitter list
+TOP_FAILING_WINDOW = timedelta(hours=24)
+
+
+def resolve_filters(filters: dict | None) -> dict:
+    """Dashboard filter store -> query arguments for `query_logs` (bounds in UTC)."""
+    filters = {**DEFAULT_FILTERS, **(filters or {})}
+    _, back, _ = TIME_RANGES.get(filters["range"], TIME_RANGES["all"])
+    start = end = None
+    if back is not None:
+        # whole minutes, so the query cache still hits between refreshes
+        start = (pd.Timestamp.now(tz="UTC") - back).floor("min")
+    elif filters["range"] == "custom":
+        if filters["start_date"]:
+            start = pd.Timestamp(filters["start_date"], tz="UTC")
+        if filters["end_date"]:
+            end = pd.Timestamp(filters["end_date"], tz="UTC") + pd.Timedelta(days=1)
+    return dict(start=start, end=end, failed_only=bool(filters["failed_only"]), country=filters["country"] or None)
+
 
 ###############################################################################
 # Helper functions (plug in real queries later) 
 ###############################################################################
-def count_suspicious(df: pd.DataFrame, vpn_mode=False, allowed_country="Taiwan") -> int:
-    suspicious_set = set()
-
-    #Repeated failed attempts by IP
-    ip_failures = df[~df["login_result"]]["ip_address"].value_counts()
-    for ip, count in ip_failures.items():
-        if count >= 3:
-            suspicious_set.add(f"IP::{ip}")
-
-    #Repeated failed attempts by UID
-    uid_failures = df[~df["login_result"]]["uid"].value_counts()
-    for uid, count in uid_failures.items():
-        if count >= 3:
-            suspicious_set.add(f"UID::{uid}")
-
-    # Foreign logins (only if VPN is off)
+def count_suspicious(df: pd.DataFrame, vpn_mode=False, allowed_country="Taiwan",
+                     rollups: LoginRollups | None = None,
+                     travel: TravelTracker | None = None,
+                     results: RuleResults | None = None) -> int:
+    if results is None:
+        results = evaluate_rules(df)
+
+    # IPs / users a windowed rule fired for (the same results the alert list shows)
+    suspicious = results.suspicious()
+
+    # Foreign logins (only if VPN is off), counted once per distinct IP
+    if not vpn_mode and rollups is not None:
+        suspicious += rollups.foreign_ips(allowed_country, ignore=(UNKNOWN,))
+    elif not vpn_mode:
+        countries = lookup_countries(df["ip_address"].dropna().unique())
+        suspicious += int(((countries != allowed_country) & (countries != UNKNOWN)).sum())
+
+    # Users with impossible travel (only if VPN is off, a VPN hop looks the same)
     if not vpn_mode:
-        ip_to_country = {
-            "66.206.89.11": "USA",
-            "38.183.48.25": "UK",
-            "53.120.67.248": "Taiwan",
-            "134.20.151.217": "Taiwan",
-            "124.132.128.69": "Taiwan",
-            "218.90.33.123": "Japan",
-            "218.70.250.234": "Taiwan",
-            "134.63.156.154": "Taiwan",
-            "222.55.201.154": "Taiwan",
-            "144.31.231.185": "Taiwan",
-            "214.127.233.122": "Australia",
-            "161.94.93.133": "Taiwan",
-            "129.141.34.136": "Taiwan",
-            "220.109.170.18": "Taiwan",
-            "63.204.126.213": "USA",
-            "74.131.146.207": "Taiwan",
-            "186.174.57.125": "Taiwan",
-            "196.189.205.50": "Taiwan",
-            "216.35.142.90": "Taiwan",
-            "197.8.132.138": "Taiwan",
-            "113.157.136.109": "USA",
-            "182.129.37.16": "Taiwan",
-            "182.187.77.223": "Taiwan",
-            "63.165.105.39": "Taiwan",
-            "154.51.61.158": "Taiwan",
-            "222.109.65.48": "Taiwan",
-            "207.183.200.174": "Taiwan",
-            "199.49.137.13": "Taiwan",
-            "205.234.56.25": "Taiwan",
-            "206.87.134.148": "Taiwan",
-            "209.114.171.210": "Taiwan",
-            "151.214.48.121": "Taiwan",
-            "213.38.155.206": "Taiwan",
-            "169.71.188.61": "Taiwan",
-            "119.74.140.99": "Taiwan",
-            "207.117.37.207": "Taiwan",
-            "2.202.141.118": "Germany",
-            "22.79.23.82": "Taiwan",
-            "204.176.42.106": "Taiwan",
-            "194.99.174.220": "Taiwan",
-            "187.7.179.156": "Taiwan",
-            "143.223.218.51": "Taiwan",
-            "205.12.121.36": "Taiwan",
-            "165.242.48.249": "Taiwan",
-            "170.58.33.145": "Taiwan",
-            "102.157.160.161": "Taiwan",
-            "214.120.11.119": "Taiwan",
-            "138.69.32.232": "Taiwan",
-            "214.177.197.177": "Taiwan",
-            "212.45.91.169": "Taiwan",
-            "180.152.194.206": "Taiwan",
-            "54.132.245.5": "Taiwan",
-            "175.117.240.148": "Taiwan",
-            "135.66.7.200": "Taiwan",
-            "89.165.121.13": "Taiwan",
-            "222.138.190.221": "Taiwan",
-            "108.106.201.32": "Taiwan",
-            "222.34.249.236": "Taiwan",
-            "193.48.128.119": "Taiwan",
-            "101.212.115.144": "Taiwan",
-            "159.120.131.226": "Taiwan",
-            "211.105.73.112": "Taiwan",
-            "152.214.72.16": "Taiwan",
-            "200.64.249.114": "Taiwan",
-            "155.239.201.150": "Taiwan",
-            "134.1.221.45": "Taiwan",
-            "212.208.124.166": "Taiwan",
-            "217.47.246.14": "Taiwan",
-            "204.49.253.9": "Taiwan",
-            "92.7.26.105": "Taiwan",
-            "220.67.34.89": "Taiwan",
-            "190.96.106.62": "Taiwan",
-            "24.223.136.35": "Taiwan",
-            "7.138.242.237": "Taiwan",
-            "198.141.131.108": "Taiwan",
-            "220.23.112.183": "Taiwan",
-            "98.58.11.86": "Taiwan",
-            "131.170.51.108": "Taiwan",
-            "58.21.91.2": "Taiwan",
-            "203.67.31.48": "Taiwan",
-            "143.168.248.20": "Taiwan",
-            "223.147.68.70": "Taiwan",
-            "195.58.232.124": "Taiwan",
-            "215.156.15.130": "Taiwan",
-            "190.110.93.192": "Taiwan",
-            "132.246.226.129": "Taiwan",
-            "131.70.84.166": "Taiwan",
-            "216.230.231.83": "Taiwan",
-            "217.85.190.144": "Taiwan",
-            "115.232.39.161": "Taiwan",
-            "74.60.80.187": "Taiwan",
-            "198.179.120.6": "Taiwan",
-            "141.60.189.30": "Taiwan",
-            "213.175.2.8": "Taiwan",
-            "148.55.94.6": "Taiwan",
-            "15.72.245.47": "Taiwan",
-            "214.176.22.37": "Taiwan",
-        }
-        for _, row in df.iterrows():
-            ip = row["ip_address"]
-            country = ip_to_country.get(ip, "Taiwan")
-            if country != allowed_country:
-                suspicious_set.add(f"Foreign::{ip}")
+        if travel is None:
+            travel = TravelTracker.from_frame(df)
+        suspicious += travel.recent()["uid"].nunique()
 
-    return len(suspicious_set)
+    return suspicious
 
 
-def get_kpis(df: pd.DataFrame, vpn_mode=False, allowed_country="Taiwan") -> dict:
+@timed()
+def get_kpis(df: pd.DataFrame | None = None, vpn_mode=False, allowed_country="Taiwan",
+             rollups: LoginRollups | None = None,
+             travel: TravelTracker | None = None,
+             results: RuleResults | None = None) -> dict:
+    if df is None:
+        df = log_cache.get()
+        rollups, travel = log_cache.rollups, log_cache.travel
+    if rollups is None:
+        rollups = LoginRollups.from_frame(df)
+
     now = datetime.now(timezone.utc)
     one_hour_ago = now - timedelta(hours=1)
 
-    total_users = df["uid"].nunique()
-    failed = (~df["login_result"]).sum()
-
-    active_sessions = df[
-        (df["login_result"] == True) &
-        (df["timestamp"] >= one_hour_ago)
-    ]["uid"].nunique()
+    # all read from the pre-aggregated rollups, no scan over df
+    total_users = rollups.distinct_users()
+    failed = rollups.failures
+    active_sessions = rollups.active_users(one_hour_ago)
 
-    suspicious = count_suspicious(df, vpn_mode=vpn_mode, allowed_country=allowed_country)
+    suspicious = count_suspicious(df, vpn_mode=vpn_mode, allowed_country=allowed_country,
+                                  rollups=rollups, travel=travel, results=results)
 
     return dict(
         total_users=total_users,
@@ -217,12 +181,13 @@ def get_kpis(df: pd.DataFrame, vpn_mode=False, allowed_country="Taiwan") -> dict
 ###############################################################################
 # UI components 
 ###############################################################################
-def kpi_card(title: str, value: str, subtitle: str, icon: str, dark_mode: bool = False) -> dbc.Card:
+def kpi_card(title: str, value: str, subtitle: str, icon: str, dark_mode: bool = False, id: str | None = None) -> dbc.Card:
     return dbc.Card(
         dbc.CardBody(
             [
                 html.Div(className=f"{icon} fs-3" + (" text-light" if dark_mode else " text-secondary")),
-                html.H4(f"{value:,}", className="card-title mt-2" + (" text-light" if dark_mode else "")),
+                html.H4(f"{value:,}", id=id or f"kpi-{title.lower().replace(' ', '-')}",
+                        className="card-title mt-2" + (" text-light" if dark_mode else "")),
                 html.Small(title, className="text-muted fw-semibold"),
                 html.Br(),
                 html.Small(subtitle, className="text-success"),
@@ -232,6 +197,17 @@ def kpi_card(title: str, value: str, subtitle: str, icon: str, dark_mode: bool =
     )
 
 
+def top_failing_items(rollups: LoginRollups, by: str) -> list[dbc.ListGroupItem]:
+    """Heaviest failing IPs / users of the last TOP_FAILING_WINDOW, from the rollups' top-K sketches."""
+    # like active sessions this follows the wall clock, so it isn't part of the cached render
+    since = datetime.now(timezone.utc) - TOP_FAILING_WINDOW
+    top = rollups.top_failing(by, since=since, n=TOP_FAILING)
+    return [
+        dbc.ListGroupItem([str(key), dbc.Badge(f"~{count:,}", color="danger", className="float-end")])
+        for key, count in top.items()
+    ] or [dbc.ListGroupItem("No failed logins.", className="text-muted")]
+
+
 sidebar = dbc.Nav(
     [
         dbc.NavLink([html.I(className="bi bi-speedometer2 me-2"), "Dashboard"], href="/", active="exact"),
@@ -244,160 +220,55 @@ sidebar = dbc.Nav(
     className="mt-4",
 )
 
-def build_dashboard(vpn_mode=False, allowed_country="Taiwan", dark_mode=False):
+@timed()
+def compute_dashboard(df: pd.DataFrame, vpn_mode=False, allowed_country="Taiwan",
+                      rollups: LoginRollups | None = None, travel: TravelTracker | None = None,
+                      resolution: str = "day") -> dict:
+    """KPIs, figures (default template) and alerts for one data version + settings."""
+
+    # default to the shared cache's incremental state
+    rollups = rollups or log_cache.rollups
+    travel = travel or log_cache.travel
+    # one pass over the alert window for every rule; KPI and alert list both read it
+    results = evaluate_rules(df)
 
-    kpis = get_kpis(RAW_DF, vpn_mode=vpn_mode, allowed_country=allowed_country)
+    kpis = get_kpis(df, vpn_mode=vpn_mode, allowed_country=allowed_country,
+                    rollups=rollups, travel=travel, results=results)
 
 
     #  Login volume line chart
-    volume_df = (
-        RAW_DF.assign(day=lambda d: pd.to_datetime(d["timestamp"]).dt.date)
-        .groupby("day")
-        .size()
-        .reset_index(name="logins")
-    )
-    volume_fig = px.line(volume_df, x="day", y="logins", title="Login Volume Trends")
-    volume_fig.update_layout(template="plotly_dark" if dark_mode else "plotly")
+    buckets = rollups.series(resolution)
+    buckets.index = pd.DatetimeIndex(buckets.index)  # an empty window comes back with a RangeIndex
+    volume_df = pd.DataFrame({
+        "time": buckets.index.strftime("%Y-%m-%d" if resolution == "day" else "%Y-%m-%d %H:%M"),
+        "logins": buckets["logins"].to_numpy(),
+    })
+    volume_fig = px.line(volume_df, x="time", y="logins", title="Login Volume Trends")
 
 
     #  Success rate pie
+    success_df = pd.DataFrame({
+        "login_result": [True, False],
+        "logins": [rollups.logins - rollups.failures, rollups.failures],
+    })
     success_fig = px.pie(
-        RAW_DF,
+        success_df,
         names="login_result",
+        values="logins",
         title="Login Success Rate",
         hole=0.5,
         color_discrete_sequence=px.colors.qualitative.G10,
     )
-    success_fig.update_layout(template="plotly_dark" if dark_mode else "plotly")
 
 
     #  Geographic distribution 
-    from collections import defaultdict
-
-    # IP ➝ country mapping
-    ip_to_country = {
-       "66.206.89.11": "USA",
-        "38.183.48.25": "UK",
-        "53.120.67.248": "Taiwan",
-        "134.20.151.217": "Taiwan",
-        "124.132.128.69": "Taiwan",
-        "218.90.33.123": "Japan",
-        "218.70.250.234": "Taiwan",
-        "134.63.156.154": "Taiwan",
-        "222.55.201.154": "Taiwan",
-        "144.31.231.185": "Taiwan",
-        "214.127.233.122": "Australia",
-        "161.94.93.133": "Taiwan",
-        "129.141.34.136": "Taiwan",
-        "220.109.170.18": "Taiwan",
-        "63.204.126.213": "USA",
-        "74.131.146.207": "Taiwan",
-        "186.174.57.125": "Taiwan",
-        "196.189.205.50": "Taiwan",
-        "216.35.142.90": "Taiwan",
-        "197.8.132.138": "Taiwan",
-        "113.157.136.109": "USA",
-        "182.129.37.16": "Taiwan",
-        "182.187.77.223": "Taiwan",
-        "63.165.105.39": "Taiwan",
-        "154.51.61.158": "Taiwan",
-        "222.109.65.48": "Taiwan",
-        "207.183.200.174": "Taiwan",
-        "199.49.137.13": "Taiwan",
-        "205.234.56.25": "Taiwan",
-        "206.87.134.148": "Taiwan",
-        "209.114.171.210": "Taiwan",
-        "151.214.48.121": "Taiwan",
-        "213.38.155.206": "Taiwan",
-        "169.71.188.61": "Taiwan",
-        "119.74.140.99": "Taiwan",
-        "207.117.37.207": "Taiwan",
-        "2.202.141.118": "Germany",
-        "22.79.23.82": "Taiwan",
-        "204.176.42.106": "Taiwan",
-        "194.99.174.220": "Taiwan",
-        "187.7.179.156": "Taiwan",
-        "143.223.218.51": "Taiwan",
-        "205.12.121.36": "Taiwan",
-        "165.242.48.249": "Taiwan",
-        "170.58.33.145": "Taiwan",
-        "102.157.160.161": "Taiwan",
-        "214.120.11.119": "Taiwan",
-        "138.69.32.232": "Taiwan",
-        "214.177.197.177": "Taiwan",
-        "212.45.91.169": "Taiwan",
-        "180.152.194.206": "Taiwan",
-        "54.132.245.5": "Taiwan",
-        "175.117.240.148": "Taiwan",
-        "135.66.7.200": "Taiwan",
-        "89.165.121.13": "Taiwan",
-        "222.138.190.221": "Taiwan",
-        "108.106.201.32": "Taiwan",
-        "222.34.249.236": "Taiwan",
-        "193.48.128.119": "Taiwan",
-        "101.212.115.144": "Taiwan",
-        "159.120.131.226": "Taiwan",
-        "211.105.73.112": "Taiwan",
-        "152.214.72.16": "Taiwan",
-        "200.64.249.114": "Taiwan",
-        "155.239.201.150": "Taiwan",
-        "134.1.221.45": "Taiwan",
-        "212.208.124.166": "Taiwan",
-        "217.47.246.14": "Taiwan",
-        "204.49.253.9": "Taiwan",
-        "92.7.26.105": "Taiwan",
-        "220.67.34.89": "Taiwan",
-        "190.96.106.62": "Taiwan",
-        "24.223.136.35": "Taiwan",
-        "7.138.242.237": "Taiwan",
-        "198.141.131.108": "Taiwan",
-        "220.23.112.183": "Taiwan",
-        "98.58.11.86": "Taiwan",
-        "131.170.51.108": "Taiwan",
-        "58.21.91.2": "Taiwan",
-        "203.67.31.48": "Taiwan",
-        "143.168.248.20": "Taiwan",
-        "223.147.68.70": "Taiwan",
-        "195.58.232.124": "Taiwan",
-        "215.156.15.130": "Taiwan",
-        "190.110.93.192": "Taiwan",
-        "132.246.226.129": "Taiwan",
-        "131.70.84.166": "Taiwan",
-        "216.230.231.83": "Taiwan",
-        "217.85.190.144": "Taiwan",
-        "115.232.39.161": "Taiwan",
-        "74.60.80.187": "Taiwan",
-        "198.179.120.6": "Taiwan",
-        "141.60.189.30": "Taiwan",
-        "213.175.2.8": "Taiwan",
-        "148.55.94.6": "Taiwan",
-        "15.72.245.47": "Taiwan",
-        "214.176.22.37": "Taiwan",
-    }
-
-    # Country ➝ coordinates (for plot)
-    country_to_coords = {
-        "Taiwan": {"lat": 25.0330, "lon": 121.5654},
-        "USA": {"lat": 38.89511, "lon": -77.03637},
-        "UK": {"lat": 51.5074, "lon": -0.1278},
-        "Japan": {"lat": 35.6895, "lon": 139.6917},
-        "Germany": {"lat": 52.52, "lon": 13.4050},
-        "Australia": {"lat": -33.8688, "lon": 151.2093},
-    }
-
-    # Aggregate IP ➝ country ➝ login count
-    ip_counts = RAW_DF.groupby("ip_address").size().reset_index(name="logins")
-    country_logins = defaultdict(int)
 
-    for _, row in ip_counts.iterrows():
-        ip = row["ip_address"]
-        count = row["logins"]
-        country = ip_to_country.get(ip, "Taiwan")
-        country_logins[country] += count
+    # Country ➝ login count, straight from the rollups
+    country_logins = rollups.breakdown("country")["logins"].to_dict()
 
     geo_data = []
     for country, count in country_logins.items():
-        coords = country_to_coords.get(country)
+        coords = COUNTRY_COORDS.get(country)
         if coords:
             geo_data.append({
                 "country": country,
@@ -406,7 +277,9 @@ def build_dashboard(vpn_mode=False, allowed_country="Taiwan", dark_mode=False):
                 "logins": count,
             })
 
-    geo_df = pd.DataFrame(geo_data)
+    geo_df = pd.DataFrame(geo_data, columns=["country", "lat", "lon", "logins"]).astype(
+        {"lat": float, "lon": float, "logins": int}
+    )
 
     geo_fig = px.scatter_geo(
     geo_df,
@@ -422,29 +295,138 @@ def build_dashboard(vpn_mode=False, allowed_country="Taiwan", dark_mode=False):
     geo_fig.update_traces(
         marker=dict(sizemode="area", sizeref=1, sizemin=6, line=dict(width=0.5, color="white"))
     )
-    
-    geo_fig.update_layout(template="plotly_dark" if dark_mode else "plotly")
 
 
+    #  Alert list
+    alerts = get_recent_alerts(df=df, travel=travel, results=results,
+                               vpn_mode=vpn_mode, allowed_country=allowed_country)
 
+    # stored as plain dicts: dcc.Graph takes them as-is and the theme swap stays cheap
+    volume_fig = volume_fig.to_dict()
+    # plain lists rather than base64 typed arrays, so live updates can patch single points
+    volume_fig["data"][0].update(x=volume_df["time"].tolist(), y=volume_df["logins"].tolist())
+    return dict(
+        kpis=kpis,
+        volume_fig=volume_fig,
+        success_fig=success_fig.to_dict(),
+        geo_fig=geo_fig.to_dict(),
+        alerts=alerts,
+    )
 
-    #  Alert list
-    alerts = get_recent_alerts(vpn_mode=vpn_mode, allowed_country=allowed_country)
-    alert_list = dbc.ListGroup(
+
+###############################################################################
+# Dashboard cache: figures/KPIs per (data version, vpn_mode, allowed_country)
+###############################################################################
+DASHBOARD_CACHE_SIZE = 32
+_dashboard_cache: OrderedDict = OrderedDict()
+_dashboard_cache_lock = threading.Lock()
+dashboard_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_dashboard_data(vpn_mode=False, allowed_country="Taiwan", filters: dict | None = None) -> dict:
+    """
+    `compute_dashboard` behind a bounded LRU keyed on the log cache version,
+    the settings and the dashboard filters. Entries are only reused while
+    they were built from the very frame `query_logs` returns now (held by a
+    weak reference, so the cache never keeps an old frame alive).
+    """
+    query = resolve_filters(filters)
+    # same test query_logs uses to decide between the shared cache and a backend query
+    filtered = query["start"] is not None or query["end"] is not None or query["failed_only"] \
+        or query["country"] is not None
+    df = query_logs(**query)
+    version = log_cache.version
+    key = (version, vpn_mode, allowed_country, *query.values())
+
+    with _dashboard_cache_lock:
+        entry = _dashboard_cache.get(key)
+        if entry is not None and entry["source"]() is df:
+            _dashboard_cache.move_to_end(key)
+            dashboard_cache_stats["hits"] += 1
+            inc("authwatch_cache_requests_total", cache="dashboard", result="hit")
+            return entry
+        dashboard_cache_stats["misses"] += 1
+    inc("authwatch_cache_requests_total", cache="dashboard", result="miss")
+
+    if filtered:
+        # a filtered frame gets its own window state; the shared one covers everything
+        rollups, travel = LoginRollups.from_frame(df), TravelTracker.from_frame(df)
+    else:
+        rollups, travel = log_cache.rollups, log_cache.travel
+    range_key = (filters or DEFAULT_FILTERS).get("range", "all")
+    data = compute_dashboard(df, vpn_mode=vpn_mode, allowed_country=allowed_country,
+                             rollups=rollups, travel=travel,
+                             resolution=TIME_RANGES.get(range_key, TIME_RANGES["all"])[2])
+    data.update(source=weakref.ref(df), rows=len(df), rollups=rollups)
+
+    with _dashboard_cache_lock:
+        # renders of an older version can't be hit again, drop them rather than wait for the LRU
+        for stale in [k for k in _dashboard_cache if k[0] != version]:
+            del _dashboard_cache[stale]
+        _dashboard_cache[key] = data
+        while len(_dashboard_cache) > DASHBOARD_CACHE_SIZE:
+            _dashboard_cache.popitem(last=False)
+    return data
+
+
+@lru_cache(maxsize=None)
+def _template(name: str) -> dict:
+    return pio.templates[name].to_plotly_json()
+
+
+def _themed(fig: dict, dark_mode: bool) -> dict:
+    # shallow copy with the template swapped, the cached figure is left untouched
+    template = _template("plotly_dark" if dark_mode else "plotly")
+    return dict(fig, layout=dict(fig["layout"], template=template))
+
+
+def filter_controls(filters: dict) -> dbc.Row:
+    return dbc.Row(
         [
-            dbc.ListGroupItem(
-                [
-                    html.I(className=f"{a['icon']} me-2 text-danger"),
-                    html.Strong(a["title"]),
-                    html.Br(),
-                    html.Span(a["body"], className="text-muted small"),
-                    html.Span(a["ts"], className="float-end text-muted small"),
-                ]
-            )
-            for a in alerts
-        ]
+            dbc.Col(dcc.Dropdown(
+                id="time-range",
+                options=[{"label": label, "value": key} for key, (label, _, _) in TIME_RANGES.items()],
+                value=filters["range"],
+                clearable=False,
+            ), md=2),
+            dbc.Col(dcc.DatePickerRange(
+                id="custom-range",
+                start_date=filters["start_date"],
+                end_date=filters["end_date"],
+                disabled=filters["range"] != "custom",
+            ), md=4),
+            dbc.Col(dcc.Dropdown(
+                id="country-filter",
+                options=[{"label": c, "value": c} for c in known_countries()],
+                value=filters["country"],
+                placeholder="All countries",
+            ), md=3),
+            dbc.Col(dbc.Switch(id="failed-only", label="Failed logins only", value=filters["failed_only"]), md=2),
+            dbc.Col(dbc.Switch(id="live-mode", label="Live", value=filters["live"]), md=1),
+        ],
+        className="gy-2 mb-3 align-items-center",
     )
 
+
+@timed()
+def build_dashboard(vpn_mode=False, allowed_country="Taiwan", dark_mode=False, filters: dict | None = None):
+
+    filters = {**DEFAULT_FILTERS, **(filters or {})}
+    range_label = TIME_RANGES.get(filters["range"], TIME_RANGES["all"])[0]
+    data = get_dashboard_data(vpn_mode=vpn_mode, allowed_country=allowed_country, filters=filters)
+
+    # active sessions depend on the wall clock, not just the data version
+    kpis = dict(data["kpis"], active_sessions=data["rollups"].active_users(
+        datetime.now(timezone.utc) - timedelta(hours=1)
+    ))
+    volume_fig = _themed(data["volume_fig"], dark_mode)
+    success_fig = _themed(data["success_fig"], dark_mode)
+    geo_fig = _themed(data["geo_fig"], dark_mode)
+    alerts = data["alerts"]
+
+    #  Alert list
+    alert_list = dbc.ListGroup([alert_item(a) for a in alerts], id="dashboard-alerts")
+
     navbar = dbc.NavbarSimple(
     brand="Login Monitoring Dashboard",
     color="dark" if dark_mode else "white",
@@ -456,13 +438,15 @@ def build_dashboard(vpn_mode=False, allowed_country="Taiwan", dark_mode=False):
 
     return dbc.Container(
         [
+            #  Filters
+            filter_controls(filters),
             #  KPI row
             dbc.Row(
                 [
                     navbar,
-                    dbc.Col(kpi_card("Total Users", kpis["total_users"], "+2.5 % from yesterday", "bi bi-people-fill", dark_mode), md=3),
-                    dbc.Col(kpi_card("Failed Logins", kpis["failed"], "Last 24 hours", "bi bi-exclamation-triangle-fill", dark_mode), md=3),
-                    dbc.Col(kpi_card("Suspicious Activity", kpis["suspicious"], "Detected today", "bi bi-shield-fill", dark_mode), md=3),
+                    dbc.Col(kpi_card("Total Users", kpis["total_users"], range_label, "bi bi-people-fill", dark_mode), md=3),
+                    dbc.Col(kpi_card("Failed Logins", kpis["failed"], range_label, "bi bi-exclamation-triangle-fill", dark_mode), md=3),
+                    dbc.Col(kpi_card("Suspicious Activity", kpis["suspicious"], range_label, "bi bi-shield-fill", dark_mode), md=3),
                     dbc.Col(kpi_card("Active Sessions", kpis["active_sessions"], "Currently active", "bi bi-person-badge-fill", dark_mode), md=3),
 
                 ],
@@ -472,8 +456,8 @@ def build_dashboard(vpn_mode=False, allowed_country="Taiwan", dark_mode=False):
             #  Charts
             dbc.Row(
                 [
-                    dbc.Col(dcc.Graph(figure=volume_fig, config={"displayModeBar": False}), md=6),
-                    dbc.Col(dcc.Graph(figure=success_fig, config={"displayModeBar": False}), md=6),
+                    dbc.Col(dcc.Graph(id="volume-graph", figure=volume_fig, config={"displayModeBar": False}), md=6),
+                    dbc.Col(dcc.Graph(id="success-graph", figure=success_fig, config={"displayModeBar": False}), md=6),
                 ],
                 className="gy-4",
             ),
@@ -481,15 +465,73 @@ def build_dashboard(vpn_mode=False, allowed_country="Taiwan", dark_mode=False):
                 dbc.Col(dcc.Graph(figure=geo_fig, config={"displayModeBar": False}), md=12),
                 className="gy-4",
             ),
+            #  Heavy hitters
+            dbc.Row(
+                [
+                    dbc.Col([html.H5("Top Failing IPs (24h)"),
+                             dbc.ListGroup(top_failing_items(data["rollups"], "ip"), id="top-failing-ips")], md=6),
+                    dbc.Col([html.H5("Top Failing Users (24h)"),
+                             dbc.ListGroup(top_failing_items(data["rollups"], "uid"), id="top-failing-uids")], md=6),
+                ],
+                className="gy-4 mb-4",
+            ),
             #  Alerts
             html.H5("Recent Alerts"),
             dbc.Row(dbc.Col(alert_list, md=12), className="gy-4"),
             html.Br(),
+            #  Live mode: poll for changes, send back only the deltas
+            dcc.Interval(id="live-interval", interval=LIVE_INTERVAL_MS, disabled=not filters["live"]),
+            dcc.Store(id="live-cursor", data=live_cursor(data, alerts)),
         ],
         fluid=True,
         className="pt-4 " + ("bg-dark text-light" if dark_mode else ""),
     )
 
+
+def alert_item(a: dict) -> dbc.ListGroupItem:
+    children = [
+        html.I(className=f"{a['icon']} me-2 text-danger"),
+        html.Strong(a["title"]),
+        html.Br(),
+        html.Span(a["body"], className="text-muted small"),
+        html.Span(a["ts"], className="float-end text-muted small"),
+    ]
+    if a.get("count", 1) > 1:
+        children += [html.Br(), html.Span(f"{a['count']:,}× since {a['first_seen']}", className="text-muted small")]
+    return dbc.ListGroupItem(children)
+
+
+def _alert_key(a: dict) -> str:
+    # short, since the keys travel with every live tick; one key per (rule, key, episode)
+    return hashlib.blake2b(a["id"].encode(), digest_size=6).hexdigest()
+
+
+def live_cursor(data: dict, shown_alerts: list[dict]) -> dict:
+    """What a browser has on screen, so the next live update only sends what changed."""
+    volume = data["volume_fig"]["data"][0]
+    return {
+        "version": log_cache.version,
+        "rows": data["rows"],
+        "points": len(volume["x"]),
+        "last_x": str(volume["x"][-1]) if len(volume["x"]) else None,
+        "alerts": [_alert_key(a) for a in shown_alerts][:LIVE_MAX_ALERTS],
+    }
+
+def loading_layout():
+    return dbc.Container(
+        [
+            dbc.Spinner(color="primary"),
+            html.H5("Loading login data…", className="mt-3"),
+            html.P("The dashboard will appear as soon as the first load finishes.", className="text-muted"),
+        ],
+        className="pt-5 text-center",
+    )
+
+
+def snapshot_banner():
+    when = log_cache.snapshot_time.strftime("%Y-%m-%d %H:%M UTC") if log_cache.snapshot_time else "an earlier run"
+    return dbc.Alert(f"Showing data saved at {when} while fresh data loads.", color="info", className="mb-0 rounded-0")
+
 ###############################################################################
 # Overall layout  
 ###############################################################################
@@ -501,6 +543,9 @@ app.layout = dbc.Row(
 
                 dcc.Location(id="url"),
                 dcc.Store(id="settings-store", storage_type="session"),
+                dcc.Store(id="dashboard-filters", storage_type="session"),
+                # re-renders data pages until the warm-up has finished
+                dcc.Interval(id="warm-up-poll", interval=1000, disabled=True),
                 html.Div(id="page-content"),
             ],
             width={"size": 10, "offset": 2},
@@ -515,27 +560,210 @@ app.layout = dbc.Row(
 
 @callback(
     Output("page-content", "children"),
+    Output("warm-up-poll", "disabled"),
     Input("url", "pathname"),
     Input("settings-store", "data"),
+    Input("dashboard-filters", "data"),
+    Input("warm-up-poll", "n_intervals"),
 )
-def render_page(pathname: str, settings):
+@timed()
+def render_page(pathname: str, settings, filters, _):
 
     vpn_mode = settings.get("vpn_mode", False) if settings else False
     allowed_country = settings.get("country", "Taiwan") if settings else "Taiwan"
     dark_mode = settings.get("dark_mode", False) if settings else False
 
-    if pathname == "/alerts":
-        return alerts_page.layout()
-    elif pathname == "/upload":
-        return upload_page.layout()
+    if pathname == "/upload":
+        return upload_page.layout(), True
     elif pathname == "/settings":
-        return settings_page.layout()
-    return build_dashboard(vpn_mode=vpn_mode, allowed_country=allowed_country, dark_mode=dark_mode)
+        return settings_page.layout(), True
+
+    # data pages: never block on the first load, show the snapshot or a spinner meanwhile
+    log_cache.start_warm_up()
+    warming = not log_cache.ready.is_set()
+    if not log_cache.available:
+        return loading_layout(), False
+
+    if pathname == "/alerts":
+        page = alerts_page.layout()
+    else:
+        page = build_dashboard(vpn_mode=vpn_mode, allowed_country=allowed_country, dark_mode=dark_mode, filters=filters)
+    return (html.Div([snapshot_banner(), page]) if warming else page), not warming
+
+
+@callback(
+    Output("dashboard-filters", "data"),
+    Input("time-range", "value"),
+    Input("custom-range", "start_date"),
+    Input("custom-range", "end_date"),
+    Input("failed-only", "value"),
+    Input("country-filter", "value"),
+    Input("live-mode", "value"),
+    State("dashboard-filters", "data"),
+    prevent_initial_call=True,
+)
+def save_filters(time_range, start_date, end_date, failed_only, country, live, current):
+    updated = {
+        "range": time_range,
+        "start_date": start_date,
+        "end_date": end_date,
+        "failed_only": bool(failed_only),
+        "country": country,
+        "live": bool(live),
+    }
+    # re-rendering the page fires these inputs again; don't loop on identical values
+    if updated == {**DEFAULT_FILTERS, **(current or {})}:
+        raise PreventUpdate
+    return updated
+
+
+
+@callback(
+    Output("kpi-total-users", "children"),
+    Output("kpi-failed-logins", "children"),
+    Output("kpi-suspicious-activity", "children"),
+    Output("kpi-active-sessions", "children"),
+    Output("volume-graph", "figure"),
+    Output("success-graph", "figure"),
+    Output("dashboard-alerts", "children"),
+    Output("top-failing-ips", "children"),
+    Output("top-failing-uids", "children"),
+    Output("live-cursor", "data"),
+    Input("live-interval", "n_intervals"),
+    State("live-cursor", "data"),
+    State("settings-store", "data"),
+    State("dashboard-filters", "data"),
+    prevent_initial_call=True,
+)
+def live_update(_, cursor, settings, filters):
+    """
+    Live mode tick. Nothing is sent while the data is unchanged; otherwise
+    only the KPI numbers, the new/changed volume points, the pie values,
+    the alerts the browser doesn't have yet (as Patch updates) and the
+    short heavy-hitter lists go out.
+    """
+    vpn_mode = settings.get("vpn_mode", False) if settings else False
+    allowed_country = settings.get("country", "Taiwan") if settings else "Taiwan"
+
+    # the cache only pulls rows newer than the ones it already has
+    data = get_dashboard_data(vpn_mode=vpn_mode, allowed_country=allowed_country, filters=filters)
+    if cursor and cursor["version"] == log_cache.version and cursor["rows"] == data["rows"]:
+        raise PreventUpdate
+
+    kpis = dict(data["kpis"], active_sessions=data["rollups"].active_users(
+        datetime.now(timezone.utc) - timedelta(hours=1)
+    ))
+
+    #  Volume: rewrite the last point we sent (its bucket may have grown), append the rest
+    x, y = list(data["volume_fig"]["data"][0]["x"]), list(data["volume_fig"]["data"][0]["y"])
+    volume = Patch()
+    n = cursor["points"] if cursor else 0
+    if n and len(x) >= n and str(x[n - 1]) == cursor["last_x"]:
+        volume["data"][0]["y"][n - 1] = y[n - 1]
+        volume["data"][0]["x"].extend(x[n:])
+        volume["data"][0]["y"].extend(y[n:])
+    else:
+        # the window slid or the view changed under us: replace the points, keep the rest of the figure
+        volume["data"][0]["x"] = x
+        volume["data"][0]["y"] = y
+
+    success = Patch()
+    success["data"][0]["values"] = list(data["success_fig"]["data"][0]["values"])
+
+    #  Alerts: prepend only the ones this browser hasn't seen, trim the tail
+    shown = cursor["alerts"] if cursor else []
+    new_alerts = [a for a in data["alerts"] if _alert_key(a) not in shown]
+    alerts = Patch()
+    for a in reversed(new_alerts):
+        alerts.prepend(alert_item(a))
+    for i in range(len(shown) + len(new_alerts) - 1, LIVE_MAX_ALERTS - 1, -1):
+        del alerts[i]
+
+    new_cursor = live_cursor(data, new_alerts)
+    new_cursor["alerts"] = ([_alert_key(a) for a in new_alerts] + shown)[:LIVE_MAX_ALERTS]
+    return (
+        f"{kpis['total_users']:,}", f"{kpis['failed']:,}", f"{kpis['suspicious']:,}", f"{kpis['active_sessions']:,}",
+        volume, success, alerts,
+        top_failing_items(data["rollups"], "ip"), top_failing_items(data["rollups"], "uid"), new_cursor,
+    )
+
+
+###############################################################################
+#  Startup: warm-up, readiness and time to first request
+###############################################################################
+@server.after_request
+def _record_first_request(response):
+    if startup_metrics["time_to_first_request_s"] is None:
+        startup_metrics["time_to_first_request_s"] = time.monotonic() - STARTED
+        log.info("First request served %.2fs after startup", startup_metrics["time_to_first_request_s"])
+    return response
+
+
+@server.route("/ready")
+def ready():
+    """Readiness probe: 200 once there is data to serve (fresh or snapshot), 503 before."""
+    log_cache.start_warm_up()
+    status = {
+        "ready": log_cache.ready.is_set(),
+        "serving_snapshot": log_cache.available and not log_cache.ready.is_set(),
+        "warm_up_s": log_cache.warm_up_seconds,
+        **startup_metrics,
+    }
+    return jsonify(status), 200 if log_cache.available else 503
 
 
+###############################################################################
+#  Prometheus metrics
+###############################################################################
+registry.gauge("authwatch_log_cache_rows", lambda: log_cache.rows, "Login rows held by the shared log cache.")
+registry.gauge("authwatch_log_cache_version", lambda: log_cache.version, "Log cache data version.")
+registry.gauge("authwatch_log_cache_shared_version", lambda: log_cache.shared_version,
+               "Shared snapshot version this worker has mapped (0 = not shared).")
+registry.gauge("authwatch_time_to_first_request_seconds",
+               # no sample until the first request has been answered
+               lambda: {} if startup_metrics["time_to_first_request_s"] is None
+               else startup_metrics["time_to_first_request_s"],
+               "Seconds from process start to the first answered request.")
+registry.gauge("authwatch_dashboard_cache_entries", lambda: len(_dashboard_cache), "Cached dashboard renders.")
+registry.gauge("authwatch_ingest_queue_rows", lambda: ingest_queue.pending_rows, "Rows waiting to be written.")
+
+
+@server.route("/metrics")
+def metrics():
+    """Prometheus text exposition of the counters, histograms and gauges above."""
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+###############################################################################
+#  Ingestion endpoint for log shippers
+###############################################################################
+@server.route("/ingest", methods=["POST"])
+def ingest_logs():
+    """
+    Accept a batch of login rows (NDJSON or CSV, optionally gzipped). Answers
+    202 once the batch is validated and queued; 429 with Retry-After when the
+    write buffer is full, so shippers back off and resend.
+    """
+    if INGEST_TOKEN and request.headers.get("Authorization") != f"Bearer {INGEST_TOKEN}":
+        return jsonify(error="unauthorized"), 401
+    if (request.content_length or 0) > INGEST_MAX_BYTES:
+        return jsonify(error=f"batch is over {INGEST_MAX_BYTES:,} bytes"), 413
+
+    try:
+        # chunked bodies have no Content-Length, so the limit is also enforced while reading
+        body = read_body(request.stream, INGEST_MAX_BYTES)
+        df = parse_batch(body, request.content_type, request.content_encoding)
+    except BatchError as e:
+        return jsonify(error=str(e)), e.status
+
+    if not ingest_queue.put(df):
+        return jsonify(error="ingest queue is full, retry later"), 429, {"Retry-After": "1"}
+    return jsonify(accepted=len(df), queued=ingest_queue.pending_rows), 202
+
 
 ###############################################################################
 #  Run server
 ###############################################################################
 if __name__ == "__main__":
+    log_cache.start_warm_up()
     app.run(debug=True, port=8080)
@@ -0,0 +1,227 @@
+"""
+Offline benchmark of the dashboard hot paths on synthetic login data.
+
+    python benchmark.py --sizes 10000 100000 1000000 10000000 --output bench.json
+
+Each size gets its own generated frame (failures, foreign IPs and brute-force
+bursts are configurable), which is also written to a throwaway local Parquet
+store so the storage scans can be timed. Every step is timed `--repeat` times
+and then run once more under tracemalloc for its peak memory. Results are
+printed (or written) as JSON so two runs can be diffed.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import app
+from csv_helper import compact_logs
+from geoip import GEOIP_DB
+from helper import get_recent_alerts
+from impossible_travel import TravelTracker
+from rollups import LoginRollups
+from rules import evaluate_rules
+from sliding_window import SlidingWindowDetector
+from storage import ParquetBackend
+from upload_stream import parse_upload
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+UPLOAD_ROWS_CAP = 1_000_000   # the upload parse step never sees more than this
+
+
+def make_dataset(rows: int, failure_rate: float = 0.03, foreign_rate: float = 0.02,
+                 burst_rate: float = 0.001, days: int = 7, seed: int = 0,
+                 users: int = app.N_USERS, distinct_ips: int = 50_000) -> pd.DataFrame:
+    """Synthetic login_logs frame (in the compact in-memory layout), built without per-row Python work."""
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp(datetime.now(timezone.utc)).floor("s")
+
+    ranges = pd.read_csv(GEOIP_DB)
+    known = ranges["network"].str.split("/").str[0]
+    home = known[ranges["country"] == "Taiwan"].to_numpy()
+    foreign = known[ranges["country"] != "Taiwan"].to_numpy()
+    ip_pool = np.array(
+        [f"{a}.{b}.{c}.{d}" for a, b, c, d in rng.integers(1, 255, (distinct_ips, 4))], dtype=object
+    )
+
+    ips = rng.choice(ip_pool, rows)
+    is_home = rng.random(rows) < 0.5
+    ips[is_home] = rng.choice(home, is_home.sum())
+    is_foreign = rng.random(rows) < foreign_rate
+    ips[is_foreign] = rng.choice(foreign, is_foreign.sum())
+
+    df = pd.DataFrame({
+        "uid": rng.integers(1, users, rows),
+        "timestamp": now - pd.to_timedelta(rng.integers(0, days * 86_400, rows), unit="s"),
+        "ip_address": ips,
+        "browser": pd.Categorical(rng.choice(["Chrome", "Edge", "Firefox", "Safari"], rows)),
+        "os": pd.Categorical(rng.choice(["Windows", "macOS", "Linux", "Android", "iOS"], rows)),
+        "device": pd.Categorical(rng.choice(["Desktop", "Laptop", "Mobile", "Tablet"], rows)),
+        "login_result": rng.random(rows) >= failure_rate,
+    })
+
+    # attack bursts: a handful of IPs failing against many users within minutes
+    burst_rows = rng.random(rows) < burst_rate
+    n_burst = int(burst_rows.sum())
+    if n_burst:
+        attackers = rng.choice(ip_pool, max(1, n_burst // 50))
+        start = now - pd.Timedelta(minutes=30)
+        df.loc[burst_rows, "ip_address"] = rng.choice(attackers, n_burst)
+        df.loc[burst_rows, "login_result"] = False
+        df.loc[burst_rows, "timestamp"] = start + pd.to_timedelta(rng.integers(0, 1_800, n_burst), unit="s")
+
+    return compact_logs(df.sort_values("timestamp", ignore_index=True))
+
+
+def _upload_content(df: pd.DataFrame) -> str:
+    csv = df.head(UPLOAD_ROWS_CAP).to_csv(index=False).encode()
+    return "data:text/csv;base64," + base64.b64encode(csv).decode()
+
+
+def _steps(df: pd.DataFrame, store: ParquetBackend | None, only=None) -> dict:
+    """
+    name -> zero-argument callable, in the order they are run. With `only`,
+    just those steps, and only the inputs they use are built (at 10M rows
+    the rollups, the upload CSV and the Parquet copy take minutes each).
+    """
+    wanted = lambda *names: only is None or any(name in only for name in names)
+    rollups = travel = upload = None
+    if wanted("get_kpis", "count_suspicious", "build_dashboard", "top_failing_ips_24h"):
+        rollups = LoginRollups.from_frame(df)
+    if wanted("get_kpis", "count_suspicious", "get_recent_alerts", "build_dashboard"):
+        travel = TravelTracker.from_frame(df)
+    if wanted("upload_parse"):
+        upload = _upload_content(df)
+    last_day = df["timestamp"].max() - pd.Timedelta(days=1)
+    scans = {}
+    if store is not None and wanted("storage_scan_24h", "storage_scan_all"):
+        store.insert(df)
+        scans = {
+            # the dashboard's columns for the last 24h, pushed down into the scan
+            "storage_scan_24h": lambda: store.fetch(columns=["uid", "timestamp", "ip_address", "login_result"],
+                                                    start=last_day),
+            "storage_scan_all": lambda: store.fetch(),
+        }
+    steps = {
+        "get_kpis": lambda: app.get_kpis(df, rollups=rollups, travel=travel),
+        "count_suspicious": lambda: app.count_suspicious(df, rollups=rollups, travel=travel),
+        "get_recent_alerts": lambda: get_recent_alerts(df=df, travel=travel),
+        "build_dashboard": lambda: app.compute_dashboard(df, rollups=rollups, travel=travel),
+        "rules_evaluate": lambda: evaluate_rules(df),
+        "detector_build": lambda: SlidingWindowDetector.from_frame(df),
+        "travel_build": lambda: TravelTracker.from_frame(df),
+        "rollups_build": lambda: LoginRollups.from_frame(df),
+        "top_failing_ips_24h": lambda: rollups.top_failing("ip", since=last_day),
+        "upload_parse": lambda: parse_upload(upload, "bench.csv"),
+        **scans,
+    }
+    return {name: fn for name, fn in steps.items() if wanted(name)}
+
+
+def _time(fn, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return {"min_s": min(times), "median_s": float(np.median(times))}
+
+
+def _peak_memory(fn) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, repeat: int = 3, memory: bool = True, steps=None, storage: bool = True,
+        **dataset_kwargs) -> dict:
+    results = []
+    for size in sizes:
+        started = time.perf_counter()
+        df = make_dataset(size, **dataset_kwargs)
+        entry = {
+            "rows": size,
+            "generate_s": time.perf_counter() - started,
+            "frame_bytes": int(df.memory_usage(deep=True).sum()),
+            "steps": {},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ParquetBackend(tmp) if storage else None
+            for name, fn in _steps(df, store, steps).items():
+                step = _time(fn, repeat)
+                step["rows_per_s"] = size / step["min_s"] if step["min_s"] else None
+                if memory:
+                    step["peak_bytes"] = _peak_memory(fn)
+                entry["steps"][name] = step
+        results.append(entry)
+    return {"meta": _meta(repeat, dataset_kwargs), "results": results}
+
+
+def _meta(repeat: int, dataset_kwargs: dict) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "started": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "repeat": repeat,
+        "dataset": dataset_kwargs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--steps", nargs="+", help="only run these steps")
+    parser.add_argument("--failure-rate", type=float, default=0.03)
+    parser.add_argument("--foreign-rate", type=float, default=0.02)
+    parser.add_argument("--burst-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--no-storage", action="store_true", help="skip the local Parquet scan steps")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(
+        args.sizes,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        steps=args.steps,
+        storage=not args.no_storage,
+        failure_rate=args.failure_rate,
+        foreign_rate=args.foreign_rate,
+        burst_rate=args.burst_rate,
+        seed=args.seed,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,161 @@
-from supabase_client import supabase
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 
-# Sample Supabase insert (rn theres no actual tables so this is just a placeholder)
-def upload_to_supabase(data):
-    # Assuming data is a DataFrame
-    for index, row in data.iterrows():
-        supabase.table("login_logs").insert(row.to_dict()).execute()
-        
-# Return login logs as a DataFrame
-def get_login_logs():
-    """Return login logs as a DataFrame."""
-    data = supabase.table("login_logs").select("*").execute()
-    df = pd.DataFrame(data.data)
-    
+from geoip import lookup_countries
+from metrics import inc, timed
+from storage import get_backend
+
+BATCH_SIZE = 500        # rows per insert request
+MAX_WORKERS = 4         # batches in flight at once
+MAX_RETRIES = 3         # attempts per batch before giving up on it
+RETRY_BACKOFF = 0.5     # seconds, doubled after every failed attempt
+PAGE_SIZE = 1000        # rows per select request
+
+# repeated strings, kept as categoricals (int codes + one table of distinct values)
+CATEGORY_COLUMNS = ["ip_address", "browser", "os", "device", "country"]
+
+
+def _insert_batch(chunk: pd.DataFrame, retries: int) -> str | None:
+    """Insert one batch, retrying with backoff. Returns the last error or None."""
+    error = None
+    for attempt in range(retries):
+        try:
+            get_backend().insert(chunk)
+            return None
+        except Exception as e:
+            error = str(e)
+            if attempt < retries - 1:  # no point waiting after the last try
+                time.sleep(RETRY_BACKOFF * (2 ** attempt))
+    return error
+
+
+# Upload a DataFrame to login_logs (whichever backend is configured), one request per batch
+def upload_logs(data, batch_size: int = BATCH_SIZE, max_workers: int = MAX_WORKERS,
+                retries: int = MAX_RETRIES) -> dict:
+    """
+    Insert `data` in batches of `batch_size` rows with at most `max_workers`
+    batches in flight. Failed batches are retried and then reported, the
+    remaining batches still go through.
+
+    Returns a summary dict: rows, uploaded, seconds, rows_per_sec and
+    failed_batches (list of {batch, start, end, error}).
+    """
+    started = time.perf_counter()
+    # resolve countries once at ingest so country filters can run in storage
+    if "country" not in data.columns and "ip_address" in data.columns:
+        data = data.assign(country=lookup_countries(data["ip_address"]).astype(object))
+    batches = [
+        (i, start, data.iloc[start:start + batch_size])
+        for i, start in enumerate(range(0, len(data), batch_size))
+    ]
+
+    failed_batches = []
+    uploaded = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_insert_batch, chunk, retries): (i, start, len(chunk))
+            for i, start, chunk in batches
+        }
+        for future, (i, start, size) in futures.items():
+            error = future.result()
+            if error is None:
+                uploaded += size
+            else:
+                failed_batches.append({"batch": i, "start": start, "end": start + size, "error": error})
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": len(data),
+        "uploaded": uploaded,
+        "seconds": seconds,
+        "rows_per_sec": uploaded / seconds if seconds > 0 else 0.0,
+        "failed_batches": failed_batches,
+    }
+
+# kept for existing callers, from before there was more than one backend
+upload_to_supabase = upload_logs
+
+
+def compact_logs(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The canonical in-memory login_logs frame, built once when rows are loaded:
+    int32 uid, UTC datetime64 timestamp, bool login_result and categoricals
+    for IPs, browser, OS, device and country. Downstream code relies on these
+    dtypes instead of parsing again.
+
+    Returns a new frame; the caller's is left as it was (converted columns
+    are replaced in a shallow copy, nothing is copied twice).
+    """
+    df = df.copy(deep=False)
     if "uid" in df.columns:
-        df["uid"] = df["uid"].astype(int)
-    
+        uid = pd.to_numeric(df["uid"])
+        small = uid.empty or uid.abs().max() <= np.iinfo(np.int32).max
+        df["uid"] = uid.astype("int32" if small else "int64")
+
     if "timestamp" in df.columns:
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-    
-    return df
\ No newline at end of file
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601")
+
+    if "login_result" in df.columns:
+        df["login_result"] = df["login_result"].astype(bool)
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+def concat_logs(df: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """Append compact frames without falling back to object columns."""
+    old_cols, new_cols = {}, {}
+    for col in df.columns.intersection(new_rows.columns):
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and isinstance(new_rows[col].dtype, pd.CategoricalDtype):
+            # grow the existing categories so the big side keeps its codes; only the new rows get recoded
+            old = df[col].cat
+            extra = new_rows[col].cat.categories.difference(old.categories)
+            old_cols[col] = old.add_categories(extra) if len(extra) else df[col]
+            new_cols[col] = new_rows[col].cat.set_categories(old_cols[col].cat.categories)
+    return pd.concat([df.assign(**old_cols), new_rows.assign(**new_cols)], ignore_index=True)
+
+
+# Return login logs as a DataFrame
+@timed()
+def get_login_logs(columns: list[str] | None = None, since=None, start=None, end=None,
+                   failed_only: bool = False, country: str | None = None,
+                   page_size: int = PAGE_SIZE) -> pd.DataFrame:
+    """
+    Return login logs as a DataFrame, ordered by timestamp.
+
+    `columns` limits the read to those columns (always including
+    `timestamp`, which the ordering uses). With `since`, only rows with a
+    timestamp strictly after it are fetched; `start`/`end`, `failed_only`
+    and `country` narrow it further. The backend applies all of them, so
+    Supabase pages through a filtered, projected select and Parquet prunes
+    files and columns.
+    """
+    if columns is not None and "timestamp" not in columns:
+        columns = [*columns, "timestamp"]
+
+    df = get_backend().fetch(columns=columns, since=since, start=start, end=end,
+                             failed_only=failed_only, country=country, page_size=page_size)
+    inc("authwatch_rows_fetched_total", len(df))
+    return compact_logs(df)
+
+
+def fetch_new_logs(cursor: dict | None = None, columns: list[str] | None = None,
+                   page_size: int = PAGE_SIZE) -> tuple[pd.DataFrame, dict]:
+    """
+    Rows inserted since `cursor` (all of them for None), ordered by
+    timestamp, and the cursor to continue from. It goes by insert order, so
+    late or backfilled rows with old timestamps are picked up too. Each
+    row's insert-order key comes along in the INSERT_KEY column.
+    """
+    if columns is not None and "timestamp" not in columns:
+        columns = [*columns, "timestamp"]
+    df, cursor = get_backend().fetch_new(cursor, columns=columns, page_size=page_size)
+    inc("authwatch_rows_fetched_total", len(df))
+    return compact_logs(df), cursor
+
@@ -0,0 +1,219 @@
+import ipaddress
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Local range database. Either GeoLite-style CIDR blocks (network,country)
+# or explicit ranges (start_ip,end_ip,country); IPv4 and IPv6 can be mixed.
+GEOIP_DB = os.getenv("GEOIP_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ip_ranges.csv"))
+UNKNOWN = "Unknown"
+
+# Country ➝ representative coordinates (map markers, travel distances)
+COUNTRY_COORDS = {
+    "Taiwan": {"lat": 25.0330, "lon": 121.5654},
+    "USA": {"lat": 38.89511, "lon": -77.03637},
+    "UK": {"lat": 51.5074, "lon": -0.1278},
+    "Japan": {"lat": 35.6895, "lon": 139.6917},
+    "Germany": {"lat": 52.52, "lon": 13.4050},
+    "France": {"lat": 48.8566, "lon": 2.3522},
+    "Australia": {"lat": -33.8688, "lon": 151.2093},
+}
+
+
+_IPV4_OCTET = r"(?:25[0-5]|2[0-4]\d|1?\d?\d)"
+_IPV4_RE = rf"{_IPV4_OCTET}(?:\.{_IPV4_OCTET}){{3}}"
+
+
+def _parse_ipv4(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Dotted-quad strings -> (uint32 addresses, valid mask), without a Python loop."""
+    valid = values.str.fullmatch(_IPV4_RE).fillna(False).to_numpy(dtype=bool)
+    addrs = np.zeros(len(values), dtype=np.uint32)
+    if valid.any():
+        # one C-level parse over all octets instead of splitting every string
+        text = " ".join(values[valid]).replace(".", " ")
+        octets = np.fromstring(text, dtype=np.uint32, sep=" ").reshape(-1, 4)
+        addrs[valid] = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    return addrs, valid
+
+
+def _ipv6_bytes(ip) -> bytes | None:
+    try:
+        return ipaddress.IPv6Address(ip).packed
+    except ValueError:
+        return None
+
+
+class GeoIP:
+    """
+    Country lookup over sorted, non-overlapping IP ranges. Nested ranges in
+    the database (a /16 carved out of a /8) are flattened at load time, the
+    more specific one winning; ranges that only partly overlap are rejected.
+
+    IPv4 ranges are kept as uint32 start/end arrays and IPv6 ranges as 16-byte
+    big-endian strings (which sort like the 128-bit integers they encode), so a
+    whole column resolves with one `np.searchsorted` per address family.
+    """
+
+    def __init__(self, path: str = GEOIP_DB):
+        db = pd.read_csv(path, dtype=str).dropna()
+        if "network" in db.columns:
+            nets = [ipaddress.ip_network(n.strip(), strict=False) for n in db["network"]]
+            starts = [n.network_address for n in nets]
+            ends = [n.broadcast_address for n in nets]
+        else:
+            starts = [ipaddress.ip_address(ip.strip()) for ip in db["start_ip"]]
+            ends = [ipaddress.ip_address(ip.strip()) for ip in db["end_ip"]]
+
+        codes, self.countries = pd.factorize(db["country"].str.strip())
+        self.countries = np.append(self.countries.astype(object), UNKNOWN)
+        self._unknown = len(self.countries) - 1
+        # categories of the last categorical column resolved, and their codes
+        self._categories_memo = (None, None)
+
+        v4 = np.array([s.version == 4 for s in starts], dtype=bool)
+        self._v4_start, self._v4_end, self._v4_code = self._build(
+            [int(s) for s, ok in zip(starts, v4) if ok], [int(e) for e, ok in zip(ends, v4) if ok],
+            codes[v4], lambda values: np.array(values, dtype=np.uint32),
+        )
+        self._v6_start, self._v6_end, self._v6_code = self._build(
+            [int(s) for s, ok in zip(starts, v4) if not ok], [int(e) for e, ok in zip(ends, v4) if not ok],
+            codes[~v4], lambda values: np.array([v.to_bytes(16, "big") for v in values], dtype="S16"),
+        )
+
+    @staticmethod
+    def _build(start: list, end: list, code: np.ndarray, to_array):
+        """Integer ranges -> sorted, non-overlapping (start, end, code) arrays."""
+        # widest first among equal starts, so nested ranges come after the range they sit in
+        order = sorted(range(len(start)), key=lambda i: (start[i], -end[i]))
+        start, end, code = [start[i] for i in order], [end[i] for i in order], code[order]
+        if all(s > e for s, e in zip(start[1:], end)):
+            return to_array(start), to_array(end), code
+        return GeoIP._flatten(start, end, code, to_array)
+
+    @staticmethod
+    def _flatten(start: list, end: list, code: np.ndarray, to_array):
+        """Split enclosing ranges around the ones nested in them (innermost wins)."""
+        out_start, out_end, out_code = [], [], []
+
+        def emit(s, e, c):
+            if s <= e:
+                out_start.append(s)
+                out_end.append(e)
+                out_code.append(c)
+
+        stack, pos = [], None       # enclosing (end, code) ranges; first address not emitted yet
+        for s, e, c in zip(start, end, code):
+            while stack and stack[-1][0] < s:
+                top_end, top_code = stack.pop()
+                emit(pos, top_end, top_code)
+                pos = top_end + 1
+            if stack:
+                if e > stack[-1][0]:
+                    raise ValueError(f"Overlapping IP ranges: "
+                                     f"{ipaddress.ip_address(s)}-{ipaddress.ip_address(e)} crosses the end of "
+                                     f"a range ending at {ipaddress.ip_address(stack[-1][0])}")
+                emit(pos, s - 1, stack[-1][1])
+            stack.append((e, c))
+            pos = s
+        while stack:
+            top_end, top_code = stack.pop()
+            emit(pos, top_end, top_code)
+            pos = top_end + 1
+        return to_array(out_start), to_array(out_end), np.array(out_code, dtype=code.dtype)
+
+    @staticmethod
+    def _search(starts, ends, codes, addrs, unknown):
+        if len(starts) == 0:
+            return np.full(len(addrs), unknown, dtype=np.int64)
+        idx = np.searchsorted(starts, addrs, side="right") - 1
+        safe = idx.clip(0)
+        hit = (idx >= 0) & (addrs <= ends[safe])
+        return np.where(hit, codes[safe], unknown)
+
+    def lookup_ipv4(self, addrs: np.ndarray) -> np.ndarray:
+        """uint32 addresses -> country codes (indexes into `self.countries`)."""
+        return self._search(self._v4_start, self._v4_end, self._v4_code, addrs, self._unknown)
+
+    def lookup_codes(self, ips) -> np.ndarray:
+        """IP strings (any iterable) -> country codes (indexes into `self.countries`)."""
+        if isinstance(getattr(ips, "dtype", None), pd.CategoricalDtype):
+            # compact log frames: resolve the distinct addresses, then gather by code
+            ips = pd.Categorical(ips)
+            return np.append(self._category_codes(ips.categories), self._unknown)[ips.codes]
+
+        # log columns repeat the same addresses a lot, so resolve each distinct one once
+        ip_codes, uniques = pd.factorize(pd.Series(ips, dtype=object), use_na_sentinel=True)
+        uniques = pd.Series(uniques, dtype=object).astype(str)
+
+        # one spare slot at the end, so the -1 used for missing IPs maps to Unknown
+        result = np.full(len(uniques) + 1, self._unknown, dtype=np.int64)
+        is_v6 = uniques.str.contains(":", regex=False).to_numpy()
+
+        addrs, valid = _parse_ipv4(uniques[~is_v6])
+        v4_codes = self.lookup_ipv4(addrs)
+        result[np.flatnonzero(~is_v6)] = np.where(valid, v4_codes, self._unknown)
+
+        if is_v6.any():
+            packed = [_ipv6_bytes(ip) for ip in uniques[is_v6]]
+            ok = np.array([p is not None for p in packed], dtype=bool)
+            v6 = np.array([p or b"" for p in packed], dtype="S16")
+            v6_codes = self._search(self._v6_start, self._v6_end, self._v6_code, v6, self._unknown)
+            result[np.flatnonzero(is_v6)] = np.where(ok, v6_codes, self._unknown)
+
+        return result[ip_codes]
+
+    def _category_codes(self, categories: pd.Index) -> np.ndarray:
+        # the cached log frame only ever appends categories, so repeat lookups resolve just the new ones
+        cached, codes = self._categories_memo
+        if cached is categories:
+            return codes
+        if cached is not None and len(categories) > len(cached) and categories[:len(cached)].equals(cached):
+            codes = np.concatenate([codes, self.lookup_codes(categories[len(cached):])])
+        else:
+            codes = self.lookup_codes(categories)
+        self._categories_memo = (categories, codes)
+        return codes
+
+    def lookup(self, ips) -> pd.Categorical:
+        """IP strings -> categorical of country names ("Unknown" when not covered)."""
+        return pd.Categorical.from_codes(self.lookup_codes(ips), categories=self.countries)
+
+
+_geoip: GeoIP | None = None
+_lock = threading.Lock()
+
+
+def get_geoip() -> GeoIP:
+    """Shared GeoIP instance, loaded from GEOIP_DB on first use."""
+    global _geoip
+    if _geoip is None:
+        with _lock:
+            if _geoip is None:
+                _geoip = GeoIP()
+    return _geoip
+
+
+def known_countries() -> list[str]:
+    """Every country the range database can resolve to."""
+    return sorted(c for c in get_geoip().countries if c != UNKNOWN)
+
+
+def lookup_countries(ips) -> pd.Categorical:
+    """Resolve a whole column of IPs to countries in one pass."""
+    return get_geoip().lookup(ips)
+
+
+def lookup_coords(ips) -> tuple[np.ndarray, np.ndarray]:
+    """IPs -> (lat, lon) arrays of their country's coordinates, NaN when unknown."""
+    countries = lookup_countries(ips)
+    lat = np.array([COUNTRY_COORDS.get(c, {}).get("lat", np.nan) for c in countries.categories])
+    lon = np.array([COUNTRY_COORDS.get(c, {}).get("lon", np.nan) for c in countries.categories])
+    codes = countries.codes
+    return np.append(lat, np.nan)[codes], np.append(lon, np.nan)[codes]
+
+
+def lookup_country(ip: str) -> str:
+    """Resolve a single IP to its country, or "Unknown"."""
+    return lookup_countries([ip])[0]
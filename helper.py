@@ -1,155 +1,136 @@
-from csv_helper import get_login_logs
+from log_cache import log_cache
+from geoip import lookup_country, lookup_countries, UNKNOWN
+from impossible_travel import TravelTracker
+from metrics import timed
+from alerts_store import RULES, SEVERITY
+from rules import RuleResults, evaluate_rules, window_rows
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import timedelta
 
 CURRENT_COUNTRY = "Taiwan"
 VPN_MODE = False
 
-# IP to country mapping (
+# IP to country mapping (see geoip.py / GEOIP_DB for the range database)
 def resolve_country(ip: str) -> str:
-    ip_map = {
-        "66.206.89.11": "USA",
-        "38.183.48.25": "UK",
-        "53.120.67.248": "Taiwan",
-        "134.20.151.217": "Taiwan",
-        "124.132.128.69": "Taiwan",
-        "218.90.33.123": "Japan",
-        "218.70.250.234": "Taiwan",
-        "134.63.156.154": "Taiwan",
-        "222.55.201.154": "Taiwan",
-        "144.31.231.185": "Taiwan",
-        "214.127.233.122": "Australia",
-        "161.94.93.133": "Taiwan",
-        "129.141.34.136": "Taiwan",
-        "220.109.170.18": "Taiwan",
-        "63.204.126.213": "USA",
-        "74.131.146.207": "Taiwan",
-        "186.174.57.125": "Taiwan",
-        "196.189.205.50": "Taiwan",
-        "216.35.142.90": "Taiwan",
-        "197.8.132.138": "Taiwan",
-        "113.157.136.109": "USA",
-        "182.129.37.16": "Taiwan",
-        "182.187.77.223": "Taiwan",
-        "63.165.105.39": "Taiwan",
-        "154.51.61.158": "Taiwan",
-        "222.109.65.48": "Taiwan",
-        "207.183.200.174": "Taiwan",
-        "199.49.137.13": "Taiwan",
-        "205.234.56.25": "Taiwan",
-        "206.87.134.148": "Taiwan",
-        "209.114.171.210": "Taiwan",
-        "151.214.48.121": "Taiwan",
-        "213.38.155.206": "Taiwan",
-        "169.71.188.61": "Taiwan",
-        "119.74.140.99": "Taiwan",
-        "207.117.37.207": "Taiwan",
-        "2.202.141.118": "Germany",
-        "22.79.23.82": "Taiwan",
-        "204.176.42.106": "Taiwan",
-        "194.99.174.220": "Taiwan",
-        "187.7.179.156": "Taiwan",
-        "143.223.218.51": "Taiwan",
-        "205.12.121.36": "Taiwan",
-        "165.242.48.249": "Taiwan",
-        "170.58.33.145": "Taiwan",
-        "102.157.160.161": "Taiwan",
-        "214.120.11.119": "Taiwan",
-        "138.69.32.232": "Taiwan",
-        "214.177.197.177": "Taiwan",
-        "212.45.91.169": "Taiwan",
-        "180.152.194.206": "Taiwan",
-        "54.132.245.5": "Taiwan",
-        "175.117.240.148": "Taiwan",
-        "135.66.7.200": "Taiwan",
-        "89.165.121.13": "Taiwan",
-        "222.138.190.221": "Taiwan",
-        "108.106.201.32": "Taiwan",
-        "222.34.249.236": "Taiwan",
-        "193.48.128.119": "Taiwan",
-        "101.212.115.144": "Taiwan",
-        "159.120.131.226": "Taiwan",
-        "211.105.73.112": "Taiwan",
-        "152.214.72.16": "Taiwan",
-        "200.64.249.114": "Taiwan",
-        "155.239.201.150": "Taiwan",
-        "134.1.221.45": "Taiwan",
-        "212.208.124.166": "Taiwan",
-        "217.47.246.14": "Taiwan",
-        "204.49.253.9": "Taiwan",
-        "92.7.26.105": "Taiwan",
-        "220.67.34.89": "Taiwan",
-        "190.96.106.62": "Taiwan",
-        "24.223.136.35": "Taiwan",
-        "7.138.242.237": "Taiwan",
-        "198.141.131.108": "Taiwan",
-        "220.23.112.183": "Taiwan",
-        "98.58.11.86": "Taiwan",
-        "131.170.51.108": "Taiwan",
-        "58.21.91.2": "Taiwan",
-        "203.67.31.48": "Taiwan",
-        "143.168.248.20": "Taiwan",
-        "223.147.68.70": "Taiwan",
-        "195.58.232.124": "Taiwan",
-        "215.156.15.130": "Taiwan",
-        "190.110.93.192": "Taiwan",
-        "132.246.226.129": "Taiwan",
-        "131.70.84.166": "Taiwan",
-        "216.230.231.83": "Taiwan",
-        "217.85.190.144": "Taiwan",
-        "115.232.39.161": "Taiwan",
-        "74.60.80.187": "Taiwan",
-        "198.179.120.6": "Taiwan",
-        "141.60.189.30": "Taiwan",
-        "213.175.2.8": "Taiwan",
-        "148.55.94.6": "Taiwan",
-        "15.72.245.47": "Taiwan",
-        "214.176.22.37": "Taiwan",
+    return lookup_country(ip)
+
+# Repeats of one alert (same rule and key) less than this apart are folded into
+# one entry with a count and first/last seen, instead of one entry per login
+SUPPRESS_INTERVAL = timedelta(hours=1)
+# Country alerts only look at the logins this close to the newest one (like impossible travel's window)
+COUNTRY_ALERT_WINDOW = timedelta(hours=24)
+
+
+def _episodes(keys: pd.Series, ts: pd.Series, interval: timedelta = SUPPRESS_INTERVAL) -> pd.DataFrame:
+    """
+    Group events by key, starting a new group whenever a key was quiet for
+    longer than `interval`. Returns key, count, first_seen, last_seen per group.
+    """
+    frame = pd.DataFrame({"key": keys.reset_index(drop=True), "ts": ts.reset_index(drop=True)})
+    frame = frame.sort_values(["key", "ts"], kind="stable")
+    new_group = (frame["key"] != frame["key"].shift()) | (frame["ts"].diff() > pd.Timedelta(interval))
+    return frame.groupby(new_group.cumsum().to_numpy(), sort=False).agg(
+        key=("key", "first"), count=("ts", "size"), first_seen=("ts", "min"), last_seen=("ts", "max"),
+    )
+
+
+def _alert(rule: str, key, body: str, count: int, first_seen, last_seen, id_: str | None = None) -> dict:
+    title, icon = RULES[rule]
+    last_seen = pd.Timestamp(last_seen)
+    return {
+        "id": id_ or f"{rule}|{key}|{pd.Timestamp(first_seen):%Y-%m-%d %H:%M:%S}",
+        "rule": rule,
+        "key": key,
+        "title": title,
+        "body": body,
+        "icon": icon,
+        "ts": last_seen.strftime("%Y-%m-%d %H:%M"),
+        "count": int(count),
+        "first_seen": pd.Timestamp(first_seen).strftime("%Y-%m-%d %H:%M"),
+        "last_seen": last_seen,
+        "severity": SEVERITY[rule],
     }
-    return ip_map.get(ip, "Unknown")
 
-def get_recent_alerts(limit: int = 10, vpn_mode=False, allowed_country="Taiwan") -> list[dict]:
-    df = get_login_logs()
+
+def _window_alerts(results: RuleResults, limit: int) -> list[dict]:
+    """The `limit` heaviest keys every windowed rule fired for."""
+    alerts = []
+    for rule in results.rules:
+        for key, n, first, last in results.fired[rule.name].head(limit).itertuples(index=False):
+            # a windowed alert is one ongoing episode: same id while the key keeps firing
+            alerts.append(_alert(rule.name, key, rule.message.format(key=key, value=n), n, first, last,
+                                 id_=f"{rule.name}|{key}"))
+    return alerts
+
+
+@timed()
+def get_recent_alerts(limit: int = 10, vpn_mode=False, allowed_country="Taiwan",
+                      df: pd.DataFrame | None = None,
+                      travel: TravelTracker | None = None,
+                      results: RuleResults | None = None) -> list[dict]:
+    """
+    The `limit` most important alerts: highest severity first, then most
+    recently seen. Every alert is one (rule, key, episode) with a count and
+    first/last seen, so a noisy IP is one entry rather than one per login.
+    No rule builds more than `limit` alerts.
+
+    Windowed alerts (failed logins, credential stuffing, ...) come from the
+    rules' `results` (evaluated on `df` unless given, e.g. shared with the
+    KPIs), impossible-travel alerts from `travel` (the shared cache's one by
+    default, or one built from `df`); country alerts are grouped from the
+    login rows of the last COUNTRY_ALERT_WINDOW.
+    """
+    if df is None:
+        df = log_cache.get()
+        travel = log_cache.travel
     if df.empty:
         return []
+    if results is None:
+        results = evaluate_rules(df)
+    if travel is None:
+        travel = TravelTracker.from_frame(df)
 
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
-    alerts = []
+    # failed logins per IP / user, same IP failing across users, ... (within the window)
+    alerts = _window_alerts(results, limit)
 
-    # multiple failed login attempts from the same IP
-    failed_df = df[df["login_result"] == False]
-    fail_counts = failed_df.groupby("ip_address").size()
-    for ip, count in fail_counts.items():
-        if count >= 5:
-            alerts.append({
-                "title": "Multiple Failed Login Attempts",
-                "body": f"{count} failed login attempts from IP {ip}",
-                "icon": "bi bi-shield-lock-fill",
-                "ts": "just now",
-            })
-
-    # suspicious country login (if VPN mode is OFF)
+    # suspicious country login (if VPN mode is OFF), one alert per IP and episode
     if not vpn_mode:
-        for _, row in df.iterrows():
-            ip = row["ip_address"]
-            country = resolve_country(ip)
-            if country != allowed_country and country != "Unknown":
-                alerts.append({
-                    "title": "Suspicious Country Login",
-                    "body": f"Login from {country} (IP {ip}) outside expected region",
-                    "icon": "bi bi-exclamation-triangle-fill",
-                    "ts": row["timestamp"].strftime("%Y-%m-%d %H:%M"),
-                })
-
-    # same IP failing across multiple users
-    multi_user_fails = failed_df.groupby("ip_address")["uid"].nunique()
-    for ip, uid_count in multi_user_fails.items():
-        if uid_count >= 3:
-            alerts.append({
-                "title": "Credential Stuffing Suspected",
-                "body": f"{uid_count} different users had failed logins from IP {ip}",
-                "icon": "bi bi-person-x-fill",
-                "ts": "just now",
-            })
-
-    return alerts[:limit]
+        # a slice off the end of the time-ordered frame, not a pass over all history
+        recent = window_rows(df, pd.Timedelta(COUNTRY_ALERT_WINDOW))
+        ips = recent["ip_address"]
+        countries = lookup_countries(ips)
+        foreign = np.asarray((countries != allowed_country) & (countries != UNKNOWN))
+        if foreign.any():
+            episodes = _episodes(ips[foreign].astype(object), recent.loc[foreign, "timestamp"]).nlargest(limit, "last_seen")
+            alerts.extend(
+                _alert(
+                    "foreign_country", ip,
+                    f"Login from {country} (IP {ip}) outside expected region" + (f", {n:,} logins" if n > 1 else ""),
+                    n, first, last,
+                )
+                for (ip, n, first, last), country in zip(
+                    episodes.itertuples(index=False), lookup_countries(episodes["key"])
+                )
+            )
+
+    # same user logging in from places too far apart for the time between (if VPN mode is OFF)
+    if not vpn_mode:
+        hops = travel.recent()
+        if not hops.empty:
+            episodes = _episodes(hops["uid"], hops["to_ts"]).nlargest(limit, "last_seen")
+            latest = hops.sort_values("to_ts", kind="stable").drop_duplicates("uid", keep="last").set_index("uid")
+            for uid, n, first, last in episodes.itertuples(index=False):
+                hop = latest.loc[uid]
+                minutes = (hop["to_ts"] - hop["from_ts"]).total_seconds() / 60
+                body = (f"User {uid} logged in from {hop['from_country']} → {hop['to_country']}, "
+                        f"{hop['distance_km']:,.0f} km in {minutes:.0f} min")
+                if n > 1:
+                    body += f" ({n} impossible hops)"
+                alerts.append(_alert("impossible_travel", uid, body, n, first, last))
+
+    alerts.sort(key=lambda a: (a["severity"], a["last_seen"]), reverse=True)
+    alerts = alerts[:limit]
+    for a in alerts:
+        a["last_seen"] = a["last_seen"].strftime("%Y-%m-%d %H:%M")
+    return alerts
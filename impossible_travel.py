@@ -0,0 +1,137 @@
+import threading
+from collections import deque
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from geoip import lookup_coords, lookup_countries
+
+# Faster than this between two successful logins of one user is not physically possible
+MAX_SPEED_KMH = 1000.0
+# Hops shorter than this are ignored (country-level locations are too coarse)
+MIN_DISTANCE_KM = 500.0
+# How long flagged hops count as "recent" (event time, like the failed-login rules)
+TRAVEL_WINDOW = timedelta(hours=24)
+EARTH_RADIUS_KM = 6371.0
+
+FLAG_COLUMNS = ["uid", "from_ts", "to_ts", "from_ip", "to_ip", "from_country", "to_country", "distance_km", "speed_kmh"]
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance between coordinate arrays, in km."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _hops(uid, ts, lat, lon, ip, country, max_speed, min_distance) -> pd.DataFrame:
+    """Flag consecutive pairs of already (uid, ts)-sorted arrays."""
+    same_user = uid[1:] == uid[:-1]
+    distance = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    hours = (ts[1:] - ts[:-1]).astype("timedelta64[ns]").astype(np.int64) / 3.6e12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(hours > 0, distance / hours, np.inf)
+    hit = np.flatnonzero(same_user & (distance >= min_distance) & (speed > max_speed))
+    return pd.DataFrame({
+        "uid": uid[hit + 1],
+        "from_ts": pd.to_datetime(ts[hit], utc=True),
+        "to_ts": pd.to_datetime(ts[hit + 1], utc=True),
+        "from_ip": ip[hit],
+        "to_ip": ip[hit + 1],
+        "from_country": country[hit],
+        "to_country": country[hit + 1],
+        "distance_km": distance[hit].round(0),
+        "speed_kmh": speed[hit].round(0),
+    }, columns=FLAG_COLUMNS)
+
+
+def _located_logins(df: pd.DataFrame) -> pd.DataFrame:
+    """Successful logins with a known location, as plain columns."""
+    ok = df.loc[df["login_result"].astype(bool), ["uid", "timestamp", "ip_address"]]
+    lat, lon = lookup_coords(ok["ip_address"])
+    located = ~np.isnan(lat)
+    return pd.DataFrame({
+        "uid": ok["uid"].to_numpy()[located],
+        "ts": pd.to_datetime(ok["timestamp"], utc=True).values[located],
+        "lat": lat[located],
+        "lon": lon[located],
+        "ip": ok["ip_address"].astype(object).to_numpy()[located],
+        "country": np.asarray(lookup_countries(ok["ip_address"]), dtype=object)[located],
+    })
+
+
+def _sorted_hops(logins: pd.DataFrame, max_speed: float, min_distance: float) -> pd.DataFrame:
+    # one O(n log n) sort by (uid, ts), then every comparison is a vectorized neighbour diff
+    order = np.lexsort((logins["ts"].to_numpy(), logins["uid"].to_numpy()))
+    cols = {c: logins[c].to_numpy()[order] for c in logins.columns}
+    return _hops(cols["uid"], cols["ts"], cols["lat"], cols["lon"], cols["ip"], cols["country"],
+                 max_speed, min_distance)
+
+
+def find_impossible_travel(df: pd.DataFrame, max_speed: float = MAX_SPEED_KMH,
+                           min_distance: float = MIN_DISTANCE_KM) -> pd.DataFrame:
+    """Every hop between consecutive successful logins of a user that is too fast to travel."""
+    if df.empty:
+        return pd.DataFrame(columns=FLAG_COLUMNS)
+    return _sorted_hops(_located_logins(df), max_speed, min_distance)
+
+
+class TravelTracker:
+    """
+    Streaming impossible-travel check.
+
+    Only each user's last located login is kept, so a new batch is compared
+    against that plus itself: O(1) state per user, no rescans. Flagged hops
+    stay queryable for `window` of event time.
+    """
+
+    def __init__(self, max_speed: float = MAX_SPEED_KMH, min_distance: float = MIN_DISTANCE_KM,
+                 window: timedelta = TRAVEL_WINDOW):
+        self.max_speed = max_speed
+        self.min_distance = min_distance
+        self.window = pd.Timedelta(window)
+        self._last: dict = {}     # uid -> (ts, lat, lon, ip, country)
+        self._flags: deque = deque()
+        self.watermark: pd.Timestamp | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **kwargs) -> "TravelTracker":
+        tracker = cls(**kwargs)
+        tracker.add_batch(df)
+        return tracker
+
+    def add_batch(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Fold in new rows; returns the hops they flagged."""
+        if df.empty:
+            return pd.DataFrame(columns=FLAG_COLUMNS)
+        logins = _located_logins(df)
+        with self._lock:
+            # each user's previous location goes in front as a virtual row
+            previous = [(uid, *self._last[uid]) for uid in pd.unique(logins["uid"]) if uid in self._last]
+            if previous:
+                logins = pd.concat(
+                    [pd.DataFrame(previous, columns=["uid", "ts", "lat", "lon", "ip", "country"]), logins],
+                    ignore_index=True,
+                )
+            flags = _sorted_hops(logins, self.max_speed, self.min_distance)
+
+            latest = logins.sort_values("ts", kind="stable").drop_duplicates("uid", keep="last")
+            for uid, ts, lat, lon, ip, country in latest.itertuples(index=False):
+                if uid not in self._last or ts >= self._last[uid][0]:
+                    self._last[uid] = (ts, lat, lon, ip, country)
+
+            newest = pd.to_datetime(df["timestamp"], utc=True).max()
+            if self.watermark is None or newest > self.watermark:
+                self.watermark = newest
+            self._flags.extend(flags.itertuples(index=False))
+            cutoff = self.watermark - self.window
+            while self._flags and self._flags[0].to_ts <= cutoff:
+                self._flags.popleft()
+        return flags
+
+    def recent(self) -> pd.DataFrame:
+        """Hops flagged within the window, newest last."""
+        with self._lock:
+            return pd.DataFrame(list(self._flags), columns=FLAG_COLUMNS)
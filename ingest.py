@@ -0,0 +1,262 @@
+import io
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+
+import pandas as pd
+
+from csv_helper import upload_logs
+from log_cache import log_cache
+
+# Shared secret for POST /ingest ("Authorization: Bearer <token>"); unset = no auth
+INGEST_TOKEN = os.getenv("AUTHWATCH_INGEST_TOKEN")
+INGEST_MAX_BYTES = 32 * 1024 * 1024     # per request, after decompression
+QUEUE_MAX_ROWS = 500_000                # buffered rows before POSTs get 429
+FLUSH_ROWS = 20_000                     # rows per bulk write
+FLUSH_INTERVAL = 1.0                    # seconds a partial batch may wait
+WRITERS = 2                             # background writer threads
+INVALIDATE_INTERVAL = 5.0               # seconds between log cache refreshes forced by writes
+
+REQUIRED_COLUMNS = ["uid", "timestamp", "ip_address", "login_result"]
+_TRUE = {"true", "1", "t", "yes", "success"}
+_FALSE = {"false", "0", "f", "no", "failure", "failed"}
+
+
+class BatchError(ValueError):
+    """The request body is not a usable batch (answered with a 4xx)."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def read_body(stream, limit: int = INGEST_MAX_BYTES) -> bytes:
+    """
+    Read a request body of at most `limit` bytes. Chunked requests have no
+    Content-Length to check up front, so the limit is enforced while reading.
+    """
+    chunks, size = [], 0
+    while chunk := stream.read(64 * 1024):
+        size += len(chunk)
+        if size > limit:
+            raise BatchError(f"Batch is over {limit:,} bytes", status=413)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _decompress(body: bytes, encoding: str | None) -> bytes:
+    if encoding == "gzip" or body[:2] == b"\x1f\x8b":
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(body, INGEST_MAX_BYTES)
+        except zlib.error as e:
+            raise BatchError(f"Invalid gzip body: {e}")
+        if inflater.unconsumed_tail:
+            raise BatchError(f"Batch is over {INGEST_MAX_BYTES:,} bytes uncompressed", status=413)
+    elif encoding not in (None, "", "identity"):
+        raise BatchError(f"Unsupported Content-Encoding {encoding!r}", status=415)
+    return body
+
+
+def _clean_column(name) -> str:
+    return str(name).strip().lower().replace(" ", "_")
+
+
+def _read_ndjson(body: bytes) -> pd.DataFrame:
+    try:
+        import pyarrow as pa
+        import pyarrow.json as pa_json
+    except ImportError:
+        return pd.DataFrame.from_records([json.loads(line) for line in body.splitlines() if line.strip()])
+    # pyarrow's reader is several times faster than pd.read_json; timestamps stay strings so
+    # offsets and fractions are parsed by us, the same way as for CSV. The schema has to use
+    # the shipper's own key ("Timestamp", ...), so take it from the first record.
+    try:
+        first = json.loads(next(line for line in body.splitlines() if line.strip()))
+    except (StopIteration, ValueError):
+        first = {}  # let pyarrow report it
+    keys = [key for key in first if _clean_column(key) == "timestamp"] if isinstance(first, dict) else []
+    options = pa_json.ParseOptions(explicit_schema=pa.schema([(key, pa.string()) for key in keys]),
+                                   unexpected_field_behavior="infer")
+    return pa_json.read_json(io.BytesIO(body), parse_options=options).to_pandas()
+
+
+def _parse_result(values: pd.Series, first_row: int = 0) -> pd.Series:
+    if pd.api.types.is_bool_dtype(values):
+        return values
+    text = values.astype(str).str.strip().str.lower()
+    ok, failed = text.isin(_TRUE), text.isin(_FALSE)
+    if not (ok | failed).all():
+        row = int((~(ok | failed)).to_numpy().argmax())
+        raise BatchError(f"Row {first_row + row}: login_result must be true/false, got {values.iloc[row]!r}")
+    return ok
+
+
+def parse_batch(body: bytes, content_type: str | None = None, encoding: str | None = None) -> pd.DataFrame:
+    """
+    Request body (NDJSON or CSV, optionally gzipped) -> validated login rows.
+
+    The format comes from the Content-Type (`application/x-ndjson` /
+    `application/json` or `text/csv`) and is sniffed when it is missing.
+    Column names are cleaned the same way as on the upload page. Any bad row
+    rejects the whole batch, so shippers can simply resend it.
+    """
+    body = _decompress(body, encoding)
+    if not body.strip():
+        raise BatchError("Empty batch")
+
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    is_json = "json" in content_type or (not content_type.endswith("csv") and body.lstrip()[:1] == b"{")
+    try:
+        if is_json:
+            df = _read_ndjson(body)
+        else:
+            df = pd.read_csv(io.BytesIO(body))
+    except ValueError as e:
+        raise BatchError(f"Could not parse {'NDJSON' if is_json else 'CSV'} batch: {e}")
+    try:
+        return normalize_batch(df)
+    except BatchError:
+        raise
+    except (ValueError, TypeError) as e:
+        raise BatchError(f"Invalid batch: {e}")
+
+
+def normalize_batch(df: pd.DataFrame, first_row: int = 0) -> pd.DataFrame:
+    """
+    Clean column names and validate/convert the required columns of parsed
+    rows, in place. `first_row` is where `df` starts in its file, so errors
+    point at the right row when a file is checked chunk by chunk.
+    """
+    df.columns = [_clean_column(col) for col in df.columns]
+    duplicated = sorted(set(df.columns[df.columns.duplicated()]))
+    if duplicated:
+        raise BatchError(f"Duplicate columns after cleaning names: {', '.join(duplicated)}")
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise BatchError(f"Missing columns: {', '.join(missing)}")
+
+    uid = pd.to_numeric(df["uid"], errors="coerce")
+    ts = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601", errors="coerce")
+    # 12.7 would silently become user 12 (and inf has no integer at all)
+    bad_uid = uid.isna() | (uid % 1 != 0)
+    for name, bad in (("uid", bad_uid), ("timestamp", ts.isna()), ("ip_address", df["ip_address"].isna())):
+        if bad.any():
+            row = int(bad.to_numpy().argmax())
+            raise BatchError(f"Row {first_row + row}: invalid {name} {str(df[name].iloc[row])!r}")
+
+    df["uid"] = uid.astype("int64")
+    df["timestamp"] = ts
+    df["login_result"] = _parse_result(df["login_result"], first_row)
+    return df
+
+
+class IngestQueue:
+    """
+    Bounded buffer between POST /ingest and storage.
+
+    Requests only parse, validate and enqueue; `put` refuses a batch once
+    `max_rows` are waiting (the endpoint turns that into a 429). Writer
+    threads drain the queue in bulk, i.e. `flush_rows` rows or whatever
+    has waited `flush_interval` seconds, through `upload_logs`. Written
+    rows invalidate the log cache at most once per `invalidate_interval`
+    (the last write is always followed by one), since every invalidation
+    means a backend fetch and, with several workers, a new shared snapshot.
+    """
+
+    def __init__(self, max_rows: int = QUEUE_MAX_ROWS, flush_rows: int = FLUSH_ROWS,
+                 flush_interval: float = FLUSH_INTERVAL, writers: int = WRITERS,
+                 invalidate_interval: float = INVALIDATE_INTERVAL):
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.writers = writers
+        self.invalidate_interval = invalidate_interval
+        self.stats = {"accepted_rows": 0, "rejected_batches": 0, "written_rows": 0, "failed_rows": 0}
+        self._frames: deque = deque()
+        self._rows = 0
+        self._oldest = 0.0
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def pending_rows(self) -> int:
+        return self._rows
+
+    def put(self, df: pd.DataFrame) -> bool:
+        """Queue a validated batch; False (nothing queued) when the buffer is full."""
+        with self._cond:
+            if self._rows + len(df) > self.max_rows:
+                self.stats["rejected_batches"] += 1
+                return False
+            if not self._frames:
+                self._oldest = time.monotonic()
+            self._frames.append(df)
+            self._rows += len(df)
+            self.stats["accepted_rows"] += len(df)
+            self._start_writers()
+            # first frame: start a writer's flush_interval clock; full batch: write it now
+            if len(self._frames) == 1 or self._rows >= self.flush_rows:
+                self._cond.notify()
+        return True
+
+    def _start_writers(self) -> None:
+        # called with the condition held
+        if not self._threads:
+            self._threads = [
+                threading.Thread(target=self._write_loop, name=f"ingest-writer-{i}", daemon=True)
+                for i in range(self.writers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _take(self) -> pd.DataFrame:
+        """Wait for a full batch (or an old partial one) and take it off the queue."""
+        with self._cond:
+            while True:
+                waited = time.monotonic() - self._oldest
+                if self._rows >= self.flush_rows or (self._frames and waited >= self.flush_interval):
+                    break
+                self._cond.wait(self.flush_interval - waited if self._frames else None)
+            frames, rows = [], 0
+            while self._frames and rows < self.flush_rows:
+                frames.append(self._frames.popleft())
+                rows += len(frames[-1])
+            self._rows -= rows
+            self._oldest = time.monotonic()
+            if self._rows >= self.flush_rows:
+                self._cond.notify()  # still a full batch waiting, wake another writer
+        return pd.concat(frames, ignore_index=True)
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = self._take()
+            try:
+                result = upload_logs(batch)
+                written = result["uploaded"]
+            except Exception as e:
+                print(f"Ingest: writing {len(batch)} rows failed: {e}")
+                written = 0
+            with self._cond:
+                self.stats["written_rows"] += written
+                self.stats["failed_rows"] += len(batch) - written
+            if written:
+                log_cache.invalidate_soon(self.invalidate_interval)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until everything queued so far has been handed to storage (for tests / shutdown)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                done = self.stats["written_rows"] + self.stats["failed_rows"]
+                if not self._frames and done >= self.stats["accepted_rows"]:
+                    return True
+                self._cond.notify_all()
+            time.sleep(0.01)
+        return False
+
+
+ingest_queue = IngestQueue()
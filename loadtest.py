@@ -0,0 +1,351 @@
+"""
+Load test of the Dash callbacks with many concurrent dashboard users.
+
+    python loadtest.py --users 50 --duration 60 --rows 1000000 --output load.json
+    python loadtest.py --url http://localhost:8080 --users 50      # a server that is already running
+
+Without --url a server is started in a subprocess, on a throwaway local
+Parquet store seeded with --rows generated logins (benchmark.make_dataset).
+Every simulated user is a thread with its own HTTP session and settings. It
+loops over a weighted mix of what an analyst does, sent to
+/_dash-update-component the way the browser sends it: opening the dashboard,
+the alerts page or the settings page, changing settings, and changing the
+dashboard filters. Throughput and p50/p95/p99 latency are reported per
+callback and overall, as JSON like benchmark.py, so two runs can be diffed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import requests
+
+# action -> weight in the mix of what a simulated user does next
+ACTIONS = {"dashboard": 5, "alerts": 2, "settings": 1, "filters": 2}
+COUNTRIES = ["Taiwan", "USA", "Japan", "Germany"]
+TIME_RANGES = ["all", "1h", "24h", "7d"]
+# callback -> its first output, which is how the dependency list identifies it
+CALLBACKS = {
+    "render_page": "page-content.children",
+    "show_alerts": "alerts-list.children",
+    "save_settings": "settings-store.data",
+    "save_filters": "dashboard-filters.data",
+}
+STARTUP_TIMEOUT = 600       # seconds for a spawned server to load its logs
+
+_SERVER = """
+import sys
+import app
+app.log_cache.start_warm_up()
+app.server.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)
+"""
+
+
+###############################################################################
+# Dash callback client
+###############################################################################
+class DashClient:
+    """Calls Dash callbacks over HTTP, with payloads built from the app's own /_dash-dependencies."""
+
+    def __init__(self, url: str, dependencies: list, timeout: float = 120):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        by_output = {dep["output"].strip(".").split("...")[0]: dep for dep in dependencies}
+        self._deps = {name: by_output[output] for name, output in CALLBACKS.items()}
+
+    @staticmethod
+    def _payload(dep: dict, values: dict, changed: list) -> dict:
+        def props(items):
+            return [{**item, "value": values.get(f"{item['id']}.{item['property']}")} for item in items]
+
+        outputs = [dict(zip(("id", "property"), o.rsplit(".", 1))) for o in dep["output"].strip(".").split("...")]
+        return {
+            "output": dep["output"],
+            "outputs": outputs if dep["output"].startswith("..") else outputs[0],
+            "inputs": props(dep["inputs"]),
+            "state": props(dep.get("state", [])),
+            "changedPropIds": changed,
+        }
+
+    def call(self, callback: str, values: dict, changed: list) -> tuple[float, int]:
+        """(seconds, HTTP status) of one callback request; 204 is a PreventUpdate."""
+        payload = self._payload(self._deps[callback], values, changed)
+        started = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.url}/_dash-update-component", json=payload, timeout=self.timeout)
+            response.content  # noqa: B018  (the body is part of the latency)
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+        return time.perf_counter() - started, status
+
+
+###############################################################################
+# Simulated users
+###############################################################################
+class User:
+    """One analyst: own settings and filters, picking actions at random with think time in between."""
+
+    def __init__(self, client: DashClient, seed: int, think: float):
+        self.client = client
+        self.rng = random.Random(seed)
+        self.think = think
+        self.settings = {"vpn_mode": False, "dark_mode": False, "country": "Taiwan"}
+        self.filters = None
+        self.samples: list[tuple[str, float, int]] = []
+
+    def _call(self, label: str, callback: str, values: dict, changed: list) -> None:
+        seconds, status = self.client.call(callback, values, changed)
+        self.samples.append((label, seconds, status))
+
+    def open_page(self, path: str) -> None:
+        self._call(f"render_page {path}", "render_page", {
+            "url.pathname": path,
+            "settings-store.data": self.settings,
+            "dashboard-filters.data": self.filters,
+        }, ["url.pathname"])
+
+    def dashboard(self) -> None:
+        self.open_page("/")
+
+    def alerts(self) -> None:
+        self.open_page("/alerts")
+        self._call("show_alerts", "show_alerts", {
+            "alerts-rule.value": self.rng.choice([None, "failed_logins", "credential_stuffing", "impossible_travel"]),
+            "alerts-sort.value": self.rng.choice(["last_seen", "first_seen"]),
+            "settings-store.data": self.settings,
+        }, ["alerts-rule.value"])
+
+    def change_settings(self) -> None:
+        self.open_page("/settings")
+        settings = {
+            "vpn_mode": self.rng.random() < 0.3,
+            "dark_mode": self.rng.random() < 0.5,
+            "country": self.rng.choice(COUNTRIES),
+        }
+        self._call("save_settings", "save_settings", {
+            "vpn-mode.value": settings["vpn_mode"],
+            "dark-mode.value": settings["dark_mode"],
+            "country-select.value": settings["country"],
+            "settings-store.data": self.settings,
+        }, ["vpn-mode.value"])
+        self.settings = settings
+        # the new store value re-renders the page, as in the browser
+        self._call("render_page /settings", "render_page", {
+            "url.pathname": "/settings",
+            "settings-store.data": self.settings,
+            "dashboard-filters.data": self.filters,
+        }, ["settings-store.data"])
+
+    def change_filters(self) -> None:
+        filters = {
+            "range": self.rng.choice(TIME_RANGES),
+            "start_date": None,
+            "end_date": None,
+            "failed_only": self.rng.random() < 0.3,
+            "country": self.rng.choice([None, None, *COUNTRIES]),
+            "live": False,
+        }
+        self._call("save_filters", "save_filters", {
+            "time-range.value": filters["range"],
+            "failed-only.value": filters["failed_only"],
+            "country-filter.value": filters["country"],
+            "live-mode.value": filters["live"],
+            "dashboard-filters.data": self.filters,
+        }, ["time-range.value"])
+        self.filters = filters
+        self._call("render_page /", "render_page", {
+            "url.pathname": "/",
+            "settings-store.data": self.settings,
+            "dashboard-filters.data": self.filters,
+        }, ["dashboard-filters.data"])
+
+    def run(self, deadline: float) -> None:
+        actions = {"dashboard": self.dashboard, "alerts": self.alerts,
+                   "settings": self.change_settings, "filters": self.change_filters}
+        names, weights = list(ACTIONS), list(ACTIONS.values())
+        while time.monotonic() < deadline:
+            actions[self.rng.choices(names, weights)[0]]()
+            if self.think > 0:
+                time.sleep(self.rng.expovariate(1 / self.think))
+
+
+def run_users(url: str, dependencies: list, users: int, duration: float, think: float, ramp_up: float,
+              seed: int = 0) -> tuple[list, float]:
+    """Run `users` threads for `duration` seconds; (samples, wall seconds)."""
+    # a client (HTTP session, i.e. keep-alive connection) per user, like separate browsers
+    simulated = [User(DashClient(url, dependencies), seed + i, think) for i in range(users)]
+    started = time.monotonic()
+    deadline = started + duration
+    threads = []
+    for i, user in enumerate(simulated):
+        # stagger the starts so the first requests don't all land at once
+        delay = ramp_up * i / max(users, 1)
+        thread = threading.Thread(target=lambda u=user, d=delay: (time.sleep(d), u.run(deadline)), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    samples = [sample for user in simulated for sample in user.samples]
+    return samples, time.monotonic() - started
+
+
+###############################################################################
+# Report
+###############################################################################
+def _stats(seconds: list, errors: int, wall: float) -> dict:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "rps": len(ms) / wall if wall > 0 else None,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else None,
+        "p95_ms": float(np.percentile(ms, 95)) if len(ms) else None,
+        "p99_ms": float(np.percentile(ms, 99)) if len(ms) else None,
+        "max_ms": float(ms.max()) if len(ms) else None,
+    }
+
+
+def summarize(samples: list, wall: float) -> dict:
+    """Overall and per-callback throughput and latency; errors are HTTP >= 400 or no response."""
+    by_label: dict = {}
+    for label, seconds, status in samples:
+        by_label.setdefault(label, []).append((seconds, status))
+    summary = {
+        label: _stats([s for s, _ in rows], sum(1 for _, st in rows if st == 0 or st >= 400), wall)
+        for label, rows in sorted(by_label.items())
+    }
+    summary["all"] = _stats([s for _, s, _ in samples], sum(1 for *_, st in samples if st == 0 or st >= 400), wall)
+    return summary
+
+
+def print_table(summary: dict) -> None:
+    print(f"{'callback':<26}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for label, s in summary.items():
+        if not s["requests"]:
+            continue
+        print(f"{label:<26}{s['requests']:>9}{s['errors']:>8}{s['rps']:>8.1f}"
+              f"{s['p50_ms']:>9.0f}{s['p95_ms']:>9.0f}{s['p99_ms']:>9.0f}{s['max_ms']:>9.0f}")
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+###############################################################################
+# Local server on a seeded Parquet store
+###############################################################################
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_dir: str, rows: int, seed: int) -> tuple[subprocess.Popen, str]:
+    """Seed a Parquet store in `data_dir` and serve the app from it; returns (process, url) once ready."""
+    from benchmark import make_dataset  # imports the app, only needed here
+    from storage import ParquetBackend
+
+    ParquetBackend(data_dir).insert(make_dataset(rows, seed=seed))
+    port = _free_port()
+    env = dict(os.environ, AUTHWATCH_STORAGE="parquet", AUTHWATCH_DATA_DIR=data_dir)
+    process = subprocess.Popen([sys.executable, "-c", _SERVER, str(port)], env=env,
+                               cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    wait_ready(url, process)
+    return process, url
+
+
+def wait_ready(url: str, process: subprocess.Popen | None = None, timeout: float = STARTUP_TIMEOUT) -> None:
+    """Block until /ready says the logs are loaded (not just a snapshot)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode} before it was ready")
+        try:
+            response = requests.get(f"{url}/ready", timeout=5)
+            if response.status_code == 200 and response.json().get("ready"):
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="test this running server instead of starting one")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--think", type=float, default=1.0, help="mean pause between a user's actions, seconds")
+    parser.add_argument("--ramp-up", type=float, default=5, help="seconds over which users start")
+    parser.add_argument("--rows", type=int, default=100_000, help="generated login rows for the spawned server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p95-ms", type=float, help="exit 1 when the overall p95 is above this")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    process, tmp = None, None
+    try:
+        if args.url:
+            url = args.url.rstrip("/")
+            wait_ready(url)
+        else:
+            tmp = tempfile.TemporaryDirectory()
+            process, url = start_server(tmp.name, args.rows, args.seed)
+
+        dependencies = requests.get(f"{url}/_dash-dependencies", timeout=30).json()
+        samples, wall = run_users(url, dependencies, args.users, args.duration, args.think, args.ramp_up, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if tmp is not None:
+            tmp.cleanup()
+
+    summary = summarize(samples, wall)
+    report = {
+        "meta": {
+            "started": datetime.now(timezone.utc).isoformat(),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "url": args.url,
+            "rows": None if args.url else args.rows,
+            "users": args.users,
+            "duration_s": wall,
+            "think_s": args.think,
+            "mix": ACTIONS,
+        },
+        "results": summary,
+    }
+    print_table(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+
+    p95 = summary["all"]["p95_ms"]
+    if args.max_p95_ms is not None and (p95 is None or p95 > args.max_p95_ms):
+        print(f"p95 {p95:.0f} ms is over the {args.max_p95_ms:.0f} ms budget" if p95 else "No requests completed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
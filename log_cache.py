@@ -0,0 +1,340 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from csv_helper import get_login_logs, fetch_new_logs, compact_logs, concat_logs
+from sliding_window import SlidingWindowDetector
+from rollups import LoginRollups
+from impossible_travel import TravelTracker
+from storage import DATA_DIR, INSERT_KEY
+from alerts_store import get_alert_store
+from metrics import inc
+from shared_snapshot import SHARED_SNAPSHOT, open_shared_snapshot
+
+# Columns every reader of the cache (KPIs, charts, alert rules) needs
+LOG_COLUMNS = ["uid", "timestamp", "ip_address", "login_result", "browser", "device"]
+TTL_SECONDS = 60
+# Last loaded frame on local disk, served while a fresh process warms up ("" turns it off)
+SNAPSHOT_PATH = os.getenv("AUTHWATCH_SNAPSHOT", os.path.join(DATA_DIR, "snapshot.parquet"))
+SNAPSHOT_INTERVAL = 300     # seconds between snapshot writes
+WARM_UP_MAX_BACKOFF = 60    # seconds between warm-up retries, at most
+_CURSOR_KEY = b"authwatch_cursor"   # snapshot metadata: the storage cursor its rows were read up to
+
+
+class LogCache:
+    """
+    Process-wide copy of login_logs shared by the dashboard and alert pages.
+
+    The first `get()` loads the table; after that the frame is only refreshed
+    (incrementally: rows inserted since the storage cursor, appended in
+    arrival order) once `ttl` seconds have passed or after
+    `invalidate()`. `version` goes up every time the data actually changes so
+    callers can key their own caches on it. New rows are also fed to
+    `detector`, `travel` and `rollups`, so the alert rules and the dashboard
+    aggregates never rescan the table.
+
+    `start_warm_up()` does the first load on a background thread instead,
+    starting from the on-disk snapshot when there is one. Until it is done,
+    `get()` serves the snapshot and `available` tells pages whether there is
+    anything to show at all.
+
+    With `shared` (several server workers), the frame lives in a
+    memory-mapped SharedSnapshot: whichever worker refreshes publishes a new
+    version and the others map it instead of loading their own copy. Each
+    worker still feeds the new rows to its own detectors and rollups.
+    """
+
+    def __init__(self, columns: list[str] = LOG_COLUMNS, ttl: float = TTL_SECONDS,
+                 snapshot_path: str = SNAPSHOT_PATH, shared: bool = SHARED_SNAPSHOT):
+        self.columns = columns
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.version = 0
+        self._df: pd.DataFrame | None = None
+        self._cursor: dict | None = None    # where the next incremental fetch continues (see fetch_new_logs)
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+        self.detector = SlidingWindowDetector()
+        self.travel = TravelTracker()
+        self.rollups = LoginRollups()
+        self.ready = threading.Event()      # set once the backend has been read at least once
+        self.snapshot_time: datetime | None = None
+        self.warm_up_seconds: float | None = None
+        self._snapshot_saved: float | None = None
+        self._warm_up_thread: threading.Thread | None = None
+        self._warm_up_lock = threading.Lock()
+        self.shared = open_shared_snapshot() if shared else None
+        self._shared_version = 0
+        self._shared_stamp = None
+        self._published_at = 0.0
+        self._invalidated_at = 0.0
+        self._invalidate_timer: threading.Timer | None = None
+        self._invalidate_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """True once there is data to show (the backend's or the snapshot's)."""
+        return self._df is not None
+
+    @property
+    def rows(self) -> int:
+        """Rows in the cached frame (0 before the first load)."""
+        df = self._df
+        return 0 if df is None else len(df)
+
+    @property
+    def shared_version(self) -> int:
+        """The shared snapshot version this worker last mapped or published (0 without one)."""
+        return self._shared_version
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._df is not None
+            and not self._stale
+            and time.monotonic() - self._loaded_at < self.ttl
+            # one stat: has another worker published a newer version?
+            and (self.shared is None or self.shared.stamp() == self._shared_stamp)
+        )
+
+    def get(self) -> pd.DataFrame:
+        """Return the cached frame, refreshing it first if it is stale."""
+        if self._is_fresh():
+            inc("authwatch_cache_requests_total", cache="logs", result="hit")
+            return self._df
+        if self._df is not None and not self.ready.is_set():
+            inc("authwatch_cache_requests_total", cache="logs", result="snapshot")
+            return self._df  # still warming up: serve the snapshot rather than wait
+        inc("authwatch_cache_requests_total", cache="logs", result="miss")
+
+        with self._lock:
+            # another thread may have refreshed while we waited for the lock
+            if not self._is_fresh():
+                try:
+                    self._refresh()
+                except Exception as e:
+                    if self._df is None:
+                        raise
+                    # backend unreachable: keep serving what we have, try again after a TTL
+                    print(f"Refreshing login logs failed, serving cached rows: {e}")
+                    self._loaded_at = time.monotonic()
+                    self._stale = False
+            return self._df
+
+    def _refresh(self) -> None:
+        if self.shared is None:
+            self._refresh_from_backend()
+            return
+        with self.shared.lock():
+            loaded = self.shared.load(newer_than=self._shared_version)
+            if loaded is not None:
+                self._adopt(*loaded)
+            # a version another worker fetched less than a TTL ago is as good as our own query
+            if self._stale or self._df is None or time.time() - self._published_at >= self.ttl:
+                self._refresh_from_backend()
+            else:
+                self._loaded_at = time.monotonic()
+                self.ready.set()
+
+    def _adopt(self, pointer: dict, df: pd.DataFrame) -> None:
+        """Switch to a version published by some worker; only rows we haven't seen are ingested."""
+        self._shared_version = pointer["version"]
+        self._shared_stamp = self.shared.stamp()
+        if list(df.columns) != self.columns or pointer.get("cursor") is None:
+            return  # published by a worker with another column set (or without a cursor to continue from)
+        # every version is an earlier one plus appended rows (see _refresh_from_backend)
+        new_rows = df if self._df is None else df.iloc[len(self._df):]
+        if self._df is None or not new_rows.empty:
+            self.version += 1
+            self._ingest(new_rows, cursor=pointer["cursor"])
+        self._df = df
+        self._cursor = pointer["cursor"]
+        self._published_at = pointer["published_at"]
+
+    def _ingest(self, new_rows: pd.DataFrame, keys: pd.Series | None = None, cursor: dict | None = None) -> None:
+        """
+        Feed rows to the detectors and rollups. Rows fresh from the backend
+        come with their insert `keys`, so the alert store records each once;
+        published or snapshot rows (read up to `cursor`) were recorded by
+        whoever read them.
+        """
+        get_alert_store().ingest(new_rows, self.detector, self.travel, keys=keys, cursor=cursor,
+                                 history=self._history)
+        self.rollups.add_batch(new_rows)
+
+    def _history(self, start, end) -> pd.DataFrame:
+        """Cached rows with start < timestamp <= end (context for backfilled rows)."""
+        if self._df is None:
+            return pd.DataFrame(columns=self.columns)
+        ts = self._df["timestamp"]
+        return self._df[(ts > start) & (ts <= end)]
+
+    def _refresh_from_backend(self) -> None:
+        new_rows, cursor = fetch_new_logs(self._cursor if self._df is not None else None, columns=self.columns)
+        keys = new_rows.pop(INSERT_KEY)
+        self._cursor = cursor
+
+        changed = self._df is None or not new_rows.empty
+        df = self._df
+        if changed:
+            self.version += 1
+            self._ingest(new_rows, keys)
+            # new rows go at the end, in arrival order
+            df = new_rows if self._df is None else concat_logs(self._df, new_rows)
+        if changed and self.shared is not None:
+            # everyone (us included) switches to the mapped copy, our private frame is dropped
+            try:
+                pointer, df = self.shared.publish(df, cursor)
+                self._shared_version = pointer["version"]
+                self._shared_stamp = self.shared.stamp()
+                self._published_at = pointer["published_at"]
+            except Exception as e:
+                print(f"Could not publish shared login log snapshot: {e}")
+        self._df = df
+        self._loaded_at = time.monotonic()
+        self._stale = False
+        self.ready.set()
+        if changed and self._snapshot_due():
+            self._save_snapshot(df, cursor)
+
+    ###########################################################################
+    # Warm-up and on-disk snapshot
+    ###########################################################################
+    def start_warm_up(self) -> None:
+        """Load the logs on a background thread (once), so startup never waits on the backend."""
+        with self._warm_up_lock:
+            if self._warm_up_thread is None:
+                self._warm_up_thread = threading.Thread(target=self._warm_up, name="log-cache-warm-up", daemon=True)
+                self._warm_up_thread.start()
+
+    def _warm_up(self) -> None:
+        started = time.monotonic()
+        self._load_snapshot()
+        delay = 1.0
+        while not self.ready.is_set():
+            try:
+                with self._lock:
+                    # the snapshot (if any) is the starting point, only rows inserted since get fetched
+                    self._refresh()
+            except Exception as e:
+                print(f"Warm-up: loading login logs failed, retrying in {delay:.0f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, WARM_UP_MAX_BACKOFF)
+        self.warm_up_seconds = time.monotonic() - started
+        print(f"Warm-up done: {len(self._df)} login rows in {self.warm_up_seconds:.1f}s")
+
+    def _load_snapshot(self) -> None:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            import pyarrow.parquet as pq
+            table = pq.read_table(self.snapshot_path)
+            cursor = json.loads(table.schema.metadata.get(_CURSOR_KEY, b"null"))
+            df = compact_logs(table.to_pandas())
+        except Exception as e:  # unreadable, or pyarrow isn't installed
+            print(f"Ignoring login log snapshot {self.snapshot_path}: {e}")
+            return
+        if set(df.columns) != set(self.columns) or cursor is None:
+            return  # written with a different column set, or before snapshots kept their cursor
+        with self._lock:
+            if self._df is not None:
+                return
+            self._ingest(df, cursor=cursor)
+            self._df = df[self.columns]
+            self._cursor = cursor
+            self.version += 1
+            self.snapshot_time = datetime.fromtimestamp(os.path.getmtime(self.snapshot_path), timezone.utc)
+
+    def _snapshot_due(self) -> bool:
+        return bool(self.snapshot_path) and (
+            self._snapshot_saved is None or time.monotonic() - self._snapshot_saved >= SNAPSHOT_INTERVAL
+        )
+
+    def _save_snapshot(self, df: pd.DataFrame, cursor: dict) -> None:
+        self._snapshot_saved = time.monotonic()
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"  # several workers may share the path
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({**table.schema.metadata, _CURSOR_KEY: json.dumps(cursor).encode()})
+            pq.write_table(table, tmp)
+            os.replace(tmp, self.snapshot_path)
+        except Exception as e:
+            print(f"Could not write login log snapshot {self.snapshot_path}: {e}")
+
+    def invalidate(self) -> None:
+        """Force the next `get()` / `query_logs()` to pull new rows (e.g. after an upload)."""
+        self._stale = True
+        with _query_lock:
+            _query_cache.clear()
+
+    def invalidate_soon(self, interval: float) -> None:
+        """
+        `invalidate()` now, or once `interval` seconds have passed since the
+        last time, for writers that land rows batch by batch: every
+        invalidation means a backend fetch and, with several workers, a new
+        shared snapshot. The last write is always followed by one.
+        """
+        with self._invalidate_lock:
+            if self._invalidate_timer is not None:
+                return  # already scheduled, it will pick these rows up too
+            wait = self._invalidated_at + interval - time.monotonic()
+            if wait > 0:
+                self._invalidate_timer = threading.Timer(wait, self._invalidate_later)
+                self._invalidate_timer.daemon = True
+                self._invalidate_timer.start()
+                return
+            self._invalidated_at = time.monotonic()
+        self.invalidate()
+
+    def _invalidate_later(self) -> None:
+        with self._invalidate_lock:
+            self._invalidate_timer = None
+            self._invalidated_at = time.monotonic()
+        self.invalidate()
+
+
+log_cache = LogCache()
+
+
+###############################################################################
+# Filtered queries (time range / failed-only / country pushed into storage)
+###############################################################################
+QUERY_CACHE_SIZE = 16
+_query_cache: OrderedDict = OrderedDict()
+_query_lock = threading.Lock()
+
+
+def query_logs(start=None, end=None, failed_only: bool = False, country: str | None = None) -> pd.DataFrame:
+    """
+    Logs matching the dashboard filters. With no filters this is the shared
+    cache; otherwise the filters go to the backend and the (much smaller)
+    result is kept in a small LRU for `TTL_SECONDS` (cleared by
+    `log_cache.invalidate()`, so uploads show up straight away).
+    """
+    if start is None and end is None and not failed_only and country is None:
+        return log_cache.get()
+
+    key = (start, end, failed_only, country)
+    with _query_lock:
+        hit = _query_cache.get(key)
+        if hit is not None and time.monotonic() - hit[0] < TTL_SECONDS:
+            _query_cache.move_to_end(key)
+            inc("authwatch_cache_requests_total", cache="query", result="hit")
+            return hit[1]
+    inc("authwatch_cache_requests_total", cache="query", result="miss")
+
+    df = get_login_logs(columns=LOG_COLUMNS, start=start, end=end, failed_only=failed_only, country=country)
+
+    with _query_lock:
+        _query_cache[key] = (time.monotonic(), df)
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return df
@@ -0,0 +1,207 @@
+import cProfile
+import functools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Requests slower than this many ms get their cProfile stats written to PROFILE_DIR (0 = profiler off)
+PROFILE_SLOW_MS = float(os.getenv("AUTHWATCH_PROFILE_SLOW_MS", "0"))
+# Default: <AUTHWATCH_DATA_DIR>/profiles
+PROFILE_DIR = os.getenv("AUTHWATCH_PROFILE_DIR")
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: tuple) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}" if labels else ""
+
+
+class Registry:
+    """
+    Counters, histograms and gauges in Prometheus' text format.
+
+    Series are keyed by name plus sorted labels and updated under one lock,
+    which costs a dict lookup per call; `render()` is what `/metrics` serves.
+    Gauges are callbacks read at render time, so caches and queues don't
+    have to report their sizes on every change.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._help: dict = {}           # name -> (type, help)
+        self._counters: dict = {}       # (name, labels) -> value
+        self._histograms: dict = {}     # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self._gauges: dict = {}         # name -> callback returning a number or {labels: number}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, text: str) -> None:
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def gauge(self, name: str, callback, text: str = "") -> None:
+        self._gauges[name] = callback
+        self.describe(name, "gauge", text)
+
+    def value(self, name: str, **labels) -> float:
+        """Current value of a counter (for tests and scripts)."""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(series) for key, series in self._histograms.items()}
+
+        # name -> [(labels, lines)]; a histogram series keeps its lines in order (buckets, +Inf, _sum, _count)
+        by_name: dict = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, [f"{name}{_labels(labels)} {value:g}"]))
+        for (name, labels), series in histograms.items():
+            lines = []
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels((*labels, ('le', bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {series[-1]:g}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+            by_name.setdefault(name, []).append((labels, lines))
+        for name, callback in self._gauges.items():
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Metrics: gauge {name} failed: {e}")
+                continue
+            values = value.items() if isinstance(value, dict) else [((), value)]
+            by_name[name] = [(tuple(labels), [f"{name}{_labels(tuple(labels))} {v:g}"]) for labels, v in values]
+
+        out = []
+        for name in sorted(by_name):
+            kind, text = self._help.get(name, ("histogram" if any(k[0] == name for k in histograms) else "counter", ""))
+            if text:
+                out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            for _, lines in sorted(by_name[name], key=lambda item: _labels(item[0])):
+                out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+registry.describe("authwatch_function_seconds", "histogram", "Time spent in instrumented hot-path functions.")
+registry.describe("authwatch_function_errors_total", "counter", "Instrumented calls that raised.")
+registry.describe("authwatch_request_seconds", "histogram", "HTTP request latency; Dash updates by callback output.")
+registry.describe("authwatch_rows_fetched_total", "counter", "Login rows read from storage.")
+registry.describe("authwatch_storage_requests_total", "counter",
+                  "Storage round-trips (Supabase requests, Parquet file writes and scans).")
+registry.describe("authwatch_storage_bytes_total", "counter",
+                  "Bytes moved to/from storage (Supabase: JSON body size, Parquet: file size / decoded scan size).")
+registry.describe("authwatch_upload_rows_total", "counter", "Rows written from uploaded files.")
+registry.describe("authwatch_cache_requests_total", "counter", "Cache lookups by cache and result (hit/miss).")
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the block's wall time into `name` (seconds)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(function: str | None = None):
+    """Decorator: latency histogram and error count for one function."""
+    def decorate(fn):
+        label = function or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                inc("authwatch_function_errors_total", function=label)
+                raise
+            finally:
+                observe("authwatch_function_seconds", time.perf_counter() - started, function=label)
+        return wrapper
+    return decorate
+
+
+###############################################################################
+# Flask hooks: request latency and the slow-request profiler
+###############################################################################
+def _request_label(request) -> str:
+    if request.path == "/_dash-update-component":
+        body = request.get_json(silent=True) or {}
+        # "..a.children...b.figure.." (several outputs) -> "a"; "a.children" -> "a"
+        output = str(body.get("output", "")).strip(".")
+        return output.split(".", 1)[0] or "unknown"
+    return request.path
+
+
+def instrument_server(server) -> None:
+    """Time every request on the Flask `server`; profile slow ones when PROFILE_SLOW_MS is set."""
+    from flask import g, request
+
+    @server.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        if PROFILE_SLOW_MS > 0:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @server.teardown_request
+    def _stop_timer(_error=None):
+        started = g.pop("metrics_started", None)
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        label = _request_label(request)
+        observe("authwatch_request_seconds", elapsed, path=request.path,
+                callback=label if request.path == "/_dash-update-component" else "")
+        if profiler is not None and elapsed * 1000 >= PROFILE_SLOW_MS:
+            _dump_profile(profiler, label, elapsed)
+
+
+def _dump_profile(profiler: cProfile.Profile, label: str, elapsed: float) -> None:
+    # pstats files: `python -m pstats`, snakeviz, or flameprof / gprof2dot for flame graphs
+    from storage import DATA_DIR  # storage reports its own metrics, so not imported at the top
+    directory = PROFILE_DIR or os.path.join(DATA_DIR, "profiles")
+    name = re.sub(r"[^A-Za-z0-9_-]+", "_", label).strip("_") or "root"
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{elapsed * 1000:.0f}ms.prof")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"Slow request ({elapsed * 1000:.0f} ms, {label}): profile written to {path}")
+    except OSError as e:
+        print(f"Could not write profile {path}: {e}")
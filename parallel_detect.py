@@ -0,0 +1,149 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from rules import fired_in_window
+from sliding_window import ALERT_WINDOW, SlidingWindowDetector
+
+# Processes for partitioned detection (1 = everything stays in the calling thread)
+DETECT_WORKERS = int(os.getenv("AUTHWATCH_DETECT_WORKERS", os.cpu_count() or 1))
+# Below this many rows the process hop costs more than it saves
+PARALLEL_MIN_ROWS = 200_000
+# rule key column -> shared array the rows are partitioned on
+PARTITION_BY = {"ip_address": "ip", "uid": "uid"}
+
+
+###############################################################################
+# Shared memory: the failed rows as flat arrays, mapped by every worker
+###############################################################################
+def _share(arrays: dict) -> tuple[list, dict]:
+    blocks, spec = [], {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, arr.dtype, buffer=block.buf)[:] = arr
+        blocks.append(block)
+        spec[name] = (block.name, arr.dtype.str, arr.shape)
+    return blocks, spec
+
+
+def _attach(spec: dict) -> tuple[list, dict]:
+    blocks, arrays = [], {}
+    for name, (block_name, dtype, shape) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _release(blocks: list, unlink: bool = False) -> None:
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def _partition_frame(arrays: dict, by: str, part: int, parts: int) -> pd.DataFrame:
+    mask = arrays[by] % parts == part
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(arrays["ts"][mask], utc=True),
+        "ip_address": arrays["ip"][mask],
+        "uid": arrays["uid"][mask],
+        "login_result": False,
+    })
+
+
+###############################################################################
+# Worker side (top level, so the pool can pickle it)
+###############################################################################
+def _replay_fired(spec, by, part, parts, window, ends, rules, context_spec) -> dict:
+    """Replay one partition and keep, per fired (rule, key), (peak, first, last) pause time; IPs as codes."""
+    blocks, arrays = _attach(spec)
+    try:
+        frame = _partition_frame(arrays, by, part, parts)
+        detector = SlidingWindowDetector(window)
+        if context_spec is not None:
+            ctx_blocks, ctx = _attach(context_spec)
+            try:
+                detector.add_batch(_partition_frame(ctx, by, part, parts))
+            finally:
+                _release(ctx_blocks)
+    finally:
+        _release(blocks)
+
+    fired = {}
+    for end in detector.replay_to(frame, ends):
+        for key, n in fired_in_window(detector, rules).items():
+            peak, first, _ = fired.get(key, (0, end, end))
+            fired[key] = (max(peak, n), first, end)
+    return fired
+
+
+###############################################################################
+# Parent side
+###############################################################################
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the server has threads of its own, which fork doesn't mix well with
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+def replay_fired(df: pd.DataFrame, ends, rules: list, context: pd.DataFrame | None = None,
+                 window: timedelta = ALERT_WINDOW, workers: int = DETECT_WORKERS) -> dict:
+    """
+    Replay `df` pausing at `ends` (like `SlidingWindowDetector.replay_to`),
+    partitioned across processes by each rule's key (IP or UID). `context`
+    holds failures already in the window before `df` starts. Returns
+    {(rule, key): (peak count, first pause, last pause)} for every pause
+    where a rule fired.
+    """
+    ends = pd.to_datetime(ends, utc=True)
+    frames = [df] if context is None or context.empty else [context.assign(login_result=False), df]
+    # one ip code table for both, so a context failure and a new one from the same IP line up
+    ip_codes, ip_table = pd.factorize(pd.concat([f["ip_address"].astype(object) for f in frames], ignore_index=True))
+    offset = 0
+    shared, blocks = [], []
+    try:
+        for frame in frames:
+            part_codes = ip_codes[offset:offset + len(frame)]
+            offset += len(frame)
+            failed = ~frame["login_result"].astype(bool).to_numpy()
+            frame_blocks, spec = _share({
+                "ts": pd.to_datetime(frame["timestamp"], utc=True).values.view(np.int64)[failed],
+                "ip": part_codes.astype(np.int32)[failed],
+                "uid": frame["uid"].to_numpy(np.int64)[failed],
+            })
+            blocks += frame_blocks
+            shared.append(spec)
+        spec, context_spec = shared[-1], (shared[0] if len(shared) == 2 else None)
+
+        pool = _get_pool(workers)
+        by_key = {}
+        for rule in rules:
+            by_key.setdefault(rule.key, []).append(rule)
+        futures = [
+            (key, pool.submit(_replay_fired, spec, PARTITION_BY[key], part, workers, window, ends, key_rules,
+                              context_spec))
+            for key, key_rules in by_key.items() for part in range(workers)
+        ]
+        fired = {}
+        for key, future in futures:
+            for (rule, value_key), value in future.result().items():
+                fired[(rule, ip_table[value_key] if key == "ip_address" else value_key)] = value
+    finally:
+        _release(blocks, unlink=True)
+    return fired
@@ -0,0 +1,215 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from geoip import lookup_countries
+from sketches import HyperLogLog, TopK, hash64, estimate_counts
+
+# bucket name -> pandas frequency
+RESOLUTIONS = {"minute": "min", "hour": "h", "day": "D"}
+# how long each resolution is kept around (None = forever)
+RETENTION = {"minute": timedelta(days=2), "hour": timedelta(days=90), "day": None}
+# per-value breakdowns kept for every resolution
+DIMENSIONS = ["country", "device", "browser"]
+
+COUNT_COLUMNS = ["logins", "failures"]
+
+# Distinct users / IPs are HyperLogLog sketches: per bucket 2**10 registers
+# (1 KiB, ~3% standard error, near exact below a few thousand), overall 2**14
+# (16 KiB, ~0.8%).
+BUCKET_PRECISION = 10
+# Heavy hitters among failing IPs / UIDs, per hour and day bucket: the top
+# FAILURE_TOP_K keys over a 4 x FAILURE_SKETCH_WIDTH Count-Min sketch (32 KiB).
+# Counts over a window come out at most e / width (~0.3%) of the window's
+# failures too high, 98% of the time, and never too low. Hour sketches are kept
+# for a week only (32 KiB x 2 x 168), day sketches like the day counts.
+FAILURE_RETENTION = {"hour": timedelta(days=7), "day": None}
+FAILURE_SKETCH_WIDTH = 1024
+FAILURE_TOP_K = 100
+
+
+def _split_by(keys: pd.Series, values: pd.Series):
+    """(key, values array) pairs, one per distinct key; cheaper than iterating a groupby."""
+    codes, uniques = pd.factorize(keys)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    return zip(uniques, np.split(values.to_numpy()[order], bounds))
+
+
+def _merge(old: pd.DataFrame | None, new: pd.DataFrame) -> pd.DataFrame:
+    return new if old is None else old.add(new, fill_value=0)
+
+
+class LoginRollups:
+    """
+    Pre-aggregated login counts in minute, hour and day buckets.
+
+    Each bucket keeps logins, failures and a distinct-user sketch, plus
+    logins/failures broken down per country, device and browser; hour and day
+    buckets also keep heavy-hitter sketches of the failing IPs and users.
+    `add_batch` folds in only the new rows, so the dashboard reads small
+    arrays no matter how much history sits behind them, and no state grows
+    with the number of users or IPs. Fine resolutions are pruned after
+    RETENTION; day buckets are kept forever.
+    """
+
+    def __init__(self):
+        self.logins = 0
+        self.failures = 0
+        self.users = HyperLogLog()
+        self.ips_per_country: dict = {}                     # country -> sketch of its distinct IPs
+        self._counts = {res: None for res in RESOLUTIONS}  # bucket -> logins, failures
+        self._dims = {res: None for res in RESOLUTIONS}    # (bucket, value, dimension) -> logins, failures
+        self._users = {res: {} for res in RESOLUTIONS}     # bucket -> sketch of uids
+        self._active = {}                                   # minute bucket -> sketch of uids with a successful login
+        self._failing = {res: {} for res in FAILURE_RETENTION}  # bucket -> {"ip": TopK, "uid": TopK}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "LoginRollups":
+        rollups = cls()
+        rollups.add_batch(df)
+        return rollups
+
+    def add_batch(self, df: pd.DataFrame) -> None:
+        """Fold a batch of new login rows into every bucket."""
+        if df.empty:
+            return
+
+        ts = pd.to_datetime(df["timestamp"], utc=True)
+        failed = ~df["login_result"].astype(bool)
+        rows = pd.DataFrame({"logins": 1, "failures": failed.astype("int64")}, index=df.index)
+
+        batch_ips = pd.Index(df["ip_address"].dropna().unique())
+        ip_countries = pd.Series(lookup_countries(batch_ips), index=batch_ips, dtype=object)
+        dims = {"country": df["ip_address"].map(ip_countries)}
+        for dim in DIMENSIONS[1:]:
+            if dim in df.columns:
+                dims[dim] = df[dim]
+
+        # hashed once, then only the bucket sketches' registers are touched
+        uid_hashes = pd.Series(hash64(df["uid"]), index=df.index)
+        # failing keys as codes into their distinct values, each value hashed once
+        fail_keys = {}
+        for by, column in (("ip", "ip_address"), ("uid", "uid")):
+            codes, keys = pd.factorize(df.loc[failed, column])
+            fail_keys[by] = (codes, keys.tolist(), hash64(pd.Series(keys)))
+
+        with self._lock:
+            self.logins += len(rows)
+            self.failures += int(rows["failures"].sum())
+            self.users.add_hashes(uid_hashes.to_numpy())
+            for country, ips in _split_by(ip_countries, pd.Series(ip_countries.index)):
+                self.ips_per_country.setdefault(country, HyperLogLog(BUCKET_PRECISION)).add(ips)
+
+            for res, freq in RESOLUTIONS.items():
+                bucket = ts.dt.floor(freq).rename("bucket")
+                self._counts[res] = _merge(self._counts[res], rows.groupby(bucket).sum())
+
+                parts = [
+                    rows.groupby([bucket, values.rename("value").astype(object)]).sum()
+                    .assign(dimension=dim).set_index("dimension", append=True)
+                    for dim, values in dims.items()
+                ]
+                self._dims[res] = _merge(self._dims[res], pd.concat(parts))
+
+                users = self._users[res]
+                for b, hashes in _split_by(bucket, uid_hashes):
+                    users.setdefault(b, HyperLogLog(BUCKET_PRECISION)).add_hashes(hashes)
+
+                if res in self._failing:
+                    failing = self._failing[res]
+                    for b, fail_rows in _split_by(bucket[failed], pd.Series(np.arange(len(fail_keys["ip"][0])))):
+                        sketches = failing.setdefault(b, {
+                            by: TopK(FAILURE_TOP_K, FAILURE_SKETCH_WIDTH) for by in fail_keys
+                        })
+                        for by, (codes, keys, hashes) in fail_keys.items():
+                            present, counts = np.unique(codes[fail_rows], return_counts=True)
+                            sketches[by].add_counts([keys[i] for i in present], hashes[present], counts)
+
+            ok = ~failed
+            for b, hashes in _split_by(ts[ok].dt.floor("min"), uid_hashes[ok]):
+                self._active.setdefault(b, HyperLogLog(BUCKET_PRECISION)).add_hashes(hashes)
+
+            self._prune(ts.max())
+
+    def _prune(self, latest: pd.Timestamp) -> None:
+        for res, keep in RETENTION.items():
+            if keep is None:
+                continue
+            cutoff = latest - keep
+            counts, dims = self._counts[res], self._dims[res]
+            self._counts[res] = counts[counts.index >= cutoff]
+            self._dims[res] = dims[dims.index.get_level_values("bucket") >= cutoff]
+            self._users[res] = {b: u for b, u in self._users[res].items() if b >= cutoff}
+        for res, keep in FAILURE_RETENTION.items():
+            if keep is not None:
+                cutoff = latest - keep
+                self._failing[res] = {b: f for b, f in self._failing[res].items() if b >= cutoff}
+        cutoff = latest - RETENTION["minute"]
+        self._active = {b: u for b, u in self._active.items() if b >= cutoff}
+
+    def series(self, resolution: str = "day") -> pd.DataFrame:
+        """logins, failures and distinct users per bucket, oldest first."""
+        with self._lock:
+            counts = self._counts[resolution]
+            if counts is None:
+                return pd.DataFrame(columns=[*COUNT_COLUMNS, "users"], dtype="int64")
+            counts = counts.sort_index().astype("int64")
+            users = self._users[resolution]
+            empty = HyperLogLog(BUCKET_PRECISION)
+            return counts.assign(users=estimate_counts(users.get(b, empty) for b in counts.index))
+
+    def breakdown(self, dimension: str, resolution: str = "day") -> pd.DataFrame:
+        """logins and failures per value of `dimension` summed over all kept buckets."""
+        with self._lock:
+            dims = self._dims[resolution]
+            if dims is None:
+                return pd.DataFrame(columns=COUNT_COLUMNS, dtype="int64")
+            dims = dims[dims.index.get_level_values("dimension") == dimension]
+            return dims.groupby(level="value").sum().astype("int64")
+
+    def distinct_users(self) -> int:
+        """Distinct users over everything added (estimate, see HLL_PRECISION)."""
+        with self._lock:
+            return self.users.count()
+
+    def active_users(self, since: datetime) -> int:
+        """Distinct users with a successful login in a minute bucket overlapping `since`..now."""
+        start = _utc(since).floor("min")
+        with self._lock:
+            sketches = [u for b, u in self._active.items() if b >= start]
+            return HyperLogLog.union(sketches, BUCKET_PRECISION).count()
+
+    def foreign_ips(self, allowed_country: str, ignore: tuple = ()) -> int:
+        """Distinct IPs that resolved to any country other than `allowed_country`/`ignore`."""
+        with self._lock:
+            return sum(
+                ips.count() for country, ips in self.ips_per_country.items()
+                if country != allowed_country and country not in ignore
+            )
+
+    def top_failing(self, by: str = "ip", since: datetime | None = None, n: int = 10, min_count: int = 1) -> dict:
+        """
+        Heaviest failing IPs (`by="ip"`) or users (`by="uid"`) in the buckets
+        from `since` on: {key: estimated failures}, largest first. Hour buckets
+        are used while they are kept, day buckets otherwise.
+        """
+        with self._lock:
+            res = "day"
+            if since is not None:
+                start = _utc(since)
+                hours = self._failing["hour"]
+                if hours and start >= min(hours):  # not pruned yet
+                    res = "hour"
+                start = start.floor(RESOLUTIONS[res])
+            sketches = [f[by] for b, f in self._failing[res].items() if since is None or b >= start]
+            return TopK.union(sketches, FAILURE_TOP_K, FAILURE_SKETCH_WIDTH).top(n, min_count)
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_convert("UTC") if ts.tzinfo else ts.tz_localize("UTC")
+
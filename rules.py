@@ -0,0 +1,185 @@
+import warnings
+from datetime import timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from sliding_window import ALERT_WINDOW
+
+FILTERS = ("failed", "success", "all")
+KEYS = ("ip_address", "uid")
+FIRED_COLUMNS = ["key", "value", "first_seen", "last_seen"]
+
+
+class Rule(NamedTuple):
+    """
+    A windowed detection rule: take the rows matching `filter` within
+    `window` (event time, ending at the newest row), group them by `key`,
+    compute `aggregate` per group and fire for every key reaching
+    `threshold`. `message` is the alert body, formatted with {key} and
+    {value}.
+
+    aggregate: "count" (rows) or "nunique:<column>" (distinct values).
+    """
+    name: str
+    key: str
+    filter: str
+    aggregate: str
+    threshold: int
+    message: str
+    window: timedelta = ALERT_WINDOW
+
+
+# Every windowed rule. The dashboard KPI, the dashboard alert list and the
+# alerts store all fire from this list, so there is one threshold per rule.
+WINDOW_RULES = [
+    Rule("failed_logins", key="ip_address", filter="failed", aggregate="count", threshold=5,
+         message="{value} failed login attempts from IP {key}"),
+    Rule("credential_stuffing", key="ip_address", filter="failed", aggregate="nunique:uid", threshold=3,
+         message="{value} different users had failed logins from IP {key}"),
+    Rule("account_failed_logins", key="uid", filter="failed", aggregate="count", threshold=5,
+         message="{value} failed login attempts for user {key}"),
+]
+RULES_BY_NAME = {rule.name: rule for rule in WINDOW_RULES}
+
+
+def _aggregation(rule: Rule) -> tuple[str, str]:
+    """Rule -> (input column, groupby reduction) of its aggregate column."""
+    if rule.filter not in FILTERS:
+        raise ValueError(f"Rule {rule.name!r}: unknown filter {rule.filter!r} (expected one of {FILTERS})")
+    if rule.key not in KEYS:
+        raise ValueError(f"Rule {rule.name!r}: unknown key {rule.key!r} (expected one of {KEYS})")
+    if rule.aggregate == "count":
+        return "timestamp", "size"
+    kind, _, column = rule.aggregate.partition(":")
+    if kind == "nunique" and column:
+        return column, "nunique"
+    raise ValueError(f"Rule {rule.name!r}: unknown aggregate {rule.aggregate!r}")
+
+
+def window_rows(df: pd.DataFrame, window: pd.Timedelta) -> pd.DataFrame:
+    """Rows within `window` of the newest one (event time)."""
+    ts = df["timestamp"]
+    if ts.is_monotonic_increasing:
+        # cached log frames are time-ordered: the window is a tail slice, no scan
+        return df.iloc[ts.searchsorted(ts.iloc[-1] - window, side="right"):]
+    return df[ts > ts.max() - window]
+
+
+class RuleResults:
+    """Fired keys per rule: {name: frame of key, value, first_seen, last_seen}, highest value first."""
+
+    def __init__(self, fired: dict, rules: list[Rule]):
+        self.fired = fired
+        self.rules = rules
+
+    def counts(self, name: str) -> dict:
+        """{key: value} of one rule."""
+        frame = self.fired[name]
+        return dict(zip(frame["key"], frame["value"].tolist()))
+
+    def suspicious(self) -> int:
+        """Distinct IPs and users any rule fired for (an IP two rules fire for counts once)."""
+        keys = set()
+        for rule in self.rules:
+            keys.update((rule.key, key) for key in self.fired[rule.name]["key"])
+        return len(keys)
+
+
+class RulePlan:
+    """
+    Rules compiled into one pass over a log frame.
+
+    Rows are sliced once per (filter, window) and grouped once per key
+    column. Every rule on that key is one more aggregate column of the same
+    groupby (alongside first/last seen), so adding a rule doesn't add a scan.
+    """
+
+    def __init__(self, rules: list[Rule] = WINDOW_RULES):
+        self.rules = list(rules)
+        # (filter, window) -> key -> {output column: (input column, aggregation)}
+        self._plan: dict = {}
+        for rule in self.rules:
+            aggregations = self._plan.setdefault((rule.filter, pd.Timedelta(rule.window)), {}).setdefault(
+                rule.key, {"first_seen": ("timestamp", "min"), "last_seen": ("timestamp", "max")}
+            )
+            aggregations[rule.name] = _aggregation(rule)
+
+    def evaluate(self, df: pd.DataFrame) -> RuleResults:
+        empty = pd.DataFrame(columns=FIRED_COLUMNS)
+        fired = {rule.name: empty for rule in self.rules}
+        if df.empty:
+            return RuleResults(fired, self.rules)
+
+        for (filter_, window), by_key in self._plan.items():
+            rows = window_rows(df, window)
+            if filter_ != "all":
+                ok = rows["login_result"].astype(bool)
+                rows = rows[ok if filter_ == "success" else ~ok]
+            if rows.empty:
+                continue
+            for key, aggregations in by_key.items():
+                keys = rows[key]
+                if isinstance(keys.dtype, pd.CategoricalDtype):
+                    # the window holds a handful of the frame's IPs; hashing all its categories costs more
+                    keys = keys.astype(object)
+                groups = rows.groupby(keys, sort=False)
+                # column by column: a named .agg() spends more on stitching its results than on the window
+                table = pd.DataFrame({out: getattr(groups[col], how)() for out, (col, how) in aggregations.items()})
+                for rule in self.rules:
+                    if rule.key != key or (rule.filter, pd.Timedelta(rule.window)) != (filter_, window):
+                        continue
+                    hit = table[table[rule.name] >= rule.threshold].sort_values(rule.name, ascending=False)
+                    fired[rule.name] = pd.DataFrame({
+                        "key": np.asarray(hit.index, dtype=object),
+                        "value": hit[rule.name].to_numpy(np.int64),
+                        "first_seen": hit["first_seen"].array,
+                        "last_seen": hit["last_seen"].array,
+                    }, columns=FIRED_COLUMNS)
+        return RuleResults(fired, self.rules)
+
+
+_default_plan = RulePlan()
+
+
+def evaluate_rules(df: pd.DataFrame, plan: RulePlan = _default_plan) -> RuleResults:
+    return plan.evaluate(df)
+
+
+###############################################################################
+# Streaming: the same rules answered from a sliding-window detector's counters
+###############################################################################
+# (key, filter, aggregate) -> detector query; the detector only keeps failed logins
+_DETECTOR_QUERIES = {
+    ("ip_address", "failed", "count"): "failing_ips",
+    ("uid", "failed", "count"): "failing_uids",
+    ("ip_address", "failed", "nunique:uid"): "stuffing_ips",
+}
+
+
+def streaming_rules(rules: list[Rule] = WINDOW_RULES, window: timedelta = ALERT_WINDOW) -> list[Rule]:
+    """
+    The rules a detector with `window` can answer; the others only run on
+    frames (RulePlan), with a warning since alerts_store calls this at import.
+    """
+    supported = []
+    for rule in rules:
+        if (rule.key, rule.filter, rule.aggregate) not in _DETECTOR_QUERIES:
+            warnings.warn(f"Rule {rule.name}: {rule.aggregate} of {rule.filter} logins by {rule.key} "
+                          f"isn't tracked by the sliding-window detector, not streamed", stacklevel=2)
+        elif pd.Timedelta(rule.window) != pd.Timedelta(window):
+            warnings.warn(f"Rule {rule.name}: window {rule.window} differs from the detector's {window}, "
+                          f"not streamed", stacklevel=2)
+        else:
+            supported.append(rule)
+    return supported
+
+
+def fired_in_window(detector, rules: list[Rule] = WINDOW_RULES) -> dict:
+    """{(rule name, key): value} for the detector's current window."""
+    fired = {}
+    for rule in rules:
+        query = getattr(detector, _DETECTOR_QUERIES[(rule.key, rule.filter, rule.aggregate)])
+        fired.update({(rule.name, key): n for key, n in query(rule.threshold).items()})
+    return fired
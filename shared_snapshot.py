@@ -0,0 +1,143 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from storage import DATA_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, every worker keeps its own copy
+    fcntl = None
+
+# Share the cached login_logs frame between server workers through one memory-mapped file. Only worth
+# it with several workers (it rewrites the file on every new version), so unless set to "1"/"0" it is on
+# when WEB_CONCURRENCY (gunicorn's default worker count, set by most hosts) asks for more than one.
+_WORKERS = os.getenv("WEB_CONCURRENCY", "1")
+SHARED_SNAPSHOT = os.getenv("AUTHWATCH_SHARED_SNAPSHOT", "1" if _WORKERS.isdigit() and int(_WORKERS) > 1 else "0") != "0"
+SHARED_DIR = os.getenv("AUTHWATCH_SHARED_DIR", os.path.join(DATA_DIR, "shared"))
+KEEP_VERSIONS = 2           # snapshot files kept on disk (mapped ones stay readable after unlink anyway)
+
+_CURRENT = "CURRENT"
+_LOCK = "LOCK"
+# bools are stored as uint8 (Arrow packs its booleans into bits, which numpy can't map)
+_BOOL_KEY = b"authwatch_bool_columns"
+
+
+def _to_table(df: pd.DataFrame):
+    import pyarrow as pa
+    bools = [col for col in df.columns if pd.api.types.is_bool_dtype(df[col])]
+    frame = df.assign(**{col: df[col].to_numpy().view(np.uint8) for col in bools})
+    table = pa.Table.from_pandas(frame, preserve_index=False).combine_chunks()
+    return table.replace_schema_metadata({**table.schema.metadata, _BOOL_KEY: json.dumps(bools).encode()})
+
+
+def _from_table(table) -> pd.DataFrame:
+    # split_blocks keeps every column on its own (mapped) buffer instead of consolidating copies
+    df = table.to_pandas(split_blocks=True)
+    bools = json.loads(table.schema.metadata.get(_BOOL_KEY, b"[]"))
+    columns = {col: df[col] for col in df.columns}
+    for col in bools:
+        columns[col] = pd.Series(df[col].to_numpy().view(bool), index=df.index, copy=False)
+    return pd.DataFrame(columns, copy=False)
+
+
+class SharedSnapshot:
+    """
+    Versioned login_logs frames in Arrow IPC files under `directory`, mapped
+    read-only by every worker process, so N workers hold one copy of the
+    data (the OS page cache) instead of N.
+
+    A publisher writes `logs-<version>.arrow`, then atomically swaps the
+    small `CURRENT` pointer file to it; readers notice a new version with one
+    `stat` of the pointer. `lock()` serializes publishers across processes.
+    """
+
+    def __init__(self, directory: str = SHARED_DIR, keep: int = KEEP_VERSIONS):
+        self.directory = directory
+        self.keep = keep
+        self._pointer = os.path.join(directory, _CURRENT)
+
+    @contextmanager
+    def lock(self):
+        """Exclusive across processes (flock), for read-latest-then-publish sequences."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, _LOCK), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stamp(self):
+        """Changes whenever a new version is published (the pointer is replaced, not rewritten)."""
+        try:
+            st = os.stat(self._pointer)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def current(self) -> dict | None:
+        """The pointer: {file, version, rows, cursor, published_at}, or None before the first publish."""
+        try:
+            with open(self._pointer) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(self, newer_than: int = 0) -> tuple[dict, pd.DataFrame] | None:
+        """Map the current version if it is newer than `newer_than`; (pointer, frame) or None."""
+        import pyarrow as pa
+        pointer = self.current()
+        if pointer is None or pointer["version"] <= newer_than:
+            return None
+        source = pa.memory_map(os.path.join(self.directory, pointer["file"]), "r")
+        return pointer, _from_table(pa.ipc.open_file(source).read_all())
+
+    def publish(self, df: pd.DataFrame, cursor: dict | None = None) -> tuple[dict, pd.DataFrame]:
+        """
+        Write `df` as the next version (call under `lock()`); returns it mapped,
+        like `load`. `cursor` is the storage cursor its rows were read up to.
+        """
+        import pyarrow as pa
+        previous = self.current()
+        version = previous["version"] + 1 if previous else 1
+        name = f"logs-{version:010d}.arrow"
+        path = os.path.join(self.directory, name)
+        table = _to_table(df)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(len(table), 1))
+        os.replace(tmp, path)
+
+        pointer = {"file": name, "version": version, "rows": len(df), "cursor": cursor, "published_at": time.time()}
+        tmp = f"{self._pointer}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(pointer, f)
+        os.replace(tmp, self._pointer)
+        self._prune(name)
+        return pointer, _from_table(pa.ipc.open_file(pa.memory_map(path, "r")).read_all())
+
+    def _prune(self, current: str) -> None:
+        versions = sorted(f for f in os.listdir(self.directory) if f.startswith("logs-") and f.endswith(".arrow"))
+        for name in versions[:-self.keep]:
+            if name != current:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+def open_shared_snapshot(directory: str = SHARED_DIR) -> SharedSnapshot | None:
+    """The shared snapshot if it is enabled and usable here (pyarrow and flock available)."""
+    if not SHARED_SNAPSHOT or fcntl is None:
+        return None
+    try:
+        import pyarrow  # noqa: F401  (optional dependency)
+        return SharedSnapshot(directory)
+    except (ImportError, OSError) as e:
+        print(f"Shared log snapshot disabled: {e}")
+        return None
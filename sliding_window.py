@@ -0,0 +1,158 @@
+import heapq
+import itertools
+import threading
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# How far back (in event time) the failed-login rules look
+ALERT_WINDOW = timedelta(hours=1)
+
+
+class SlidingWindowDetector:
+    """
+    Incremental per-IP / per-UID failed-login counters over a sliding window.
+
+    Only failed logins are kept. Expiry runs on event time: the window ends
+    at the newest timestamp seen so far (the watermark), so replaying
+    history gives the same answer as live ingest. Events older than the
+    window are dropped on arrival. Late events that are still inside the
+    window are handled exactly, because pending failures sit in a heap
+    ordered by timestamp.
+
+    Queries only walk the keys that currently have failures in the window,
+    not the whole table.
+    """
+
+    def __init__(self, window: timedelta = ALERT_WINDOW):
+        self.window = pd.Timedelta(window)
+        self.watermark: pd.Timestamp | None = None
+        self._pending = []                    # heap of (ts, seq, ip, uid)
+        self._seq = itertools.count()
+        self._ip_fails = Counter()            # ip -> failures in window
+        self._uid_fails = Counter()           # uid -> failures in window
+        self._ip_uids: dict[str, Counter] = {}  # ip -> {uid: failures in window}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, window: timedelta = ALERT_WINDOW) -> "SlidingWindowDetector":
+        detector = cls(window)
+        detector.add_batch(df)
+        return detector
+
+    def _cutoff(self):
+        return self.watermark - self.window
+
+    def _expire(self) -> None:
+        cutoff = self._cutoff()
+        while self._pending and self._pending[0][0] <= cutoff:
+            _, _, ip, uid = heapq.heappop(self._pending)
+            self._decrement(ip, uid)
+
+    def _decrement(self, ip, uid) -> None:
+        self._ip_fails[ip] -= 1
+        if not self._ip_fails[ip]:
+            del self._ip_fails[ip]
+        self._uid_fails[uid] -= 1
+        if not self._uid_fails[uid]:
+            del self._uid_fails[uid]
+        uids = self._ip_uids[ip]
+        uids[uid] -= 1
+        if not uids[uid]:
+            del uids[uid]
+            if not uids:
+                del self._ip_uids[ip]
+
+    def _add_failure(self, ts, ip, uid) -> None:
+        if self.watermark is not None and ts <= self._cutoff():
+            return  # already outside the window
+        heapq.heappush(self._pending, (ts, next(self._seq), ip, uid))
+        self._ip_fails[ip] += 1
+        self._uid_fails[uid] += 1
+        self._ip_uids.setdefault(ip, Counter())[uid] += 1
+
+    def _advance(self, ts) -> None:
+        if self.watermark is None or ts > self.watermark:
+            self.watermark = ts
+            self._expire()
+
+    def add(self, timestamp, ip_address, uid, login_result: bool) -> None:
+        """Feed a single login event."""
+        ts = pd.Timestamp(timestamp)
+        with self._lock:
+            if not login_result:
+                self._add_failure(ts, ip_address, uid)
+            self._advance(ts)
+
+    def add_batch(self, df: pd.DataFrame) -> None:
+        """Feed a micro-batch (any order) of login rows."""
+        if df.empty:
+            return
+        failed = df.loc[~df["login_result"].astype(bool), ["timestamp", "ip_address", "uid"]]
+        failed = failed.sort_values("timestamp", kind="stable")
+        with self._lock:
+            # only failures need per-event work; successes just move the watermark
+            for ts, ip, uid in zip(failed["timestamp"], failed["ip_address"], failed["uid"]):
+                self._add_failure(ts, ip, uid)
+                self._advance(ts)
+            self._advance(df["timestamp"].max())
+
+    def advance_to(self, timestamp) -> None:
+        """Move the watermark (e.g. to the newest event of a batch whose failures were fed elsewhere)."""
+        with self._lock:
+            self._advance(pd.Timestamp(timestamp))
+
+    def pending(self) -> pd.DataFrame:
+        """The failed logins currently in the window (timestamp, ip_address, uid), oldest first."""
+        with self._lock:
+            events = sorted(self._pending)
+        return pd.DataFrame(
+            [(ts, ip, uid) for ts, _, ip, uid in events], columns=["timestamp", "ip_address", "uid"]
+        )
+
+    def replay(self, df: pd.DataFrame, every: timedelta):
+        """
+        Feed a batch like `add_batch`, but pause after each `every` of event
+        time and yield the watermark, so callers can check the window while
+        history is replayed instead of only at the end.
+        """
+        if df.empty:
+            return
+        ends = df["timestamp"].groupby(df["timestamp"].dt.floor(every)).max()
+        yield from self.replay_to(df, ends)
+
+    def replay_to(self, df: pd.DataFrame, ends):
+        """`replay` with explicit pause points (sorted event times), shared e.g. across partitions."""
+        ends = pd.Series(pd.to_datetime(ends, utc=True))
+        failed = df.loc[~df["login_result"].astype(bool), ["timestamp", "ip_address", "uid"]]
+        failed = failed.sort_values("timestamp", kind="stable")
+        cuts = np.searchsorted(pd.to_datetime(failed["timestamp"], utc=True).values, ends.values, side="right")
+        events = list(zip(failed["timestamp"], failed["ip_address"], failed["uid"]))
+        done = 0
+        for end, cut in zip(ends, cuts):
+            with self._lock:
+                for ts, ip, uid in events[done:cut]:
+                    self._add_failure(ts, ip, uid)
+                    self._advance(ts)
+                self._advance(end)
+            done = cut
+            yield self.watermark
+
+    def failing_ips(self, min_failures: int) -> dict:
+        """IPs with at least `min_failures` failed logins in the window."""
+        with self._lock:
+            return dict(sorted((ip, n) for ip, n in self._ip_fails.items() if n >= min_failures))
+
+    def failing_uids(self, min_failures: int) -> dict:
+        """UIDs with at least `min_failures` failed logins in the window."""
+        with self._lock:
+            return dict(sorted((uid, n) for uid, n in self._uid_fails.items() if n >= min_failures))
+
+    def stuffing_ips(self, min_uids: int) -> dict:
+        """IPs where at least `min_uids` distinct users failed in the window."""
+        with self._lock:
+            return dict(sorted(
+                (ip, len(uids)) for ip, uids in self._ip_uids.items() if len(uids) >= min_uids
+            ))
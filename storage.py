@@ -0,0 +1,326 @@
+import json
+import os
+from abc import ABC, abstractmethod
+import re
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from metrics import inc
+
+# Which backend csv_helper talks to: "supabase" (default) or "parquet"
+STORAGE_BACKEND = os.getenv("AUTHWATCH_STORAGE", "supabase")
+# Root directory of the local Parquet store
+DATA_DIR = os.getenv("AUTHWATCH_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+TABLE = "login_logs"
+# Incremental reads look this far back again (by insert order), so a batch that was still
+# in flight when a later one landed isn't skipped. Supabase: ids; Parquet: file names (ns).
+SUPABASE_REREAD_IDS = 2000
+PARQUET_REREAD_NS = 60 * 10**9
+
+_PART = re.compile(r"part-(?:(\d{20})-)?([0-9a-f]{32})\.parquet")
+# Extra column of fetch_new() frames: each row's insert-order key (what cursors are made of)
+INSERT_KEY = "insert_key"
+
+
+class StorageBackend(ABC):
+    """
+    Where login_logs live. Backends take and return plain DataFrames; paging,
+    batching and retries are handled by csv_helper on top of them.
+    """
+
+    @abstractmethod
+    def insert(self, df: pd.DataFrame) -> None:
+        """Write one batch of rows (a single request / file)."""
+
+    @abstractmethod
+    def fetch(self, columns: list[str] | None = None, since=None, start=None, end=None,
+              failed_only: bool = False, country: str | None = None,
+              page_size: int = 1000) -> pd.DataFrame:
+        """
+        Read rows ordered by timestamp. `columns` is a projection, `since` is an
+        exclusive lower bound and `start`/`end` an inclusive/exclusive time range.
+        `failed_only` keeps failed logins only and `country` matches the
+        `country` column filled in at ingest.
+        """
+
+    @abstractmethod
+    def fetch_new(self, cursor: dict | None = None, columns: list[str] | None = None,
+                  page_size: int = 1000) -> tuple[pd.DataFrame, dict]:
+        """
+        Rows inserted since `cursor` (all rows for None), whatever their
+        timestamps, and the cursor to pass next time. Cursors are JSON-safe.
+        Each row's insert-order key comes along in an INSERT_KEY column.
+        """
+
+    @abstractmethod
+    def advance_cursor(self, cursor: dict | None, keys) -> dict:
+        """`cursor` moved past the rows with insert-order `keys` (see unread)."""
+
+
+def unread(cursor: dict | None, keys) -> list[bool]:
+    """For each insert-order key, whether `cursor` is still before it."""
+    floor = cursor["floor"] if cursor else None
+    seen = set(cursor["seen"]) if cursor else set()
+    return [(floor is None or key > floor) and key not in seen for key in keys]
+
+
+def _next_cursor(cursor: dict | None, keys, floor_of) -> dict:
+    """
+    Cursor after reading the rows/files with insert-order `keys`: everything
+    up to `floor` was read, plus the `seen` keys above it. The floor trails
+    the newest key (by `floor_of`), so late commits below it are still found.
+    """
+    seen = set(cursor["seen"]) if cursor else set()
+    seen.update(keys)
+    floor = cursor["floor"] if cursor else None
+    if seen:
+        trailing = floor_of(max(seen))
+        floor = trailing if floor is None else max(floor, trailing)
+        seen = {key for key in seen if key > floor}
+    return {"floor": floor, "seen": sorted(seen)}
+
+
+def _to_records(df: pd.DataFrame) -> list[dict]:
+    """Turn a DataFrame slice into JSON-safe dicts for the Supabase client."""
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = df[col].dt.tz_convert("UTC").dt.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    # NaN / NaT are not valid JSON, send them as nulls instead
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict(orient="records")
+
+
+class SupabaseBackend(StorageBackend):
+    """The hosted login_logs table, over PostgREST."""
+
+    @property
+    def client(self):
+        # imported here so other backends never need Supabase credentials
+        from supabase_client import get_client
+        return get_client()
+
+    def insert(self, df: pd.DataFrame) -> None:
+        records = _to_records(df)
+        self.client.table(TABLE).insert(records).execute()
+        inc("authwatch_storage_requests_total", backend="supabase", op="insert")
+        inc("authwatch_storage_bytes_total", len(json.dumps(records, default=str)), backend="supabase", direction="sent")
+
+    def _select(self, query, columns, page_size, after=None) -> list[dict]:
+        """All rows of `query`, paged by `id` (unique, so no row is repeated or skipped at a page boundary)."""
+        select = ",".join(dict.fromkeys([*columns, "id"])) if columns else "*"
+        rows = []
+        while True:
+            page_query = query(self.client.table(TABLE).select(select)).order("id")
+            if after is not None:
+                page_query = page_query.gt("id", after)
+            # PostgREST may silently return fewer rows than asked for (max-rows),
+            # so continue after the last id that came back and stop on an empty page.
+            page = page_query.limit(page_size).execute().data
+            inc("authwatch_storage_requests_total", backend="supabase", op="select")
+            if not page:
+                return rows
+            # the JSON body size (re-encoded: the client doesn't expose the raw response)
+            inc("authwatch_storage_bytes_total", len(json.dumps(page, default=str)), backend="supabase", direction="received")
+            rows.extend(page)
+            after = page[-1]["id"]
+
+    @staticmethod
+    def _frame(rows: list[dict], columns) -> pd.DataFrame:
+        df = pd.DataFrame(rows, columns=columns)
+        if "timestamp" in df.columns:
+            df = df.sort_values("timestamp", kind="stable", ignore_index=True)
+        return df
+
+    def fetch(self, columns=None, since=None, start=None, end=None, failed_only=False, country=None,
+              page_size=1000) -> pd.DataFrame:
+        def query(q):
+            if since is not None:
+                q = q.gt("timestamp", pd.Timestamp(since).isoformat())
+            if start is not None:
+                q = q.gte("timestamp", pd.Timestamp(start).isoformat())
+            if end is not None:
+                q = q.lt("timestamp", pd.Timestamp(end).isoformat())
+            if failed_only:
+                q = q.eq("login_result", False)
+            if country is not None:
+                q = q.eq("country", country)
+            return q
+
+        return self._frame(self._select(query, columns, page_size), columns)
+
+    def fetch_new(self, cursor=None, columns=None, page_size=1000) -> tuple[pd.DataFrame, dict]:
+        # login_logs.id is the table's identity column: insert order, whatever the timestamps
+        rows = self._select(lambda q: q, columns, page_size, after=cursor["floor"] if cursor else None)
+        rows = [row for row, new in zip(rows, unread(cursor, [row["id"] for row in rows])) if new]
+        df = self._frame([{**row, INSERT_KEY: row["id"]} for row in rows], [*columns, INSERT_KEY] if columns else None)
+        if INSERT_KEY not in df.columns:  # no rows and no projection
+            df[INSERT_KEY] = []
+        return df, self.advance_cursor(cursor, [row["id"] for row in rows])
+
+    def advance_cursor(self, cursor, keys) -> dict:
+        return _next_cursor(cursor, keys, lambda top: top - SUPABASE_REREAD_IDS)
+
+
+def _utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_convert("UTC") if ts.tzinfo else ts.tz_localize("UTC")
+
+
+class ParquetBackend(StorageBackend):
+    """
+    Local columnar store: `<root>/login_logs/day=YYYY-MM-DD/part-<ns>-<uuid>.parquet`.
+
+    Every insert writes one file per day it touches, named by the time it
+    was written, which is what incremental reads go by. Reads go through a
+    pyarrow dataset. The time filters prune whole day directories, then row
+    groups by their min/max statistics, and only the projected columns are
+    decoded.
+
+    Files can have different columns (/ingest only requires four), so scans
+    use the union of all file schemas and columns a file lacks read as nulls.
+    """
+
+    def __init__(self, root: str = DATA_DIR):
+        import pyarrow  # noqa: F401  (optional dependency, only for this backend)
+        self.path = os.path.join(root, TABLE)
+        os.makedirs(self.path, exist_ok=True)
+        self._schemas: dict = {}    # file -> its schema (files are never rewritten)
+
+    def insert(self, df: pd.DataFrame) -> None:
+        df = df.copy()
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601")
+        for day, part in df.groupby(df["timestamp"].dt.strftime("%Y-%m-%d")):
+            directory = os.path.join(self.path, f"day={day}")
+            os.makedirs(directory, exist_ok=True)
+            # dot-prefixed until complete: the dataset scan skips hidden files
+            name = f"part-{time.time_ns():020d}-{uuid.uuid4().hex}.parquet"
+            tmp = os.path.join(directory, "." + name)
+            part.sort_values("timestamp").to_parquet(tmp, index=False)
+            inc("authwatch_storage_requests_total", backend="parquet", op="insert")
+            inc("authwatch_storage_bytes_total", os.path.getsize(tmp), backend="parquet", direction="sent")
+            os.replace(tmp, os.path.join(directory, name))
+
+    def _dataset(self, files=None):
+        """Dataset over `files` (default: all), with the union of their schemas rather than the first file's."""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        partitioning = ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive")
+        found = ds.dataset(files or self.path, format="parquet", partitioning=partitioning,
+                           partition_base_dir=self.path)
+        schemas = []
+        for path in found.files:
+            if path not in self._schemas:
+                self._schemas[path] = pq.read_schema(path)
+            schemas.append(self._schemas[path])
+        if not schemas:
+            return found
+        schema = pa.unify_schemas([*schemas, partitioning.schema], promote_options="permissive")
+        return ds.dataset(found.files, schema=schema, format="parquet", partitioning=partitioning,
+                          partition_base_dir=self.path)
+
+    def _read(self, dataset, columns, expr=None, file_keys: dict | None = None) -> pd.DataFrame:
+        """Rows of `dataset`; with `file_keys` (path -> key), each row's file key goes in INSERT_KEY."""
+        names = dataset.schema.names
+        read_columns = columns or [c for c in names if c != "day"]
+        extra = ["__filename"] if file_keys is not None else []
+        table = dataset.to_table(columns=[c for c in read_columns if c in names] + extra, filter=expr)
+        inc("authwatch_storage_requests_total", backend="parquet", op="select")
+        # decoded Arrow size of what survived pruning, a fair proxy for what was read
+        inc("authwatch_storage_bytes_total", table.nbytes, backend="parquet", direction="received")
+        df = table.to_pandas()
+        if file_keys is not None:
+            df[INSERT_KEY] = df.pop("__filename").map(file_keys)
+            read_columns = [*read_columns, INSERT_KEY]
+        # projected columns no file has at all come back as nulls too
+        df = df.reindex(columns=read_columns)
+        return df.sort_values("timestamp", kind="stable", ignore_index=True)
+
+    def fetch(self, columns=None, since=None, start=None, end=None, failed_only=False, country=None,
+              page_size=1000) -> pd.DataFrame:
+        import pyarrow.dataset as ds
+
+        dataset = self._dataset()
+        if not dataset.files:
+            return pd.DataFrame(columns=columns)
+
+        ts, day = ds.field("timestamp"), ds.field("day")
+        terms = []
+        if since is not None:
+            terms += [ts > _utc(since), day >= _utc(since).strftime("%Y-%m-%d")]
+        if start is not None:
+            terms += [ts >= _utc(start), day >= _utc(start).strftime("%Y-%m-%d")]
+        if end is not None:
+            terms += [ts < _utc(end), day <= _utc(end).strftime("%Y-%m-%d")]
+        if failed_only:
+            terms.append(ds.field("login_result") == False)  # noqa: E712
+        if country is not None:
+            if "country" not in dataset.schema.names:
+                return pd.DataFrame(columns=columns)
+            terms.append(ds.field("country") == country)
+        expr = None
+        for term in terms:
+            expr = term if expr is None else expr & term
+
+        return self._read(dataset, columns, expr)
+
+    def _parts(self) -> dict:
+        """Insert-order key ("<ns>-<uuid>") -> path of every complete file; files from before keys sort first."""
+        parts = {}
+        for day in os.scandir(self.path):
+            if not day.is_dir() or not day.name.startswith("day="):
+                continue
+            for entry in os.scandir(day.path):
+                match = _PART.fullmatch(entry.name)
+                if match:
+                    parts[f"{match[1] or '0' * 20}-{match[2]}"] = entry.path
+        return parts
+
+    def fetch_new(self, cursor=None, columns=None, page_size=1000) -> tuple[pd.DataFrame, dict]:
+        parts = self._parts()
+        new = {key: path for key, path, fresh in zip(parts, parts.values(), unread(cursor, parts)) if fresh}
+        cursor = self.advance_cursor(cursor, new)
+        if not new:
+            return pd.DataFrame(columns=[*(columns or []), INSERT_KEY]), cursor
+
+        file_keys = {path: key for key, path in new.items()}
+        return self._read(self._dataset(sorted(new.values())), columns, file_keys=file_keys), cursor
+
+    def advance_cursor(self, cursor, keys) -> dict:
+        return _next_cursor(cursor, keys, lambda top: f"{int(top[:20]) - PARQUET_REREAD_NS:020d}")
+
+
+_backend: StorageBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StorageBackend:
+    """The process-wide backend selected by AUTHWATCH_STORAGE."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_backend(STORAGE_BACKEND)
+    return _backend
+
+
+def make_backend(name: str, **kwargs) -> StorageBackend:
+    if name == "supabase":
+        return SupabaseBackend(**kwargs)
+    if name == "parquet":
+        return ParquetBackend(**kwargs)
+    raise ValueError(f"Unknown storage backend {name!r} (expected 'supabase' or 'parquet')")
+
+
+def set_backend(backend: StorageBackend) -> None:
+    """Swap the process-wide backend (e.g. a temp ParquetBackend for benchmarks)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
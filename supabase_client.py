@@ -1,5 +1,6 @@
-from supabase import create_client
 import os
+import threading
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,9 +8,26 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if SUPABASE_URL == None or SUPABASE_KEY == None:
-    raise ValueError("Supabase URL or Key not set in environment variables.")
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """The shared Supabase client, created on first use instead of at import."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if SUPABASE_URL == None or SUPABASE_KEY == None:
+                    raise ValueError("Supabase URL or Key not set in environment variables.")
+                from supabase import create_client
+                _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+                print("Connected to Supabase successfully")
+    return _client
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-print("Connected to Supabase successfully")
+def __getattr__(name):
+    # `from supabase_client import supabase` still works, it just connects lazily
+    if name == "supabase":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
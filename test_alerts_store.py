@@ -0,0 +1,76 @@
+"""
+The alert store records each stored row once, by its storage insert key:
+rows backfilled with old timestamps still raise alerts, and a second worker
+reading the same rows doesn't count them again.
+"""
+import pandas as pd
+import pytest
+
+import alerts_store
+import storage
+from alerts_store import AlertStore
+from log_cache import LogCache
+from storage import ParquetBackend
+
+NOW = pd.Timestamp("2025-05-02 12:00", tz="UTC")
+UK_IP = "38.183.48.25"
+
+
+def _logins(start, n, ip, ok, uids):
+    return pd.DataFrame({
+        "uid": [uids[i % len(uids)] for i in range(n)],
+        "timestamp": [start + pd.Timedelta(minutes=i) for i in range(n)],
+        "ip_address": ip,
+        "login_result": ok,
+        "browser": "Firefox",
+        "device": "Desktop",
+    })
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    backend = ParquetBackend(str(tmp_path))
+    monkeypatch.setattr(storage, "_backend", backend)
+    monkeypatch.setattr(alerts_store, "_store", AlertStore(""))
+    return backend
+
+
+def _alerts(rule):
+    alerts, _ = alerts_store._store.page(rule=rule, limit=100)
+    return {alert["body"]: alert["count"] for alert in alerts}
+
+
+def test_backfilled_rows_raise_alerts(backend):
+    cache = LogCache(snapshot_path="", shared=False)
+    backend.insert(_logins(NOW - pd.Timedelta(hours=2), 120, "53.120.67.248", True, [1, 2, 3]))
+    cache.get()
+    assert not _alerts("failed_logins") and not _alerts("foreign_country")
+
+    # a day old: long outside the live detector's window
+    backend.insert(_logins(NOW - pd.Timedelta(days=1), 10, UK_IP, False, [4, 5, 6]))
+    cache.invalidate()
+    cache.get()
+    assert list(_alerts("failed_logins").values()) == [10]
+    assert list(_alerts("credential_stuffing").values()) == [3]
+    assert list(_alerts("account_failed_logins").values()) == []
+    assert [count for body, count in _alerts("foreign_country").items() if UK_IP in body] == [10]
+
+    # another worker reading the same rows only updates its own detectors
+    LogCache(snapshot_path="", shared=False).get()
+    assert [count for body, count in _alerts("foreign_country").items() if UK_IP in body] == [10]
+
+
+def test_backfill_counts_rows_already_loaded(backend):
+    cache = LogCache(snapshot_path="", shared=False)
+    day_ago = NOW - pd.Timedelta(days=1)
+    backend.insert(_logins(day_ago, 3, UK_IP, False, [7]))
+    backend.insert(_logins(NOW, 60, "53.120.67.248", True, [1]))
+    cache.get()
+    assert not _alerts("failed_logins")
+
+    # two more failures next to the three already loaded make five in the hour
+    backend.insert(_logins(day_ago + pd.Timedelta(minutes=5), 2, UK_IP, False, [7]))
+    cache.invalidate()
+    cache.get()
+    assert list(_alerts("failed_logins").values()) == [5]
+    assert list(_alerts("account_failed_logins").values()) == [5]
@@ -0,0 +1,376 @@
+"""
+Regression check for the vectorized detectors: the suspicious-login KPI and
+the dashboard alert list against frozen copies of the baseline (per-row,
+iterrows) implementations, on seeded random login frames.
+
+The frames are ordinary traffic plus a few failure bursts over more than a
+day, with IPs the baseline knew and some it didn't. Where later requests
+changed behavior on purpose, the test applies that change to the baseline's
+answer explicitly rather than generating data that hides it:
+- windowed rules only look at the last hour;
+- IPs and users are suspicious from 5 failures, not 3 (an IP with failures
+  from 3 users still is, as credential stuffing);
+- unknown IPs are no longer counted as "Taiwan" by the KPI;
+- country alerts only cover the last 24 hours and are folded per IP;
+- failed logins per user and impossible travel are new rules.
+"""
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from alerts_store import RULES
+from csv_helper import compact_logs
+from helper import get_recent_alerts
+from impossible_travel import TravelTracker
+from rollups import LoginRollups
+
+
+###############################################################################
+# Frozen copies of the baseline implementations
+###############################################################################
+# The baseline's hard-coded IP -> country table (helper.resolve_country and
+# app.count_suspicious each had an identical copy)
+_BASELINE_IP_COUNTRY = {
+    "66.206.89.11": "USA",
+    "38.183.48.25": "UK",
+    "53.120.67.248": "Taiwan",
+    "134.20.151.217": "Taiwan",
+    "124.132.128.69": "Taiwan",
+    "218.90.33.123": "Japan",
+    "218.70.250.234": "Taiwan",
+    "134.63.156.154": "Taiwan",
+    "222.55.201.154": "Taiwan",
+    "144.31.231.185": "Taiwan",
+    "214.127.233.122": "Australia",
+    "161.94.93.133": "Taiwan",
+    "129.141.34.136": "Taiwan",
+    "220.109.170.18": "Taiwan",
+    "63.204.126.213": "USA",
+    "74.131.146.207": "Taiwan",
+    "186.174.57.125": "Taiwan",
+    "196.189.205.50": "Taiwan",
+    "216.35.142.90": "Taiwan",
+    "197.8.132.138": "Taiwan",
+    "113.157.136.109": "USA",
+    "182.129.37.16": "Taiwan",
+    "182.187.77.223": "Taiwan",
+    "63.165.105.39": "Taiwan",
+    "154.51.61.158": "Taiwan",
+    "222.109.65.48": "Taiwan",
+    "207.183.200.174": "Taiwan",
+    "199.49.137.13": "Taiwan",
+    "205.234.56.25": "Taiwan",
+    "206.87.134.148": "Taiwan",
+    "209.114.171.210": "Taiwan",
+    "151.214.48.121": "Taiwan",
+    "213.38.155.206": "Taiwan",
+    "169.71.188.61": "Taiwan",
+    "119.74.140.99": "Taiwan",
+    "207.117.37.207": "Taiwan",
+    "2.202.141.118": "Germany",
+    "22.79.23.82": "Taiwan",
+    "204.176.42.106": "Taiwan",
+    "194.99.174.220": "Taiwan",
+    "187.7.179.156": "Taiwan",
+    "143.223.218.51": "Taiwan",
+    "205.12.121.36": "Taiwan",
+    "165.242.48.249": "Taiwan",
+    "170.58.33.145": "Taiwan",
+    "102.157.160.161": "Taiwan",
+    "214.120.11.119": "Taiwan",
+    "138.69.32.232": "Taiwan",
+    "214.177.197.177": "Taiwan",
+    "212.45.91.169": "Taiwan",
+    "180.152.194.206": "Taiwan",
+    "54.132.245.5": "Taiwan",
+    "175.117.240.148": "Taiwan",
+    "135.66.7.200": "Taiwan",
+    "89.165.121.13": "Taiwan",
+    "222.138.190.221": "Taiwan",
+    "108.106.201.32": "Taiwan",
+    "222.34.249.236": "Taiwan",
+    "193.48.128.119": "Taiwan",
+    "101.212.115.144": "Taiwan",
+    "159.120.131.226": "Taiwan",
+    "211.105.73.112": "Taiwan",
+    "152.214.72.16": "Taiwan",
+    "200.64.249.114": "Taiwan",
+    "155.239.201.150": "Taiwan",
+    "134.1.221.45": "Taiwan",
+    "212.208.124.166": "Taiwan",
+    "217.47.246.14": "Taiwan",
+    "204.49.253.9": "Taiwan",
+    "92.7.26.105": "Taiwan",
+    "220.67.34.89": "Taiwan",
+    "190.96.106.62": "Taiwan",
+    "24.223.136.35": "Taiwan",
+    "7.138.242.237": "Taiwan",
+    "198.141.131.108": "Taiwan",
+    "220.23.112.183": "Taiwan",
+    "98.58.11.86": "Taiwan",
+    "131.170.51.108": "Taiwan",
+    "58.21.91.2": "Taiwan",
+    "203.67.31.48": "Taiwan",
+    "143.168.248.20": "Taiwan",
+    "223.147.68.70": "Taiwan",
+    "195.58.232.124": "Taiwan",
+    "215.156.15.130": "Taiwan",
+    "190.110.93.192": "Taiwan",
+    "132.246.226.129": "Taiwan",
+    "131.70.84.166": "Taiwan",
+    "216.230.231.83": "Taiwan",
+    "217.85.190.144": "Taiwan",
+    "115.232.39.161": "Taiwan",
+    "74.60.80.187": "Taiwan",
+    "198.179.120.6": "Taiwan",
+    "141.60.189.30": "Taiwan",
+    "213.175.2.8": "Taiwan",
+    "148.55.94.6": "Taiwan",
+    "15.72.245.47": "Taiwan",
+    "214.176.22.37": "Taiwan",
+}
+
+
+def _baseline_resolve_country(ip: str) -> str:
+    return _BASELINE_IP_COUNTRY.get(ip, "Unknown")
+
+
+# helper.get_recent_alerts; the baseline read the rows itself with get_login_logs()
+def _baseline_get_recent_alerts(df, limit: int = 10, vpn_mode=False, allowed_country="Taiwan") -> list[dict]:
+    if df.empty:
+        return []
+
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    alerts = []
+
+    # multiple failed login attempts from the same IP
+    failed_df = df[df["login_result"] == False]  # noqa: E712
+    fail_counts = failed_df.groupby("ip_address").size()
+    for ip, count in fail_counts.items():
+        if count >= 5:
+            alerts.append({
+                "title": "Multiple Failed Login Attempts",
+                "body": f"{count} failed login attempts from IP {ip}",
+                "icon": "bi bi-shield-lock-fill",
+                "ts": "just now",
+            })
+
+    # suspicious country login (if VPN mode is OFF)
+    if not vpn_mode:
+        for _, row in df.iterrows():
+            ip = row["ip_address"]
+            country = _baseline_resolve_country(ip)
+            if country != allowed_country and country != "Unknown":
+                alerts.append({
+                    "title": "Suspicious Country Login",
+                    "body": f"Login from {country} (IP {ip}) outside expected region",
+                    "icon": "bi bi-exclamation-triangle-fill",
+                    "ts": row["timestamp"].strftime("%Y-%m-%d %H:%M"),
+                })
+
+    # same IP failing across multiple users
+    multi_user_fails = failed_df.groupby("ip_address")["uid"].nunique()
+    for ip, uid_count in multi_user_fails.items():
+        if uid_count >= 3:
+            alerts.append({
+                "title": "Credential Stuffing Suspected",
+                "body": f"{uid_count} different users had failed logins from IP {ip}",
+                "icon": "bi bi-person-x-fill",
+                "ts": "just now",
+            })
+
+    return alerts[:limit]
+
+
+# app.count_suspicious, which returned len() of this set
+def _baseline_suspicious_set(df: pd.DataFrame, vpn_mode=False, allowed_country="Taiwan") -> set:
+    suspicious_set = set()
+
+    #Repeated failed attempts by IP
+    ip_failures = df[~df["login_result"]]["ip_address"].value_counts()
+    for ip, count in ip_failures.items():
+        if count >= 3:
+            suspicious_set.add(f"IP::{ip}")
+
+    #Repeated failed attempts by UID
+    uid_failures = df[~df["login_result"]]["uid"].value_counts()
+    for uid, count in uid_failures.items():
+        if count >= 3:
+            suspicious_set.add(f"UID::{uid}")
+
+    # Foreign logins (only if VPN is off)
+    if not vpn_mode:
+        for _, row in df.iterrows():
+            ip = row["ip_address"]
+            country = _BASELINE_IP_COUNTRY.get(ip, "Taiwan")
+            if country != allowed_country:
+                suspicious_set.add(f"Foreign::{ip}")
+
+    return suspicious_set
+
+
+###############################################################################
+# Generated data
+###############################################################################
+_KNOWN_IPS = list(_BASELINE_IP_COUNTRY)
+_UNKNOWN_IPS = [f"198.51.100.{i}" for i in range(1, 11)]   # TEST-NET, in no range
+END = pd.Timestamp("2025-05-02 12:00", tz="UTC")
+# the intended windows, spelled out rather than imported so changing them shows up here
+ALERT_WINDOW = timedelta(hours=1)
+COUNTRY_ALERT_WINDOW = timedelta(hours=24)
+SPAN = timedelta(hours=30)
+
+
+def _logins(seed: int, rows: int = 3000) -> pd.DataFrame:
+    """Background traffic over SPAN with busy IPs/users, plus failure bursts at random times."""
+    rng = np.random.default_rng(seed)
+    ips = np.array(_KNOWN_IPS + _UNKNOWN_IPS)
+    ip_weights = rng.pareto(1.5, len(ips)) + 0.05
+    uid_weights = rng.pareto(1.5, 300) + 0.05
+    frames = [pd.DataFrame({
+        "uid": rng.choice(np.arange(1, 301), rows, p=uid_weights / uid_weights.sum()),
+        "timestamp": END - pd.to_timedelta(rng.integers(0, SPAN.total_seconds(), rows), unit="s"),
+        "ip_address": rng.choice(ips, rows, p=ip_weights / ip_weights.sum()),
+        "login_result": rng.random(rows) > 0.2,
+    })]
+    # bursts of 2-8 failures from one IP against 1-4 users, some of them in the last hour
+    for _ in range(12):
+        n = int(rng.integers(2, 9))
+        start = END - pd.Timedelta(seconds=int(rng.integers(60, SPAN.total_seconds() // 4)))
+        users = rng.integers(1, 301, int(rng.integers(1, 5)))
+        frames.append(pd.DataFrame({
+            "uid": rng.choice(users, n),
+            "timestamp": start + pd.to_timedelta(rng.integers(0, 600, n), unit="s"),
+            "ip_address": rng.choice(ips),
+            "login_result": False,
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    return df[df["timestamp"] <= END].sort_values("timestamp", ignore_index=True)
+
+
+def _last(df: pd.DataFrame, window: timedelta) -> pd.DataFrame:
+    return df[df["timestamp"] > df["timestamp"].max() - pd.Timedelta(window)].reset_index(drop=True)
+
+
+SEEDS = range(8)
+SETTINGS = [(False, "Taiwan"), (False, "USA"), (True, "Taiwan")]
+
+
+###############################################################################
+# count_suspicious
+###############################################################################
+def _expected_suspicious(df: pd.DataFrame, vpn_mode: bool, allowed_country: str) -> set:
+    """The baseline's suspicious set with the intended changes applied."""
+    # failures: the baseline's keys over the last hour ...
+    window = _last(df, ALERT_WINDOW)
+    keys = _baseline_suspicious_set(window.copy(), vpn_mode=True)
+    failed = window[~window["login_result"]]
+    ip_failures = failed["ip_address"].value_counts()
+    ip_users = failed.groupby("ip_address")["uid"].nunique()
+    uid_failures = failed["uid"].value_counts()
+    # ... from 5 failures on, or failures from 3 users for an IP
+    expected = {
+        key for key in keys
+        if (key.startswith("IP::") and (ip_failures[key[4:]] >= 5 or ip_users[key[4:]] >= 3))
+        or (key.startswith("UID::") and uid_failures[int(key[5:])] >= 5)
+    }
+
+    if not vpn_mode:
+        foreign = _baseline_suspicious_set(df.copy(), allowed_country=allowed_country) - \
+            _baseline_suspicious_set(df.copy(), vpn_mode=True)
+        # the baseline counted IPs it didn't know as Taiwan; now they are never foreign
+        unknown = {f"Foreign::{ip}" for ip in set(df["ip_address"]) & set(_UNKNOWN_IPS)}
+        assert (unknown <= foreign) == (allowed_country != "Taiwan")
+        expected |= foreign - unknown
+    return expected
+
+
+@pytest.mark.parametrize("vpn_mode,allowed_country", SETTINGS)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_count_suspicious_matches_baseline(seed, vpn_mode, allowed_country):
+    df = _logins(seed)
+    logs = compact_logs(df)
+    travel = TravelTracker.from_frame(logs)
+    # impossible travel is new: its users are added on top
+    travellers = 0 if vpn_mode else travel.recent()["uid"].nunique()
+    expected = len(_expected_suspicious(df, vpn_mode, allowed_country)) + travellers
+
+    assert app.count_suspicious(logs, vpn_mode=vpn_mode, allowed_country=allowed_country, travel=travel) == expected
+    # with rollups, foreign IPs are a HyperLogLog estimate
+    estimated = app.count_suspicious(logs, vpn_mode=vpn_mode, allowed_country=allowed_country,
+                                     rollups=LoginRollups.from_frame(logs), travel=travel)
+    assert estimated == pytest.approx(expected, rel=0.03, abs=1)
+
+
+###############################################################################
+# get_recent_alerts
+###############################################################################
+@pytest.mark.parametrize("vpn_mode,allowed_country", SETTINGS)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_recent_alerts_match_baseline(seed, vpn_mode, allowed_country):
+    df = _logins(seed)
+    logs = compact_logs(df)
+    new = get_recent_alerts(limit=10**6, vpn_mode=vpn_mode, allowed_country=allowed_country,
+                            df=logs, travel=TravelTracker.from_frame(logs))
+    by_rule = lambda *rules: [a for a in new if a["rule"] in rules]
+
+    # failed logins / credential stuffing: the baseline's alerts over the last hour
+    window = _last(df, ALERT_WINDOW)
+    old = _baseline_get_recent_alerts(window.copy(), limit=10**6, vpn_mode=True)
+    assert {(a["title"], a["body"]) for a in old} == {
+        (a["title"], a["body"]) for a in by_rule("failed_logins", "credential_stuffing")
+    }
+
+    # failed logins per user is new: users with 5+ failures in the last hour
+    uid_failures = window.loc[~window["login_result"], "uid"].value_counts()
+    assert {a["key"] for a in by_rule("account_failed_logins")} == set(uid_failures[uid_failures >= 5].index)
+
+    # country alerts: one per IP and episode over the last 24 hours, instead of one per login row
+    old = _baseline_get_recent_alerts(_last(df, COUNTRY_ALERT_WINDOW).copy(), limit=10**6,
+                                      vpn_mode=vpn_mode, allowed_country=allowed_country)
+    old_foreign = Counter(a["body"] for a in old if a["title"] == "Suspicious Country Login")
+    new_foreign = Counter()
+    for a in by_rule("foreign_country"):
+        country = _baseline_resolve_country(a["key"])
+        new_foreign[f"Login from {country} (IP {a['key']}) outside expected region"] += a["count"]
+    assert new_foreign == old_foreign
+
+    assert {a["rule"] for a in new} <= {
+        "failed_logins", "credential_stuffing", "account_failed_logins", "foreign_country", "impossible_travel",
+    }
+    assert all(a["title"] == RULES[a["rule"]][0] for a in new)
+
+
+def test_generated_frames_show_every_difference():
+    # the adjustments above are only worth something if the data actually needs them
+    frames = [_logins(seed) for seed in SEEDS]
+    windows = [_last(df, ALERT_WINDOW) for df in frames]
+
+    # failures outside the last hour that the baseline flagged
+    assert any(
+        _baseline_suspicious_set(df.copy(), vpn_mode=True) - _baseline_suspicious_set(window.copy(), vpn_mode=True)
+        for df, window in zip(frames, windows)
+    )
+    # keys at 3-4 failures in the window, which the baseline flagged and the rules now don't
+    assert any(
+        len(_baseline_suspicious_set(window.copy(), vpn_mode=True)) > len(_expected_suspicious(window, True, "Taiwan"))
+        for window in windows
+    )
+    # rules that still fire in the last hour
+    assert sum(len(_expected_suspicious(df, True, "Taiwan")) for df in frames) > 0
+    assert any(
+        a["title"] == "Credential Stuffing Suspected"
+        for window in windows for a in _baseline_get_recent_alerts(window.copy(), limit=10**6, vpn_mode=True)
+    )
+    # unknown IPs the baseline counted as foreign outside Taiwan
+    assert all(set(df["ip_address"]) & set(_UNKNOWN_IPS) for df in frames)
+    # foreign logins older than the country alert window
+    foreign = [ip for ip, country in _BASELINE_IP_COUNTRY.items() if country != "Taiwan"]
+    assert all(
+        ((df["timestamp"] <= END - pd.Timedelta(COUNTRY_ALERT_WINDOW)) & df["ip_address"].isin(foreign)).any()
+        for df in frames
+    )
@@ -0,0 +1,85 @@
+"""
+NDJSON batches and uploads with the key names shippers actually send
+("Timestamp", "IP Address", ...), which are cleaned like CSV headers.
+"""
+import base64
+import gzip
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+from ingest import BatchError, parse_batch
+from upload_stream import iter_upload
+
+_ROWS = (
+    b'{"UID": 1, "Timestamp": "2025-05-01T12:00:00+08:00", "IP Address": "1.2.3.4", "Login Result": true}\n'
+    b'{"UID": 2, "Timestamp": "2025-05-01T12:00:01.5Z", "IP Address": "1.2.3.5", "Login Result": false}\n'
+    b'{"UID": 3, "Timestamp": "2025-05-01 12:00:02", "IP Address": "1.2.3.6", "Login Result": true}\n'
+)
+
+
+def _data_url(body: bytes) -> str:
+    return "data:application/octet-stream;base64," + base64.b64encode(body).decode()
+
+
+def _check(df):
+    assert list(df.columns) == ["timestamp", "uid", "ip_address", "login_result"]
+    assert df["uid"].tolist() == [1, 2, 3]
+    assert df["login_result"].tolist() == [True, False, True]
+    assert [str(ts) for ts in df["timestamp"]] == [
+        "2025-05-01 04:00:00+00:00", "2025-05-01 12:00:01.500000+00:00", "2025-05-01 12:00:02+00:00",
+    ]
+
+
+def test_ingest_batch_with_shipper_keys():
+    _check(parse_batch(_ROWS, "application/x-ndjson"))
+    _check(parse_batch(gzip.compress(_ROWS), None, "gzip"))
+
+
+@pytest.mark.parametrize("name", ["logs.ndjson", "logs.jsonl.gz"])
+def test_ndjson_upload_with_shipper_keys(name):
+    body = gzip.compress(_ROWS) if name.endswith(".gz") else _ROWS
+    # one row per chunk, so every chunk reads its own timestamp key
+    chunks = [chunk for _, _, chunk in iter_upload(_data_url(body), name, rows=1)]
+    assert len(chunks) == 3
+    _check(pd.concat(chunks, ignore_index=True))
+
+
+def test_zip_upload_skips_members_that_arent_logs():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("readme.txt", "not logs")
+        zf.writestr("logs.ndjson", _ROWS)
+    chunks = list(iter_upload(_data_url(archive.getvalue()), "logs.zip"))
+    assert [name for name, _, _ in chunks] == ["logs.zip/logs.ndjson"]
+    _check(chunks[0][2])
+
+
+@pytest.mark.parametrize("body", [
+    # two keys that clean up to the same column
+    b'{"uid": 1, "timestamp": "2025-05-01", "Timestamp": "2025-05-01", "ip_address": "x", "login_result": true}\n',
+    # uid that doesn't fit an integer
+    b'uid,timestamp,ip_address,login_result\ninf,2025-05-01,1.2.3.4,true\n',
+])
+def test_bad_batches_are_client_errors(body):
+    with pytest.raises(BatchError) as error:
+        parse_batch(body)
+    assert error.value.status == 400
+
+
+def test_fractional_uid_names_the_row():
+    with pytest.raises(BatchError, match="Row 1: invalid uid '12.7'"):
+        parse_batch(b'uid,timestamp,ip_address,login_result\n1,2025-05-01,1.2.3.4,true\n12.7,2025-05-01,1.2.3.4,true\n')
+
+
+def test_chunked_body_over_the_limit(monkeypatch):
+    import app
+    monkeypatch.setattr(app, "INGEST_MAX_BYTES", len(_ROWS) - 1)
+    # no Content-Length to check up front: the limit holds while reading
+    response = app.server.test_client().post(
+        "/ingest", input_stream=io.BytesIO(_ROWS), content_type="application/x-ndjson",
+        headers={"Transfer-Encoding": "chunked"}, environ_overrides={"wsgi.input_terminated": True},
+    )
+    assert response.status_code == 413
@@ -0,0 +1,27 @@
+"""
+/metrics output: each histogram series is its buckets in bound order with
++Inf last, then _sum and _count, as Prometheus expects.
+"""
+from metrics import Registry
+
+
+def test_histogram_lines_keep_their_order():
+    registry = Registry(buckets=(0.5, 2.5, 10.0))
+    registry.observe("x_seconds", 3.0, fn="b")
+    registry.observe("x_seconds", 0.1, fn="a")
+    registry.observe("x_seconds", 60.0, fn="a")
+    lines = [line for line in registry.render().splitlines() if not line.startswith("#")]
+    assert lines == [
+        'x_seconds_bucket{fn="a",le="0.5"} 1',
+        'x_seconds_bucket{fn="a",le="2.5"} 1',
+        'x_seconds_bucket{fn="a",le="10.0"} 1',
+        'x_seconds_bucket{fn="a",le="+Inf"} 2',
+        'x_seconds_sum{fn="a"} 60.1',
+        'x_seconds_count{fn="a"} 2',
+        'x_seconds_bucket{fn="b",le="0.5"} 0',
+        'x_seconds_bucket{fn="b",le="2.5"} 0',
+        'x_seconds_bucket{fn="b",le="10.0"} 1',
+        'x_seconds_bucket{fn="b",le="+Inf"} 1',
+        'x_seconds_sum{fn="b"} 3',
+        'x_seconds_count{fn="b"} 1',
+    ]
@@ -1,8 +1,7 @@
 import dash_bootstrap_components as dbc
 from dash import html, dcc, callback, Input, Output, State
-import pandas as pd
-import io, base64
-from csv_helper import upload_to_supabase
+from metrics import timed
+from upload_stream import get_job, start_upload
 
 def layout():
     return dbc.Container(
@@ -10,48 +9,69 @@ def layout():
             html.H4("Upload Log Files"),
             dcc.Upload(
                 id="upload-data",
-                children=html.Div(["📥  Drag & drop or click to select JSON / CSV"]),
+                children=html.Div(["📥  Drag & drop or click to select CSV / JSON / NDJSON (.gz and .zip too)"]),
                 multiple=True,
                 className="border border-secondary rounded p-5 text-center",
             ),
             html.Div(id="upload-status"),
+            # uploads run in the background, this polls their progress
+            dcc.Store(id="upload-job"),
+            dcc.Interval(id="upload-poll", interval=500, disabled=True),
         ],
         fluid=True,
         className="pt-3",
     )
 
-# Example callback that just counts rows and echoes a message -------------
-# TODO: yucheng replace with ur real code   -> Left Supabase uploaded 
+def progress_view(files: list, done: bool):
+    messages = []
+    for f in files:
+        if f["error"]:
+            messages.append(html.Div(f"Failed to upload {f['name']}: {f['error']}", className="text-danger"))
+            if not f["uploaded"]:
+                continue
+        rate = f["uploaded"] / f["seconds"] if f["seconds"] > 0 else 0.0
+        state = "Uploaded" if f["done"] else "Uploading"
+        messages.append(html.Div(
+            f"{state} {f['name']}: {f['uploaded']:,} of {f['rows']:,} rows "
+            f"({f['chunks']} chunk{'s' if f['chunks'] != 1 else ''}) "
+            f"in {f['seconds']:.1f}s ({rate:,.0f} rows/sec)."
+        ))
+        for batch in f["failed_batches"]:
+            messages.append(html.Div(
+                f"Batch {batch['batch']} (rows {batch['start']}-{batch['end'] - 1}) failed: {batch['error']}",
+                className="text-danger small",
+            ))
+    if not done:
+        messages.append(dbc.Spinner(size="sm", spinner_class_name="ms-1"))
+    return html.Div(messages)
+
+
 @callback(
     Output("upload-status", "children"),
+    Output("upload-job", "data"),
+    Output("upload-poll", "disabled"),
     Input("upload-data", "contents"),
     State("upload-data", "filename"),
 )
+@timed()
 def handle_upload(list_of_contents, list_of_names):
     if not list_of_contents:
-        return ""
-    messages = []
-    for content, name in zip(list_of_contents, list_of_names):
-        if content is not None:
-            content_type, content_string = content.split(",")
-            decoded = base64.b64decode(content_string)
-            if "csv" in name:
-                df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-            elif "json" in name:
-                df = pd.read_json(io.StringIO(decoded.decode("utf-8")))
-            else:
-                return "Unsupported file type"
-            
-            # Clean column names
-            df.columns = [col.strip().lower().replace(" ", "_") for col in df.columns]
-            
-            # Upload to Supabase
-            try:
-                upload_to_supabase(df)
-            except Exception as e:
-                messages.append(f"Failed to upload {name}: {str(e)}")
-                continue
-            
-            messages.append(f"Uploaded {name} with {len(df)} rows.")
-            
-    return html.Div(messages)
\ No newline at end of file
+        return "", None, True
+    # every file is streamed in chunks on a background thread; the poll below shows progress
+    job = start_upload(list_of_contents, list_of_names)
+    return progress_view([], False), job.id, False
+
+
+@callback(
+    Output("upload-status", "children", allow_duplicate=True),
+    Output("upload-poll", "disabled", allow_duplicate=True),
+    Input("upload-poll", "n_intervals"),
+    State("upload-job", "data"),
+    prevent_initial_call=True,
+)
+def show_upload_progress(_, job_id):
+    job = get_job(job_id)
+    if job is None:
+        return "", True
+    done = job.done
+    return progress_view(job.snapshot(), done), done
@@ -0,0 +1,383 @@
+import base64
+import codecs
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+
+import pandas as pd
+
+from csv_helper import upload_logs
+from ingest import BatchError, INVALIDATE_INTERVAL, _read_ndjson, normalize_batch
+from log_cache import log_cache
+from metrics import inc
+from storage import DATA_DIR
+
+# Rows parsed, validated and written at a time; peak memory follows this, not the file size
+UPLOAD_CHUNK_ROWS = int(os.getenv("AUTHWATCH_UPLOAD_CHUNK_ROWS", "50000"))
+READ_BLOCK = 1 << 20        # bytes decoded from the base64 payload per read
+MAX_JOBS = 16               # finished upload jobs kept for their status
+# Job progress is also written here, so a poll that lands on another server worker still finds it
+UPLOAD_JOBS_DIR = os.getenv("AUTHWATCH_UPLOAD_JOBS_DIR", os.path.join(DATA_DIR, "upload_jobs"))
+JOB_FILE_TTL = 24 * 3600    # seconds before a job file left by any worker is removed
+
+_JSON_GAP = re.compile(r"[\s,]*")
+_EXTENSIONS = (".csv", ".json", ".ndjson", ".jsonl")
+
+
+###############################################################################
+# Reading: data URL -> decompressed byte streams, one per file in the upload
+###############################################################################
+class _Base64Reader(io.RawIOBase):
+    """
+    Seekable bytes view of base64 text, decoded one block per read instead
+    of all at once (seekable so zip archives can be read straight from it).
+    """
+
+    def __init__(self, text: str, start: int = 0):
+        self._text = text
+        self._start = start
+        padding = text[-2:].count("=")  # (rstrip would copy the whole payload)
+        self._size = (len(text) - start) // 4 * 3 - padding
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        want = min(len(buffer), self._size - self._pos)
+        if want <= 0:
+            return 0
+        # whole 4-character groups around [pos, pos + want)
+        first, last = self._pos // 3, (self._pos + want + 2) // 3
+        data = base64.b64decode(self._text[self._start + first * 4:self._start + last * 4])
+        skip = self._pos - first * 3
+        data = data[skip:skip + want]
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def _base_name(name: str) -> str:
+    return name[:-3] if name.lower().endswith(".gz") else name
+
+
+def open_upload(content: str, name: str):
+    """
+    (name, binary stream) for every file in a dcc.Upload data URL: gzip is
+    unpacked on the fly and zip archives yield each csv/json/ndjson member.
+    """
+    raw = io.BufferedReader(_Base64Reader(content, content.index(",") + 1), READ_BLOCK)
+    magic = raw.peek(4)[:4]
+    if magic[:2] == b"\x1f\x8b" or name.lower().endswith(".gz"):
+        yield _base_name(name), io.BufferedReader(gzip.GzipFile(fileobj=raw), READ_BLOCK)
+    elif magic == b"PK\x03\x04" or name.lower().endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(raw)
+        except zipfile.BadZipFile as e:
+            raise BatchError(f"Invalid zip file: {e}")
+        with archive:
+            for member in archive.infolist():
+                if member.is_dir() or member.filename.startswith("__MACOSX/"):
+                    continue
+                with archive.open(member) as stream:
+                    member_name = f"{name}/{member.filename}"
+                    if member.filename.lower().endswith(".gz"):
+                        stream = gzip.GzipFile(fileobj=stream)
+                    yield _base_name(member_name), io.BufferedReader(stream, READ_BLOCK)
+    else:
+        yield name, raw
+
+
+###############################################################################
+# Parsing: stream -> DataFrame chunks of at most `rows` rows
+###############################################################################
+def _iter_json_array(stream, rows: int):
+    """Records of a top-level JSON array, decoded incrementally."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8-sig")()
+    buf, pos, records, opened, closed = "", 0, [], False, False
+    while not closed:
+        block = stream.read(READ_BLOCK)
+        buf = buf[pos:] + text.decode(block, final=not block)
+        pos = 0
+        while True:
+            pos = _JSON_GAP.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if not opened:
+                if buf[pos] != "[":
+                    raise BatchError("Expected a JSON array of records")
+                opened, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                closed = True
+                break
+            if buf[pos] != "{":
+                raise BatchError(f"Expected a JSON object, got {buf[pos:pos + 20]!r}")
+            try:
+                record, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if not block:
+                    raise BatchError(f"Invalid JSON: {e}")
+                break  # the object continues in the next block
+            records.append(record)
+            if len(records) >= rows:
+                yield pd.DataFrame.from_records(records)
+                records = []
+        if not block:
+            break
+    if not closed:
+        raise BatchError("Invalid JSON: unterminated array")
+    if records:
+        yield pd.DataFrame.from_records(records)
+
+
+def _iter_ndjson(stream, rows: int):
+    while True:
+        lines = list(itertools.islice(stream, rows))
+        if not lines:
+            return
+        yield _read_ndjson(b"".join(lines))
+
+
+def _sniff_json(stream) -> str:
+    """"array", "ndjson", or "object" for a single JSON document (e.g. column-oriented)."""
+    head = stream.peek(READ_BLOCK).lstrip(b"\xef\xbb\xbf \t\r\n")
+    if head[:1] == b"[":
+        return "array"
+    try:
+        first = json.loads(head.split(b"\n", 1)[0])
+    except ValueError:
+        return "object"
+    # a one-line {"column": {...}} document parses too, but its values aren't scalars
+    if isinstance(first, dict) and first and all(isinstance(v, (dict, list)) for v in first.values()):
+        return "object"
+    return "ndjson"
+
+
+def iter_chunks(stream, name: str, rows: int = UPLOAD_CHUNK_ROWS):
+    """Raw DataFrame chunks of one file, picked by extension (JSON layouts are sniffed)."""
+    extension = os.path.splitext(name.lower())[1]
+    try:
+        if extension == ".csv":
+            yield from pd.read_csv(stream, chunksize=rows)
+        elif extension in (".ndjson", ".jsonl"):
+            yield from _iter_ndjson(stream, rows)
+        elif extension == ".json":
+            kind = _sniff_json(stream)
+            if kind == "array":
+                yield from _iter_json_array(stream, rows)
+            elif kind == "ndjson":
+                yield from _iter_ndjson(stream, rows)
+            else:
+                # {"column": {...}, ...} can't be split before it is all read; still one frame
+                yield pd.read_json(io.TextIOWrapper(stream, encoding="utf-8-sig"))
+        else:
+            raise BatchError("Unsupported file type (expected .csv, .json, .ndjson, .gz or .zip)")
+    except (ValueError, EOFError, OSError, zipfile.BadZipFile) as e:
+        if isinstance(e, BatchError):
+            raise
+        raise BatchError(f"Could not parse {name}: {e}")
+
+
+def iter_upload(content: str, name: str, rows: int = UPLOAD_CHUNK_ROWS):
+    """
+    (file name, first row, normalized chunk) for every chunk of every file
+    in an upload. Zip members that aren't log files (a readme, say) are
+    skipped; UploadJob lists them with an error instead.
+    """
+    for file_name, stream in open_upload(content, name):
+        if file_name.startswith(f"{name}/") and not file_name.lower().endswith(_EXTENSIONS):
+            continue
+        first_row = 0
+        for chunk in iter_chunks(stream, file_name, rows):
+            chunk = normalize_batch(chunk, first_row)
+            yield file_name, first_row, chunk
+            first_row += len(chunk)
+
+
+def parse_upload(content: str, name: str) -> pd.DataFrame | None:
+    """Whole upload as one DataFrame (None for unsupported files); uploads themselves go chunk by chunk."""
+    try:
+        chunks = [chunk for _, _, chunk in iter_upload(content, name)]
+    except BatchError:
+        return None
+    return pd.concat(chunks, ignore_index=True) if chunks else None
+
+
+###############################################################################
+# Upload jobs: write chunks in the background, expose progress for polling
+###############################################################################
+class UploadJob:
+    """
+    Uploads the files of one dcc.Upload drop, chunk by chunk, on its own
+    thread. `files` is a list of per-file progress dicts (name, rows,
+    uploaded, chunks, seconds, failed_batches, error, done) that the page
+    polls; a file that can't be read only fails itself, not the others.
+    """
+
+    def __init__(self, contents: list, names: list, rows: int = UPLOAD_CHUNK_ROWS):
+        self.id = uuid.uuid4().hex
+        self.rows = rows
+        self.files: list[dict] = []
+        self.done = False
+        self._uploads = [(c, n) for c, n in zip(contents, names) if c is not None]
+        self._lock = threading.Lock()
+
+    def start(self) -> "UploadJob":
+        threading.Thread(target=self._run, name=f"upload-{self.id[:8]}", daemon=True).start()
+        return self
+
+    def _progress(self, name: str) -> dict:
+        entry = {"name": name, "rows": 0, "uploaded": 0, "chunks": 0, "seconds": 0.0,
+                 "failed_batches": [], "error": None, "done": False}
+        with self._lock:
+            self.files.append(entry)
+        self._save()
+        return entry
+
+    def _save(self) -> None:
+        """Write the progress to UPLOAD_JOBS_DIR for the other workers (best effort)."""
+        path = _job_path(self.id)
+        try:
+            os.makedirs(UPLOAD_JOBS_DIR, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump({"done": self.done, "files": self.snapshot()}, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Saving upload job {self.id} failed: {e}")
+
+    def _run(self) -> None:
+        try:
+            for content, name in self._uploads:
+                self._upload_file(content, name)
+        finally:
+            self._uploads = []  # let go of the base64 payloads
+            self.done = True
+            self._save()
+
+    def _upload_file(self, content: str, name: str) -> None:
+        try:
+            for file_name, stream in open_upload(content, name):
+                self._upload_stream(file_name, stream)
+        except Exception as e:
+            # the archive itself is unreadable (its members report their own errors)
+            entry = self._progress(name)
+            entry["error"] = _describe(e)
+            entry["done"] = True
+            self._save()
+
+    def _upload_stream(self, name: str, stream) -> None:
+        entry, started, first_row = self._progress(name), time.perf_counter(), 0
+        try:
+            for chunk in iter_chunks(stream, name, self.rows):
+                chunk = normalize_batch(chunk, first_row)
+                result = upload_logs(chunk)
+                # new rows are in, let the dashboard/alerts pick them up (throttled like /ingest writes)
+                if result["uploaded"]:
+                    log_cache.invalidate_soon(INVALIDATE_INTERVAL)
+                inc("authwatch_upload_rows_total", result["uploaded"])
+                with self._lock:
+                    entry["rows"] += result["rows"]
+                    entry["uploaded"] += result["uploaded"]
+                    entry["chunks"] += 1
+                    entry["seconds"] = time.perf_counter() - started
+                    entry["failed_batches"] += [
+                        {**batch, "start": batch["start"] + first_row, "end": batch["end"] + first_row}
+                        for batch in result["failed_batches"]
+                    ]
+                self._save()
+                first_row += len(chunk)
+            if not entry["chunks"]:
+                entry["error"] = "No rows found"
+        except Exception as e:
+            entry["error"] = _describe(e)
+        entry["done"] = True
+        self._save()
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [dict(entry, failed_batches=list(entry["failed_batches"])) for entry in self.files]
+
+
+def _describe(error: Exception) -> str:
+    return str(error) if isinstance(error, BatchError) else f"{type(error).__name__}: {error}"
+
+
+class StoredJob:
+    """Read-only view of a job another worker runs, from its progress file."""
+
+    def __init__(self, state: dict):
+        self.done = state["done"]
+        self.files = state["files"]
+
+    def snapshot(self) -> list[dict]:
+        return self.files
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(UPLOAD_JOBS_DIR, f"{job_id}.json")
+
+
+def _prune_job_files() -> None:
+    cutoff = time.time() - JOB_FILE_TTL
+    try:
+        with os.scandir(UPLOAD_JOBS_DIR) as entries:
+            for entry in entries:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+    except OSError:
+        pass  # no jobs yet, or another worker got there first
+
+
+_jobs: OrderedDict = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def start_upload(contents: list, names: list) -> UploadJob:
+    _prune_job_files()
+    job = UploadJob(contents, names)
+    job._save()  # before the first poll can arrive
+    job.start()
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            oldest = next(iter(_jobs))
+            if not _jobs[oldest].done:
+                break
+            _jobs.pop(oldest)
+    return job
+
+
+def get_job(job_id: str | None) -> UploadJob | StoredJob | None:
+    """The job with `job_id`, whichever server worker runs it (None once it is gone)."""
+    if not job_id:
+        return None
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job
+    try:
+        with open(_job_path(os.path.basename(job_id))) as f:
+            return StoredJob(json.load(f))
+    except (OSError, ValueError):
+        return None